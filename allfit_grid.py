@@ -10,11 +10,37 @@ import numpy as np
 import pandas as pd
 import math
 import re
+import fitstore
 
-def allfit_grid(options):
-    """ Plot a grid fr different fit ranges """
-    logging.debug("Called with {}".format(options))
-
+def stored_grid(store, filestub):
+    """ The grid data from the fit store, for the fits of allfits written
+    to filestub_tmin_tmax"""
+    data = {}
+    data["chi"] = np.full((32,32), np.inf)
+    data["chidof"] = np.full((32,32), np.inf)
+    tmin = 100
+    tmax = -1
+    for stub, info in fitstore.by_filestub(store).iteritems():
+        ts, te = info["tmin"], info["tmax"]
+        if stub != os.path.abspath("{}_{}_{}".format(filestub, ts, te)):
+            continue
+        tmin = min(tmin,ts)
+        tmax = max(tmax,te)
+        data["chi"][ts][te] = info["chisqr"]
+        data["chidof"][ts][te] = info["chisqr"]/info["dof"]
+        for name, (average, std) in fitstore.results(info).iteritems():
+            if name not in data.keys():
+                data[name] = np.full((32,32), np.inf)
+                data[name+"_std"] = np.full((32,32), np.inf)
+                data[name+"_rel"] = np.full((32,32), np.inf)
+            data[name][ts][te] = average
+            data[name+"_std"][ts][te] = std
+            data[name+"_rel"][ts][te] = std/average
+    return data, tmin, tmax
+
+
+def read_grid(inputfile):
+    """ The grid data read from the fit output of allfits"""
     data = {}
     data["chi"] = np.full((32,32), np.inf)
     data["chidof"] = np.full((32,32), np.inf)
@@ -23,7 +49,7 @@ def allfit_grid(options):
     tmin = 100
     tmax = -1
 
-    with open(options.inputfile) as readfile:
+    with open(inputfile) as readfile:
         for line in readfile:
             if "t=" in line:
 
@@ -55,6 +81,17 @@ def allfit_grid(options):
                         data[name][ts][te] = average
                         data[name+"_std"][ts][te] = std
                         data[name+"_rel"][ts][te] = std/average
+    return data, tmin, tmax
+
+
+def allfit_grid(options):
+    """ Plot a grid fr different fit ranges """
+    logging.debug("Called with {}".format(options))
+
+    if options.store:
+        data, tmin, tmax = stored_grid(options.store, options.inputfile)
+    else:
+        data, tmin, tmax = read_grid(options.inputfile)
 
     fig, axe = plt.subplots(1)
 
@@ -93,7 +130,9 @@ if __name__ == "__main__":
     parser.add_argument("-o", "--output_stub", type=str, required=False,
                         help="stub of name to write output to")
     parser.add_argument("-i", "--inputfile", type=str, required=True,
-                        help="name of file to write read")
+                        help="name of file to write read, or the filestub of the fits with --store")
+    parser.add_argument("--store", type=str, required=False,
+                        help="read the fits from this fit store instead")
     parser.add_argument("-d", "--data", type=str, required=True,
                         help="what data to plot")
     parser.add_argument('--err', nargs='?', type=argparse.FileType('w'),
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+""" Fit every resample at once. Each bootstrap fit is the same small
+problem with different data and covariance, so the Levenberg-Marquardt
+iterations are done on arrays of (samples x times) for all of them
+together. Samples which do not converge are flagged so they can be
+refit one at a time with minuit.
+"""
+
+import numpy as np
+import logging
+
+
+def batch_params(params):
+    """ Split (samples x parameters) into a list of (samples x 1) columns
+    which broadcast against the times in the fit function formulas"""
+    return [params[:, i:i+1] for i in range(params.shape[1])]
+
+
+def whitened_residuals(fn, x, data, whitening, params):
+    model = fn.formula(batch_params(params), x)
+    return np.einsum('nij,nj->ni', whitening, data - model)
+
+
+def batch_solve(alpha, beta):
+    """ Solve alpha step = beta for each sample, returns the steps and a
+    mask of the samples which were not singular"""
+    try:
+        return np.linalg.solve(alpha, beta[:, :, np.newaxis])[:, :, 0], np.ones(len(alpha), dtype=bool)
+    except np.linalg.LinAlgError:
+        steps = np.zeros_like(beta)
+        ok = np.ones(len(alpha), dtype=bool)
+        for i in range(len(alpha)):
+            try:
+                steps[i] = np.linalg.solve(alpha[i], beta[i])
+            except np.linalg.LinAlgError:
+                ok[i] = False
+        return steps, ok
+
+
+def levenberg_marquardt(fn, x, data, whitening, start, maxiter=200, tol=1e-8):
+    """ Minimize the correlated chi^2 of fn for every sample.
+
+    data is (samples x times), whitening is (samples x times x times) and
+    start is the starting parameters, either one set for all samples or
+    (samples x parameters). Returns the parameters, the chi^2 and a mask
+    of the samples which converged. Like the EDM of minuit, a sample has
+    converged when the Gauss-Newton estimate of the distance to the
+    minimum of the chi^2 is less than tol.
+    """
+    N = len(data)
+    params = np.array(np.broadcast_to(start, (N, len(fn.parameter_names))), dtype=float)
+    lower = np.array([b[0] for b in fn.bounds])
+    upper = np.array([b[1] for b in fn.bounds])
+    params = np.clip(params, lower, upper)
+    diagonal = np.arange(params.shape[1])
+
+    residuals = whitened_residuals(fn, x, data, whitening, params)
+    chisqr = np.einsum('ni,ni->n', residuals, residuals)
+    damping = np.full(N, 1e-3)
+    converged = np.zeros(N, dtype=bool)
+    active = np.isfinite(chisqr)
+
+    for iteration in range(maxiter):
+        a = np.flatnonzero(active)
+        if not len(a):
+            break
+        wjac = np.einsum('nij,njp->nip', whitening[a], fn.jacobian(batch_params(params[a]), x))
+        alpha = np.einsum('nip,niq->npq', wjac, wjac)
+        beta = np.einsum('nip,ni->np', wjac, residuals[a])
+
+        newton, ok = batch_solve(alpha, beta)
+        edm = np.einsum('np,np->n', beta, newton)
+        done = ok & (edm < tol)
+        converged[a[done]] = True
+        active[a[~ok | done]] = False
+        keep = ok & ~done
+        a, alpha, beta = a[keep], alpha[keep], beta[keep]
+        if not len(a):
+            break
+
+        alpha[:, diagonal, diagonal] *= 1.0 + damping[a, np.newaxis]
+        step, ok = batch_solve(alpha, beta)
+        with np.errstate(over='ignore', invalid='ignore'):
+            trial = np.clip(params[a] + step, lower, upper)
+            trial_residuals = whitened_residuals(fn, x, data[a], whitening[a], trial)
+            trial_chisqr = np.einsum('ni,ni->n', trial_residuals, trial_residuals)
+        better = ok & (trial_chisqr <= chisqr[a])
+
+        accept = a[better]
+        params[accept] = trial[better]
+        residuals[accept] = trial_residuals[better]
+        chisqr[accept] = trial_chisqr[better]
+        damping[accept] /= 10.0
+        damping[a[~better]] *= 10.0
+        # Samples the damping can no longer move are left to minuit
+        active[a[damping[a] > 1e10]] = False
+
+    logging.info("batch fit converged {} of {} samples in {} iterations".format(converged.sum(), N, iteration+1))
+    return params, chisqr, converged
@@ -5,29 +5,35 @@ import correlator
 import configtimeobj
 import logging
 from itertools import product
-import pickle
-import os
-
-def corr_and_vev_from_pickle(corrfile, srcvevfile=None, snkvevfile=None, cfgs=None, ts=None):
-    picklefile = corrfile+".pickle"
-    if os.path.isfile(picklefile):
-        logging.info("loading file {}".format(picklefile))
-        return pickle.load( open(picklefile, "rb"))
+import corrcache
+import numpy as np
+
+def corr_and_vev_from_cache(corrfile, srcvevfile=None, snkvevfile=None, cfgs=None, ts=None):
+    """ Read a correlator, using the binary cache in .corrcache if it is
+    current for the correlator and vev files"""
+    sources = [corrfile, srcvevfile, snkvevfile]
+    cached = corrcache.load("correlator", sources)
+    if cached is not None:
+        arrays, info = cached
+        c = correlator.Correlator.fromArrays(arrays["corr"], arrays.get("vev1"), arrays.get("vev2"),
+                                             configs=arrays["configs"].tolist(), times=arrays["times"].tolist())
+        c.symmetry = info["symmetry"]
+        return c
 
-    logging.warn("pickle file {} doesn't exist building and dumping".format(picklefile))
+    logging.warn("no cache for {}, building it".format(corrfile))
     try:
         logging.info("reading file {} with pandas".format(corrfile))
         c = corr_and_vev_from_files_pandas(corrfile, srcvevfile, snkvevfile)
-        c.determine_symmetry()
-        pickle.dump(c, open( picklefile, "wb" ) , protocol=pickle.HIGHEST_PROTOCOL )
-        return c
-    except AttributeError:
+    except (AttributeError, ValueError):
         logging.info("Failed to read with pandas, reading normal")
         c = corr_and_vev_from_files(corrfile, srcvevfile, snkvevfile)
-        c.determine_symmetry()
-        pickle.dump(c, open( picklefile, "wb" ) , protocol=pickle.HIGHEST_PROTOCOL )
-        return c
-
+    c.determine_symmetry()
+    arrays = {"corr": c.as_array(), "configs": c.configs, "times": c.times}
+    if c.vev1 is not None:
+        arrays["vev1"] = [c.vev1[cfg] for cfg in c.configs]
+        arrays["vev2"] = [c.vev2[cfg] for cfg in c.configs]
+    corrcache.store("correlator", sources, arrays, {"symmetry": c.symmetry})
+    return c
 
 
 def corr_and_vev_from_files(corrfile, srcvevfile=None, snkvevfile=None, cfgs=None, ts=None):
@@ -46,18 +52,21 @@ def corr_and_vev_from_files(corrfile, srcvevfile=None, snkvevfile=None, cfgs=Non
 
 def corr_and_vev_from_files_pandas(corrfile, srcvevfile=None, snkvevfile=None, cfgs=None, ts=None):
 
-    corrdata = pr.read_datadict_paraenformat_real(corrfile)
+    times, corrdata = pr.read_paraenformat_array(corrfile)
+    configs = range(corrdata.shape[0])
     if(srcvevfile):
         # raise NotImplementedError("Vev currently unsupported in this read mode")
         vevdata_src = pr.read_vev_parenformat(srcvevfile)
+        vevdata_src = [vevdata_src[cfg] for cfg in configs]
     else:
-        vevdata_src = {cfg: 0.0 for cfg in corrdata}
+        vevdata_src = np.zeros(len(configs))
     if(snkvevfile):
         # raise NotImplementedError("Vev currently unsupported in this read mode")
         vevdata_snk = pr.read_vev_parenformat(snkvevfile)
+        vevdata_snk = [vevdata_snk[cfg] for cfg in configs]
     else:
-        vevdata_snk = {cfg: 0.0 for cfg in corrdata}
-    return correlator.Correlator.fromDataDicts(corrdata, vevdata_src, vevdata_snk)
+        vevdata_snk = np.zeros(len(configs))
+    return correlator.Correlator.fromArrays(corrdata, vevdata_src, vevdata_snk, configs=configs, times=times)
 
 
 def from_opfiles(src_opfile, snk_opfile, N=None):
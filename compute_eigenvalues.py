@@ -1,13 +1,12 @@
 #!/usr/bin/env python
 import logging
 import numpy as np
-import pandas as pd
 from scipy import linalg as LA
 import determine_operators
 import argparse
-import pandas_reader
 from level_identifier import readops
 from diagonalize import hermitionize
+from cormatrix import CorrelatorMatrix
 
 
 def write_eigenvalues(evalues):
@@ -68,18 +67,9 @@ if __name__ == "__main__":
         logging.debug("found operators: {}".format(','.join(ops)))
         args.operators = ops
 
-    cor_matrix = {}
-    for snk in args.operators:
-        for src in args.operators:
-            filename = args.input_dir + args.filewild.format(snk, src)
-            logging.info("reading {}".format(filename))
-            cor_matrix[snk+src] = pandas_reader.read_configcols_paraenformat(filename)
+    cormatrix = CorrelatorMatrix.fromFilewild(args.input_dir, args.filewild, args.operators)
 
-    correlator_pannel = pd.Panel(cor_matrix)
-
-    length = correlator_pannel.shape[0]
-    n = int(np.sqrt(length))
-    B = np.matrix(np.reshape(correlator_pannel.major_xs(args.time).mean().values, (n, n)))
+    B = np.matrix(cormatrix.mean(args.time))
     B = hermitionize(B)
 
     evals = LA.eigvalsh(B)
@@ -1,28 +1,108 @@
 import numpy as np
-import math
 import logging
-import jackknife
+import collections
+import functools
+
+
+def memoized(method):
+    """ Cache the result of a method taking no arguments in the objects
+    cache, which is cleared whenever the data is changed"""
+    @functools.wraps(method)
+    def wrapper(self):
+        if self.cache is None:
+            self.cache = {}
+        if method.__name__ not in self.cache:
+            self.cache[method.__name__] = method(self)
+        return self.cache[method.__name__]
+    return wrapper
+
+
+class ArrayMapping(collections.Mapping):
+    """ A dict like view onto one axis of the data array. Reads and
+    writes go straight to the underlying array so no data is copied.
+    """
+
+    def __init__(self, labels, index, array, owner=None):
+        self.labels = labels
+        self.index = index
+        self.array = array
+        self.owner = owner
+
+    def __getitem__(self, key):
+        return self.array[self.index[key]]
+
+    def __setitem__(self, key, value):
+        self.array[self.index[key]] = value
+        if self.owner is not None:
+            self.owner.invalidate()
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class ConfigMapping(collections.Mapping):
+    """ A dict of dicts like view, data[cfg][time], onto a Cfgtimeobj """
+
+    def __init__(self, cto):
+        self.cto = cto
+
+    def __getitem__(self, config):
+        return self.cto[config]
+
+    def __setitem__(self, config, value):
+        self.cto[config] = value
+
+    def __iter__(self):
+        return iter(self.cto.configs)
+
+    def __len__(self):
+        return self.cto.numconfigs
+
+    def __contains__(self, config):
+        return config in self.cto.cfgindex
+
+    def __repr__(self):
+        return repr({cfg: dict(v.items()) for cfg, v in self.items()})
+
 
 class Cfgtimeobj(object):
     """ A class to handle all the objects that are indexed as
     x[config][time] and provide some methods to simplify accessing the
     data in nonstandard ways, such as a time slice of all configs.
+
+    The data is stored as a dense (config x time) numpy array with
+    index maps from config and time labels to rows and columns. Derived
+    quantities are memoized in cache until the data is changed.
     """
-    data = None
-    sums = None
-    average = None
+    array = None
+    cache = None
+
+    def __init__(self, datadict, configs=None, times=None):
+        if isinstance(datadict, np.ndarray):
+            array = datadict
+            if configs is None:
+                configs = list(range(array.shape[0]))
+            if times is None:
+                times = list(range(array.shape[1]))
+        else:
+            configs = datadict.keys()
+            times = datadict[configs[0]].keys()
+            array = self.dict_to_array(datadict, configs, times)
 
-    def __init__(self, datadict):
-        self.data = datadict
-
-        self.configs = datadict.keys()
-        self.times = datadict[self.configs[0]].keys()
-        self.numconfigs = len(self.configs)
-        self.numtimes = len(self.times)
+        self.set_array(array, configs, times)
 
         logging.debug("created cto with configs %d, times %d", self.numconfigs, self.numtimes)
 
-        dataitem = self[self.configs[0]][self.times[0]]
+        dataitem = self.array[0, 0]
 
         self.datatype = type(dataitem)
         self.scalar = np.isscalar(dataitem)
@@ -30,56 +110,112 @@ class Cfgtimeobj(object):
         if __debug__:
             self.verify()
 
+    @staticmethod
+    def dict_to_array(datadict, configs, times):
+        sizes = [len(datadict[cfg]) for cfg in configs]
+        if (sizes.count(len(times)) != len(sizes)):
+            raise ValueError("Object size is inconsistant")
+        return np.array([[datadict[cfg][t] for t in times] for cfg in configs])
+
+    def set_array(self, array, configs, times):
+        """ Replace the underlying data, configs and times label the
+        rows and columns of the array"""
+        if array.shape[:2] != (len(configs), len(times)):
+            raise ValueError("array shape {} does not match {} configs and {} times".format(
+                array.shape, len(configs), len(times)))
+        self.array = array
+        self.configs = list(configs)
+        self.numconfigs = len(self.configs)
+        self.cfgindex = {cfg: i for i, cfg in enumerate(self.configs)}
+        self.timeindex = {t: i for i, t in enumerate(times)}
+        self.times = list(times)
+
+    @property
+    def times(self):
+        return self._times
+
+    @times.setter
+    def times(self, times):
+        """ Setting the times selects which columns of the array are
+        used, the data for the other times is kept"""
+        self._times = list(times)
+        self.numtimes = len(self._times)
+        self.tcols = np.array([self.timeindex[t] for t in self._times], dtype=int)
+        self.alltimes = np.array_equal(self.tcols, np.arange(self.array.shape[1]))
+        self.invalidate()
+
+    def invalidate(self):
+        """ Forget the memoized quantities, must be called after the data
+        is changed other than through the views"""
+        self.cache = {}
+
+    @property
+    def data(self):
+        return ConfigMapping(self)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("cache", None)
+        return state
+
+    def __setstate__(self, state):
+        """ Allow objects pickled with the old dict of dicts layout to be
+        loaded"""
+        if "array" in state:
+            self.__dict__.update(state)
+            self.invalidate()
+            return
+        datadict = state.pop("data")
+        times = state.pop("times")
+        self.__dict__.update(state)
+        configs = datadict.keys()
+        alltimes = datadict[configs[0]].keys()
+        self.set_array(self.dict_to_array(datadict, configs, alltimes), configs, alltimes)
+        self.times = times
+
     @classmethod
     def fromDataDict(cls, datadict):
         return cls(datadict)
 
+    @classmethod
+    def fromArray(cls, array, configs=None, times=None):
+        return cls(array, configs=configs, times=times)
+
     @classmethod
     def fromListTuple(cls, listtuple):
-        configs = list(range(len(listtuple)))
-
-        data = {}
-        for cfg in configs:
-            rawcfgdata = listtuple[cfg]
-            d = {}
-            for rawtimedata in rawcfgdata:
-                t = rawtimedata[0]  # First element is the time
-                arraydata = np.asarray(tuple(rawtimedata)[1:])
-                d[t] = arraydata  # rest is data e.g. real,imag
-            data[cfg] = d
-        return cls(data)
+        rows = [[tuple(rawtimedata) for rawtimedata in rawcfgdata] for rawcfgdata in listtuple]
+        times = [r[0] for r in rows[0]]  # First element is the time
+        array = np.array([[r[1:] for r in row] for row in rows])  # rest is data e.g. real,imag
+        return cls(array, times=times)
 
     def verify(self):
 
         if not __debug__:
             return True
 
-        if not self.data:
+        if self.array is None or self.array.size == 0:
             raise ValueError("data obejct empty or false")
 
-        sizes = [len(v) for v in self.data.values()]  # map(len, self.data.values())
-        if (sizes.count(sizes[0]) != len(sizes)):
-            raise ValueError("Object size is inconsistant")
-
-        for cfg in self.configs:
-            for time in self.times:
-                # if type(self.data[cfg][time]) != self.datatype:
-                #     logging.error(str(type(self.data[cfg][time])))
-                #     print self.datatype
-                #     print type(self.data[cfg][time])
-                #     print self.data
-                #     raise TypeError("Not all data is the same type")
-                if self.data[cfg][time] is None:
-                    raise ValueError("indexed value is none")
+        if self.array.dtype == object:
+            raise ValueError("indexed value is none or not all data is the same type")
 
         logging.debug("Cfg Time Object verified for consistancy")
         return True
 
+    def as_array(self):
+        """ The (config x time) array restricted to the current times"""
+        if self.alltimes:
+            return self.array
+        return self.array[:, self.tcols]
+
     def __getitem__(self, key):
-        return self.data[key]
+        return ArrayMapping(self.times, self.timeindex, self.array[self.cfgindex[key]], owner=self)
 
     def __setitem__(self, key, value):
-        self.data[key] = value
+        row = self.array[self.cfgindex[key]]
+        for t, v in value.iteritems():
+            row[self.timeindex[t]] = v
+        self.invalidate()
 
     def get(self, config=None, time=None):
         """The common case is if both are not none unfortunatly that
@@ -90,11 +226,11 @@ class Cfgtimeobj(object):
             if time is None:
                 return self.data
             else:
-                return {cfg: v[time] for cfg, v in self.data.iteritems()}
+                return ArrayMapping(self.configs, self.cfgindex, self.array[:, self.timeindex[time]], owner=self)
         if time is None:
-            return self.data[config]
+            return self[config]
         else:
-            return self.data[config][time]
+            return self.array[self.cfgindex[config], self.timeindex[time]]
 
     def compatible(self, otherobj):
 
@@ -107,47 +243,55 @@ class Cfgtimeobj(object):
     def indexes(self):
         return (self.configs, self.times)
 
+    def todict(self, values, keys=None):
+        """ Label the values of a 1d array by time, or by the given keys"""
+        if keys is None:
+            keys = self.times
+        if values.ndim == 1:
+            values = values.tolist()
+        return dict(zip(keys, values))
+
     def average_over_times(self):
-        return {config: math.fsum(self.get(config=config).values()) / float(self.numtimes)
-                for config in self.configs}
+        return self.todict(self.as_array().mean(axis=1), self.configs)
 
+    @memoized
     def average_all(self):
-        if not self.average:
-            aot = self.average_over_times()
-            self.average = math.fsum(aot.values()) / float(self.numconfigs)
-        return self.average
+        return self.as_array().mean(axis=(0, 1))
 
     def average_over_configs(self):
-        sums = self.sum_over_configs()
-        return {time: sums[time] / float(self.numconfigs) for time in self.times}
+        return self.todict(self.sum_over_configs_array() / float(self.numconfigs))
 
+    @memoized
+    def sum_over_configs_array(self):
+        return self.as_array().sum(axis=0)
+
+    @memoized
     def sum_over_configs(self):
-        if not self.sums:
-            self.sums = {t: math.fsum(self.get(time=t).values())
-                         for t in self.times}
-        return self.sums
+        return self.todict(self.sum_over_configs_array())
 
-    def jackknifed_averages(self):
-        sums = self.sum_over_configs()
+    @memoized
+    def jackknifed_averages_array(self):
+        """ Array of the average with each config left out in turn"""
+        sums = self.sum_over_configs_array()
         if self.numconfigs > 1:
-            return {cfg: {t: (sums[t] - self.get(time=t, config=cfg)) / (self.numconfigs - 1)
-                          for t in self.times} for cfg in self.configs}
+            return (sums - self.as_array()) / (self.numconfigs - 1)
         else:
-            return {cfg: {t: (sums[t] - self.get(time=t, config=cfg)) for t in self.times}
-                    for cfg in self.configs}
+            return sums - self.as_array()
 
-    def jackknifed_errors(self):
-        jk = Cfgtimeobj.fromDataDict(self.jackknifed_averages())
-        aoc = self.average_over_configs()
-        return {t: jackknife.errorbars(aoc[t], jk.get(time=t)) for t in self.times}
+    def jackknifed_averages(self):
+        return Cfgtimeobj.fromArray(self.jackknifed_averages_array(), self.configs, self.times).data
 
+    def jackknifed_errors(self):
+        jk = self.jackknifed_averages_array()
+        aoc = self.sum_over_configs_array() / float(self.numconfigs)
+        fm = float(self.numconfigs)
+        return self.todict(np.sqrt(((fm - 1.0) / fm) * ((jk - aoc)**2).sum(axis=0)))
 
     def jackknifed_full_average(self):
         total = self.average_all()
         N = float(self.numconfigs)
         Njk = float(self.numconfigs - 1)
-        return {cfg: (N * total - single) / Njk
-                for cfg, single in self.average_over_times().iteritems()}
+        return self.todict((N * total - self.as_array().mean(axis=1)) / Njk, self.configs)
 
     def writefullfile(self, filename, comp=False):
         outfile = open(filename, 'w')
@@ -0,0 +1,129 @@
+""" Correlator matrices stored as a dense (config x time x N x N) complex
+array, the element [c, t, i, j] being the correlator of sink operator i
+and source operator j on config c at time t. Rotations and averages are
+done on the whole array at once rather than element by element.
+"""
+import numpy as np
+import logging
+import pandas_reader
+import corrcache
+from resampling import NBOOTSTRAPS, bootstrap_weights
+
+
+def hermitian(M):
+    """ The hermitian part (M + M^H)/2 of each matrix in the last two axes"""
+    return (M + np.conj(np.swapaxes(M, -1, -2)))/2.0
+
+
+def sandwich(V, M):
+    """ V^H M V for each matrix in M, V is either a single matrix or one
+    for each matrix in M"""
+    return np.matmul(np.matmul(np.conj(np.swapaxes(V, -1, -2)), M), V)
+
+
+def read_element(filename):
+    """ Read a correlator file, using the binary cache if it is current.
+    Returns the times, config names and a (config x time) array"""
+    cached = corrcache.load("configcols", [filename])
+    if cached is not None:
+        arrays, _ = cached
+        return arrays["times"].tolist(), arrays["columns"].tolist(), np.asarray(arrays["values"]).T
+    try:
+        cor = pandas_reader.read_configcols_paraenformat(filename)
+    except:
+        cor = pandas_reader.read_configcols_normal(filename)
+    columns = [str(c) for c in cor.columns]
+    corrcache.store("configcols", [filename], {"values": cor.values, "times": cor.index.values,
+                                               "columns": columns})
+    return cor.index.values.tolist(), columns, cor.values.T
+
+
+class CorrelatorMatrix(object):
+
+    def __init__(self, array, times, configs, ops):
+        self.array = np.asarray(array)
+        self.times = list(times)
+        self.configs = list(configs)
+        self.ops = list(ops)
+        if self.array.shape != (len(self.configs), len(self.times), len(self.ops), len(self.ops)):
+            raise ValueError("array of shape {} does not match {} configs, {} times and {} operators".format(
+                self.array.shape, len(self.configs), len(self.times), len(self.ops)))
+
+    @classmethod
+    def fromFilewild(cls, directory, filewild, ops, reader=read_element):
+        """ Read the matrix from the files directory+filewild.format(snk, src)
+        for each pair of operators"""
+        N = len(ops)
+        array = None
+        for i, snk in enumerate(ops):
+            for j, src in enumerate(ops):
+                filename = directory + filewild.format(snk, src)
+                logging.info("reading {}".format(filename))
+                times, configs, values = reader(filename)
+                if array is None:
+                    array = np.empty((len(configs), len(times), N, N), dtype=complex)
+                    first = (times, configs)
+                elif (times, configs) != first:
+                    raise ValueError("{} does not have the same configs and times as {}".format(
+                        filename, directory + filewild.format(ops[0], ops[0])))
+                array[:, :, i, j] = values
+        return cls(array, first[0], first[1], ops)
+
+    @classmethod
+    def load(cls, filename):
+        """ Read a matrix written by save"""
+        with np.load(filename) as stored:
+            return cls(stored["array"], stored["times"].tolist(), stored["configs"].tolist(),
+                       stored["ops"].tolist())
+
+    def save(self, filename):
+        """ Write the whole matrix as one binary .npz file, the configs and
+        operators are stored as strings"""
+        with open(filename, 'wb') as f:
+            np.savez(f, array=self.array, times=self.times, configs=map(str, self.configs),
+                     ops=map(str, self.ops))
+        logging.info("Wrote correlator matrix to {}".format(filename))
+
+    def __len__(self):
+        return len(self.ops)
+
+    def timeindex(self, t):
+        return self.times.index(t)
+
+    def mean(self, t=None):
+        """ The matrix averaged over configs at time t, or at every time"""
+        if t is None:
+            return self.array.mean(0)
+        return self.array[:, self.timeindex(t)].mean(0)
+
+    def element(self, snk, src):
+        """ The (config x time) array of one element, the operators are
+        matched by their names as strings"""
+        ops = map(str, self.ops)
+        return self.array[:, :, ops.index(str(snk)), ops.index(str(src))]
+
+    def hermitian(self):
+        return CorrelatorMatrix(hermitian(self.array), self.times, self.configs, self.ops)
+
+    def rotate(self, V, levels=None):
+        """ The matrix V^H C V on every config and time. V is either one
+        (N x M) matrix or one for each config or each (config, time)"""
+        V = np.asarray(V)
+        if V.ndim == 3:
+            V = V[:, np.newaxis]
+        rotated = sandwich(V, self.array)
+        if levels is None:
+            levels = range(rotated.shape[-1])
+        return CorrelatorMatrix(rotated, self.times, self.configs, levels)
+
+    def jackknife_means(self):
+        """ The (config x time x N x N) averages with each config left out"""
+        n = len(self.configs)
+        return (self.array.sum(0) - self.array)/(n - 1.0)
+
+    def bootstrap_means(self, N=NBOOTSTRAPS):
+        """ The (resample x time x N x N) averages of N resamples of the
+        configs drawn with replacement"""
+        n = len(self.configs)
+        weights = bootstrap_weights(n, N)/n
+        return weights.dot(self.array.reshape(n, -1)).reshape((N,) + self.array.shape[1:])
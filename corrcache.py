@@ -0,0 +1,119 @@
+""" On disk cache of the arrays read from data files. Each entry is a
+directory of .npy files, one per array, plus an info.json recording the
+source files it was built from. An entry is only used if every source
+still has the same size and either the same mtime or the same content
+hash, the arrays are then memory mapped rather than read.
+"""
+import numpy as np
+import logging
+import hashlib
+import shutil
+import json
+import os
+
+CACHE_VERSION = 1
+CACHE_DIR = ".corrcache"
+
+
+def entry_dir(name, sources):
+    """ The entry lives next to the first source file"""
+    directory, filename = os.path.split(os.path.abspath(sources[0]))
+    return os.path.join(directory, CACHE_DIR, "{}.{}".format(filename, name))
+
+
+def file_hash(filename):
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def fingerprint(filename):
+    stat = os.stat(filename)
+    return {"path": os.path.abspath(filename), "mtime": stat.st_mtime,
+            "size": stat.st_size, "sha1": file_hash(filename)}
+
+
+def is_current(recorded, filename):
+    """ Check if a source file still matches what the entry was built
+    from. The hash is only computed if the mtime has changed, in which case
+    the new mtime is recorded"""
+    if recorded["path"] != os.path.abspath(filename):
+        return False
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return False
+    if stat.st_size != recorded["size"]:
+        return False
+    if stat.st_mtime == recorded["mtime"]:
+        return True
+    if file_hash(filename) != recorded["sha1"]:
+        return False
+    recorded["mtime"] = stat.st_mtime
+    return True
+
+
+def load(name, sources):
+    """ Returns a dict of the cached arrays and the info dict, or None if
+    there is no current entry for these sources"""
+    sources = [s for s in sources if s is not None]
+    entry = entry_dir(name, sources)
+    infofile = os.path.join(entry, "info.json")
+    if not os.path.isfile(infofile):
+        logging.debug("no cache entry {}".format(entry))
+        return None
+    with open(infofile) as f:
+        info = json.load(f)
+    if info.get("version") != CACHE_VERSION or len(info["sources"]) != len(sources):
+        logging.info("cache entry {} is from an old version, ignoring".format(entry))
+        return None
+    mtimes = [r["mtime"] for r in info["sources"]]
+    if not all(is_current(r, s) for r, s in zip(info["sources"], sources)):
+        logging.info("cache entry {} is stale, ignoring".format(entry))
+        return None
+    if mtimes != [r["mtime"] for r in info["sources"]]:
+        try:
+            write_info(entry, info)
+        except (IOError, OSError):
+            logging.debug("could not update the mtimes of {}".format(entry))
+
+    logging.info("loading cached {}".format(entry))
+    # copy on write so the arrays can be modified without touching the cache
+    arrays = {a: np.asarray(np.load(os.path.join(entry, a+".npy"), mmap_mode='c')) for a in info["arrays"]}
+    return arrays, info["info"]
+
+
+def write_info(entry, info):
+    tmpfile = os.path.join(entry, "info.json.tmp")
+    with open(tmpfile, 'w') as f:
+        json.dump(info, f)
+    os.rename(tmpfile, os.path.join(entry, "info.json"))
+
+
+def store(name, sources, arrays, info=None):
+    """ Write the arrays to the cache for these sources, info must be json
+    serializable. Failing to write the cache is only a warning"""
+    sources = [s for s in sources if s is not None]
+    entry = entry_dir(name, sources)
+    arrays = {a: np.asarray(v) for a, v in arrays.iteritems() if v is not None}
+    if any(v.dtype == object for v in arrays.values()):
+        logging.warn("Can not cache object arrays, not caching {}".format(entry))
+        return
+    tmpentry = "{}.tmp{}".format(entry, os.getpid())
+    try:
+        if os.path.isdir(tmpentry):
+            shutil.rmtree(tmpentry)
+        os.makedirs(tmpentry)
+        for a, v in arrays.iteritems():
+            np.save(os.path.join(tmpentry, a+".npy"), v)
+        write_info(tmpentry, {"version": CACHE_VERSION, "sources": [fingerprint(s) for s in sources],
+                              "arrays": sorted(arrays.keys()), "info": info})
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        os.rename(tmpentry, entry)
+        logging.info("cached {}".format(entry))
+    except (IOError, OSError) as e:
+        logging.warn("Failed to write cache {}: {}".format(entry, e))
+        shutil.rmtree(tmpentry, ignore_errors=True)
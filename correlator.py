@@ -1,9 +1,20 @@
 import configtimeobj
-import jackknife
 import math
 import vev
 import logging
 import newton
+import numpy as np
+
+EMASS_KINDS = ("log", "cosh", "sinh", "cosh_const")
+
+
+def bin_average(array, n):
+    """ Average consecutive blocks of n rows, the last block is smaller
+    if n does not divide the number of rows"""
+    starts = np.arange(0, len(array), n)
+    sizes = np.diff(np.append(starts, len(array)))
+    return np.add.reduceat(array, starts, axis=0) / sizes.reshape((-1,) + (1,) * (array.ndim - 1))
+
 
 class Correlator(configtimeobj.Cfgtimeobj):
 
@@ -14,9 +25,6 @@ class Correlator(configtimeobj.Cfgtimeobj):
     # op1 = None
     # op2 = None
 
-    asv = None
-    jkasv = None
-
     emass_skip_times = []
 
     @classmethod
@@ -58,14 +66,14 @@ class Correlator(configtimeobj.Cfgtimeobj):
 
         return cls(data, vev1, vev2)
 
-    def __init__(self, datadict, vev1, vev2):
+    def __init__(self, datadict, vev1, vev2, configs=None, times=None):
         if vev1 is not None and vev2 is not None:
             self.vev1 = vev.Vev(vev1)
             self.vev2 = vev.Vev(vev2)
         else:
             self.vev1 = None
             self.vev2 = None
-        super(Correlator, self).__init__(datadict)
+        super(Correlator, self).__init__(datadict, configs=configs, times=times)
 
     @classmethod
     def fromDataDicts(cls, corr, vev1, vev2):
@@ -73,6 +81,18 @@ class Correlator(configtimeobj.Cfgtimeobj):
         """
         return cls(corr, vev1, vev2)
 
+    @classmethod
+    def fromArrays(cls, corr, vev1, vev2, configs=None, times=None):
+        """ Create a correlator from a (config x time) array and arrays of
+        the vevs on each config
+        """
+        if configs is None:
+            configs = list(range(corr.shape[0]))
+        if vev1 is not None and vev2 is not None:
+            vev1 = dict(zip(configs, vev1))
+            vev2 = dict(zip(configs, vev2))
+        return cls(corr, vev1, vev2, configs=configs, times=times)
+
     def verify(self):
         logging.debug("verifying correlator")
 
@@ -90,37 +110,37 @@ class Correlator(configtimeobj.Cfgtimeobj):
         logging.debug("writting correlator to %s", filename + ".cor")
         super(Correlator, self).writefullfile(filename + ".cor", comp=comp)
 
+    @configtimeobj.memoized
     def average_sub_vev(self):
-        if not self.asv:
-            if self.vev1 is None:
-                self.asv = self.average_over_configs()
-            else:
-                vev1 = self.vev1.average()
-                vev2 = self.vev2.average()
-                self.asv = {t: corr - vev1 * vev2
-                            for t, corr in self.average_over_configs().iteritems()}
-        return self.asv
-
+        if self.vev1 is None:
+            return self.average_over_configs()
+        vev1 = self.vev1.average()
+        vev2 = self.vev2.average()
+        aoc = self.sum_over_configs_array() / float(self.numconfigs)
+        return self.todict(aoc - vev1 * vev2)
+
+    def jackknife_average_sub_vev_array(self):
+        """ (config x time) array of the vev subtracted averages with
+        each config left out in turn, computed once and cached"""
+        return self.jackknife_average_sub_vev().cto.array
+
+    @configtimeobj.memoized
     def jackknife_average_sub_vev(self):
-        if not self.jkasv:
-            if self.vev1 is None:
-                self.jkasv = self.jackknifed_averages()
-            else:
-
-                jkvev1 = self.vev1.jackknife()
-                jkvev2 = self.vev2.jackknife()
-                #corrjk = self.jackknifed_averages()
-                jk = configtimeobj.Cfgtimeobj.fromDataDict(self.jackknifed_averages())
-                self.jkasv = {c: {t: jk.get(config=c, time=t) - jkvev1[c] * jkvev2[c]
-                                  for t in self.times}
-                              for c in self.configs}
-
-        return self.jkasv
+        jk = self.jackknifed_averages_array()
+        if self.vev1 is not None:
+            jkvev1 = self.vev1.jackknife()
+            jkvev2 = self.vev2.jackknife()
+            vevs = np.array([jkvev1[c] * jkvev2[c] for c in self.configs])
+            jk = jk - vevs.reshape((-1,) + (1,) * (jk.ndim - 1))
+        return configtimeobj.Cfgtimeobj.fromArray(jk, self.configs, self.times).data
 
+    @configtimeobj.memoized
     def jackknifed_errors(self):
-        jk = configtimeobj.Cfgtimeobj.fromDataDict(self.jackknife_average_sub_vev())
+        jk = self.jackknife_average_sub_vev_array()
         asv = self.average_sub_vev()
-        return {t: jackknife.errorbars(asv[t], jk.get(time=t)) for t in self.times}
+        asv = np.array([asv[t] for t in self.times])
+        fm = float(self.numconfigs)
+        return self.todict(np.sqrt(((fm - 1.0) / fm) * ((jk - asv)**2).sum(axis=0)))
 
     def prune_invalid(self, sigma=1, delete=False):
         logging.info("original times {}-{}".format( min(self.times), max(self.times) ) )
@@ -141,27 +161,93 @@ class Correlator(configtimeobj.Cfgtimeobj):
             if delete:
                 for removed_times in [t for t in self.times if t > max(new_times)]:
                     logging.info("removing data for time {}".format(removed_times))
-                    for cfg in self.configs:
-                        del self.data[cfg][removed_times]
+                kept = [self.timeindex[t] for t in new_times]
+                self.set_array(self.array[:, kept], self.configs, new_times)
             self.times = new_times
-            self.asv = None
-            self.jkasv = None
 
-    def effective_mass(self, dt):
+    def effective_mass_arrays(self, dt, kind="log", fast=True, period=None, jackknife=True):
+        """ Compute an effective mass of the average and of every jackknife
+        replica at once. kind is one of EMASS_KINDS. Returns the times, the
+        central values and a (config x time) array of the replicas, values
+        that can not be computed are NaN"""
+        if kind not in EMASS_KINDS:
+            raise ValueError("Unknown effective mass kind {}".format(kind))
         asv = self.average_sub_vev()
-        emass = {}
-        for t in self.times[:-dt]:
-            try:
-                emass[t] = (1.0 / float(dt)) * math.log(asv[t] / asv[t + dt])
-            except ValueError:
-                logging.debug("invalid argument to log at t={}, setting to NaN".format(t))
-                emass[t] = float('NaN')
-            except KeyError:
-                logging.error("index out of range")
-            except ZeroDivisionError:
-                logging.error("Div by zero either dt:{} or average value sub vev {}".format(dt,asv[t + dt]))
-                emass[t] = float('NaN')
-        return emass
+        data = np.array([[asv[t] for t in self.times]])
+        if jackknife:
+            data = np.vstack([data, self.jackknife_average_sub_vev_array()])
+        times = self.times
+        if kind == "cosh_const":
+            # Taking differences removes a constant
+            data = data[:, dt:] - data[:, :-dt]
+            times = times[:-dt]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if kind == "log":
+                times = times[:-dt]
+                current = data[:, :len(times)]
+                later = data[:, dt:]
+                emass = np.log(current / later) / float(dt)
+            else:
+                times = times[dt:-dt]
+                current = data[:, dt:-dt]
+                later = data[:, 2*dt:]
+                ratio = (later + data[:, :-2*dt]) / (2.0*current)
+                if kind == "sinh":
+                    emass = np.arcsinh(ratio) / float(dt)
+                else:
+                    emass = np.arccosh(ratio) / float(dt)
+        emass[~np.isfinite(emass)] = np.nan
+
+        if not fast and kind in ("cosh", "sinh"):
+            T = self.period_check(period)
+            t = np.array(times, dtype=float)
+            # newton logs any that do not converge and keeps the guess for them
+            emass, _ = newton.newton_for_m_array(t, t+dt, current / later, emass, T, anti=(kind == "sinh"))
+
+        for col, t in enumerate(times):
+            if t in self.emass_skip_times:
+                emass[:, col] = 0.0
+        return times, emass[0], emass[1:]
+
+    def effective_mass_and_errors(self, dt, kind="log", fast=True, period=None):
+        """ Effective mass and its jackknife errors as dicts over time. A
+        replica that can not be computed counts as zero for the errors"""
+        times, emass, jkemass = self.effective_mass_arrays(dt, kind=kind, fast=fast, period=period)
+        jkemass = np.where(np.isnan(jkemass), 0.0, jkemass)
+        fm = float(self.numconfigs)
+        errors = np.sqrt(((fm - 1.0) / fm) * ((jkemass - emass)**2).sum(axis=0))
+        return dict(zip(times, emass.tolist())), dict(zip(times, errors.tolist()))
+
+    def effective_mass_central(self, dt, kind="log", fast=True, period=None):
+        times, emass, _ = self.effective_mass_arrays(dt, kind=kind, fast=fast, period=period, jackknife=False)
+        return dict(zip(times, emass.tolist()))
+
+    def effective_masses(self, dts, kind="log", fast=True, period=None):
+        """ The effective mass and errors for each dt in dts"""
+        return {dt: self.effective_mass_and_errors(dt, kind=kind, fast=fast, period=period)
+                for dt in dts}
+
+    def periodic_kind(self):
+        if self.symmetry is None:
+            logging.warning("Called periodic effective mass without symmetry determined")
+            self.determine_symmetry()
+            if self.symmetry is None:
+                logging.error("Called periodic effective mass and symmetry can not be found")
+                raise RuntimeError("Could not determine symmetry")
+        if self.symmetry == "symmetric":
+            return "cosh"
+        if self.symmetry == "anti-symmetric":
+            return "sinh"
+
+        logging.error("Symmetry is not 'symmetric' nor 'anti-symmetric'")
+        raise RuntimeError("Could not determine symmetry")
+
+    def effective_mass(self, dt):
+        return self.effective_mass_central(dt)
+
+    def effective_mass_errors(self, dt):
+        return self.effective_mass_and_errors(dt)[1]
 
     def effective_amp(self, dt):
         asv = self.average_sub_vev()
@@ -187,91 +273,29 @@ class Correlator(configtimeobj.Cfgtimeobj):
 
 
     def periodic_effective_mass(self, dt, fast=True, period=None):
-        if self.symmetry is None:
-            logging.warning("Called periodic effective mass without symmetry determined")
-            self.determine_symmetry()
-            if self.symmetry is None:
-                logging.error("Called periodic effective mass and symmetry can not be found")
-                raise RuntimeError("Could not determine symmetry")
-        if self.symmetry == "symmetric":
-            logging.info("Calling cosh emass")
-            return self.cosh_effective_mass(dt, fast=fast, period=period)
-        if self.symmetry == "anti-symmetric":
-            logging.info("Calling sinh emass")
-            return self.sinh_effective_mass(dt, fast=fast, period=period)
-
-        logging.error("Symmetry is not 'symmetric' nor 'anti-symmetric'")
-        raise RuntimeError("Could not determine symmetry")
+        logging.info("Calling {} emass".format(self.periodic_kind()))
+        return self.effective_mass_central(dt, kind=self.periodic_kind(), fast=fast, period=period)
 
     def periodic_effective_mass_errors(self, dt, fast=True, period=None):
-
-        if self.symmetry is None:
-            logging.warning("Called periodic effective mass without symmetry determined")
-            self.determine_symmetry()
-            if self.symmetry is None:
-                logging.error("Called periodic effective mass and symmetry can not be found")
-                raise RuntimeError("Could not determine symmetry")
-        if self.symmetry == "symmetric":
-            return self.cosh_effective_mass_errors(dt, fast=fast, period=period)
-        if self.symmetry == "anti-symmetric":
-            return self.sinh_effective_mass_errors(dt, fast=fast, period=period)
-
-        logging.error("Symmetry is not 'symmetric' nor 'anti-symmetric'")
-        raise RuntimeError("Could not determine symmetry")
-
-
+        return self.effective_mass_and_errors(dt, kind=self.periodic_kind(), fast=fast, period=period)[1]
 
     def cosh_effective_mass(self, dt, fast=True, period=None):
-        if fast: logging.info("cosh emass computed fast method")
+        return self.effective_mass_central(dt, kind="cosh", fast=fast, period=period)
 
-        T = self.period_check(period)
-        asv = self.average_sub_vev()
-        emass = {}
-        for t in self.times[dt:-dt]:
-            if t in self.emass_skip_times:
-                emass[t] = 0.0
-                continue
-            try:
-                guess = (1.0 / float(dt))*math.acosh((asv[t+dt] + asv[t-dt])/(2.0*asv[t]))
-                if fast:
-                    emass[t] = guess
-                else:
-                    emass[t] = newton.newton_cosh_for_m(t,t+dt,asv, guess, T)
-            except ValueError:
-                logging.debug("invalid argument to acosh, setting to zero")
-                emass[t] = float('NaN')
-            except KeyError:
-                logging.error("index out of range")
-            except ZeroDivisionError:
-                logging.error("Div by zero either dt:{} or average value sub vev {}".format(dt,asv[t]))
-                emass[t] = float('NaN')
-        return emass
+    def cosh_effective_mass_errors(self, dt, fast=True, period=None):
+        return self.effective_mass_and_errors(dt, kind="cosh", fast=fast, period=period)[1]
 
     def sinh_effective_mass(self, dt, fast=True, period=None):
-        if fast: logging.info("sinh emass computed fast method")
-        T = self.period_check(period)
-        asv = self.average_sub_vev()
-        emass = {}
-        for t in self.times[dt:-dt]:
-            if t in self.emass_skip_times:
-                emass[t] = 0.0
-                continue
-            try:
-                guess = (1.0 / float(dt))*math.asinh((asv[t+dt] + asv[t-dt])/(2.0*asv[t]))
-                if fast:
-                    emass[t] = guess
-                else:
-                    emass[t] = newton.newton_sinh_for_m(t,t+dt,asv, guess, T)
-            except ValueError:
-                logging.debug("invalid argument to asinh, setting to zero")
-                emass[t] = float('NaN')
-            except KeyError:
-                logging.error("index out of range")
-            except ZeroDivisionError:
-                logging.error("Div by zero either dt:{} or average value sub vev {}".format(dt,asv[t]))
-                emass[t] = float('NaN')
-        return emass
+        return self.effective_mass_central(dt, kind="sinh", fast=fast, period=period)
 
+    def sinh_effective_mass_errors(self, dt, fast=True, period=None):
+        return self.effective_mass_and_errors(dt, kind="sinh", fast=fast, period=period)[1]
+
+    def cosh_const_effective_mass(self, dt):
+        return self.effective_mass_central(dt, kind="cosh_const")
+
+    def cosh_const_effective_mass_errors(self, dt):
+        return self.effective_mass_and_errors(dt, kind="cosh_const")[1]
 
     def cosh_effective_amp(self, dt, period, mass):
         asv = self.average_sub_vev()
@@ -298,176 +322,83 @@ class Correlator(configtimeobj.Cfgtimeobj):
         return eamp
 
 
-    def cosh_const_effective_mass(self, dt):
-        asv = self.average_sub_vev()
-        asvt = {t: asv[t+dt]-asv[t] for t in self.times[:-dt] }
-        emass = {}
-        for t in self.times[dt:-(dt+dt)]:
-            if t in self.emass_skip_times:
-                emass[t] = 0.0
-                continue
-            try:
-                emass[t] = (1.0 / float(dt))*math.acosh((asvt[t+dt] + asvt[t-dt])/(2.0*asvt[t]))
-            except ValueError:
-                logging.debug("invalid argument to acosh, setting to nan")
-                emass[t] = float('NaN')
-            except KeyError:
-                logging.error("index out of range")
-            except ZeroDivisionError:
-                logging.error("Div by zero either dt:{} or average value sub vev {}".format(dt,asv[t]))
-                emass[t] = 0.0
-        return emass
-
-
-    def effective_mass_errors(self, dt):
-
-        jkasv = self.jackknife_average_sub_vev()
-        jkemass = {}
-        for cfg in self.configs:
-            asvc = jkasv[cfg]
-            emass = {}
-            for t in self.times[:-dt]:
-                if t in self.emass_skip_times:
-                    emass[t] = 0.0
-                    continue
-
-                try:
-                    emass[t] = (1.0 / float(dt)) * math.log(asvc[t] / asvc[t + dt])
-                except ValueError:
-                    #logging.debug("invalid argument to log, setting to zero")
-                    emass[t] = 0.0
-                except ZeroDivisionError:
-                    logging.debug("div by zero, setting to zero")
-                    emass[t] = 0.0
-                except KeyError:
-                    logging.error("index out of range")
-            jkemass[cfg] = emass
-        jkemassobj = configtimeobj.Cfgtimeobj.fromDataDict(jkemass)
-        effmass_dt = self.effective_mass(dt)
-        return {t: jackknife.errorbars(effmass_dt[t], jkemassobj.get(time=t))
-                for t in self.times[:-dt]}
-
-    def cosh_effective_mass_errors(self, dt, fast=True, period=None):
-        if fast: logging.info("cosh emass computed fast method")
-        period = self.period
-        T = self.period_check(period)
-
-        jkasv = self.jackknife_average_sub_vev()
-        jkemass = {}
-        for cfg in self.configs:
-            asvc = jkasv[cfg]
-            emass = {}
-            for t in self.times[dt:-dt]:
-                if t in self.emass_skip_times:
-                    emass[t] = 0.0
-                    continue
-
-                try:
-                    guess = (1.0 / float(dt))*math.acosh((asvc[t+dt] + asvc[t-dt])/(2.0*asvc[t]))
-                    if fast:
-                        emass[t] = guess
-                    else:
-                        emass[t] = newton.newton_cosh_for_m(t,t+dt,asvc, guess,T)
-                except ValueError:
-                    #logging.debug("invalid argument to log, setting to zero")
-                    emass[t] = 0.0
-                except ZeroDivisionError:
-                    logging.debug("div by zero, setting to zero")
-                    emass[t] = 0.0
-                except KeyError:
-                    logging.error("index out of range")
-            jkemass[cfg] = emass
-        jkemassobj = configtimeobj.Cfgtimeobj.fromDataDict(jkemass)
-        effmass_dt = self.cosh_effective_mass(dt, fast=fast, period=period)
-        return {t: jackknife.errorbars(effmass_dt[t], jkemassobj.get(time=t))
-                for t in self.times[dt:-dt]}
-
-
-
-    def sinh_effective_mass_errors(self, dt, fast=True, period=None):
-        if fast: logging.info("sinh emass computed fast method")
-
-        T = self.period_check(period)
-
-        jkasv = self.jackknife_average_sub_vev()
-        jkemass = {}
-        for cfg in self.configs:
-            asvc = jkasv[cfg]
-            emass = {}
-            for t in self.times[dt:-dt]:
-                if t in self.emass_skip_times:
-                    emass[t] = 0.0
-                    continue
-                try:
-                    guess = (1.0 / float(dt))*math.asinh((asvc[t+dt] + asvc[t-dt])/(2.0*asvc[t]))
-                    if fast:
-                        emass[t] = guess
-                    else:
-                        emass[t] = newton.newton_sinh_for_m(t,t+dt,asvc, guess, T)
-                except ValueError:
-                    #logging.debug("invalid argument to log, setting to zero")
-                    emass[t] = 0.0
-                except ZeroDivisionError:
-                    logging.debug("div by zero, setting to zero")
-                    emass[t] = 0.0
-                except KeyError:
-                    logging.error("index out of range")
-            jkemass[cfg] = emass
-        jkemassobj = configtimeobj.Cfgtimeobj.fromDataDict(jkemass)
-        effmass_dt = self.sinh_effective_mass(dt, fast=fast, period=T)
-        return {t: jackknife.errorbars(effmass_dt[t], jkemassobj.get(time=t))
-                for t in self.times[dt:-dt]}
-
-
-    def cosh_const_effective_mass_errors(self, dt):
-
-        jkasv = self.jackknife_average_sub_vev()
-        jkemass = {}
-        for cfg in self.configs:
-            asvc = jkasv[cfg]
-            emass = {}
-            asvct = {t: asvc[t+dt] - asvc[t] for t in self.times[:-dt]}
-            for t in self.times[dt:-(dt+1)]:
-                if t in self.emass_skip_times:
-                    emass[t] = 0.0
-                    continue
-                try:
-                    emass[t] = (1.0 / float(dt))*math.acosh((asvc[t+dt] + asvc[t-dt])/(2.0*asvc[t]))
-                except ValueError:
-                    #logging.debug("invalid argument to log, setting to zero")
-                    emass[t] = 0.0
-                except ZeroDivisionError:
-                    logging.debug("div by zero, setting to zero")
-                    emass[t] = 0.0
-                except KeyError:
-                    logging.error("index out of range")
-            jkemass[cfg] = emass
-        jkemassobj = configtimeobj.Cfgtimeobj.fromDataDict(jkemass)
-        effmass_dt = self.cosh_const_effective_mass(dt)
-        return {t: jackknife.errorbars(effmass_dt[t], jkemassobj.get(time=t))
-                for t in self.times[dt:-(dt+dt)]}
-
+    def vev_arrays(self):
+        """ Arrays of the two vevs on each config, or None without vevs"""
+        if self.vev1 is None:
+            return None
+        return (np.array([self.vev1[c] for c in self.configs]),
+                np.array([self.vev2[c] for c in self.configs]))
 
     def reduce_to_bins(self, n):
-        reduced = {}
-        binedvev1 = {}
-        binedvev2 = {}
-        for i, b in enumerate(self.bins(n)):
-            # logging.debug("bin:")
-            # logging.debug(b)
-            size = float(len(b))
-            reduced[i] = {t: math.fsum((self.get(config=c, time=t) for c in b)) / size
-                          for t in self.times}
-
-            if self.vev1 is None:
-                binedvev1 = binnedvev2 = None
-            else:
-                binedvev1[i] = math.fsum((self.vev1[c] for c in b)) / size
-                binedvev2[i] = math.fsum((self.vev2[c] for c in b)) / size
+        if self.numconfigs % n != 0:
+            logging.warning("Bin size %d not factor of num configs %d !!!", n, self.numconfigs)
+        reduced = bin_average(self.as_array(), n)
+        binedvev1 = binedvev2 = None
+        vevs = self.vev_arrays()
+        if vevs is not None:
+            binedvev1, binedvev2 = (bin_average(v, n) for v in vevs)
 
-        logging.info("Binned from %d, reduced to %d bins", self.numconfigs, len(reduced.keys()))
+        logging.info("Binned from %d, reduced to %d bins", self.numconfigs, len(reduced))
         # Make a new correlator for the bined data
-        return Correlator.fromDataDicts(reduced, binedvev1, binedvev2)
+        return Correlator.fromArrays(reduced, binedvev1, binedvev2, times=self.times)
+
+    def binned_errors_array(self, n):
+        """ The jackknifed_errors of the correlator binned by n, as an
+        array over times, without building the binned correlator"""
+        data = bin_average(self.as_array(), n)
+        nb = float(len(data))
+        jk = (data.sum(axis=0) - data) / (nb - 1.0)
+        asv = data.mean(axis=0)
+        vevs = self.vev_arrays()
+        if vevs is not None:
+            vev1, vev2 = (bin_average(v, n) for v in vevs)
+            jk -= (((vev1.sum() - vev1) / (nb - 1.0)) * ((vev2.sum() - vev2) / (nb - 1.0)))[:, np.newaxis]
+            asv -= vev1.mean() * vev2.mean()
+        return np.sqrt(((nb - 1.0) / nb) * ((jk - asv)**2).sum(axis=0))
+
+    def autocorrelation_times(self, window=6.0):
+        """ Integrated autocorrelation time of each time slice. The
+        normalized autocorrelation function is summed out to the first
+        window W with W >= window * tau(W), as in Madras and Sokal."""
+        N = self.numconfigs
+        data = self.as_array() - self.as_array().mean(axis=0)
+        # Zero pad so the autocovariance from the FFT does not wrap around
+        f = np.fft.rfft(data, n=2 * N, axis=0)
+        gamma = np.fft.irfft(f * f.conj(), n=2 * N, axis=0)[:N]
+        gamma /= (N - np.arange(N))[:, np.newaxis]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            taus = 0.5 + np.cumsum(gamma[1:] / gamma[0], axis=0)
+        if not len(taus):
+            return self.todict(np.full(len(self.times), 0.5))
+        stop = np.arange(1, N)[:, np.newaxis] >= window * taus
+        first = np.where(stop.any(axis=0), stop.argmax(axis=0), N - 2)
+        return self.todict(taus[first, np.arange(len(self.times))])
+
+    def auto_bin_size(self, minbins=20, sigmas=2.0):
+        """ The smallest bin size at which the jackknife errors plateau.
+
+        Binning by n grows the error by at most sqrt(2 tau_int), using the
+        integrated autocorrelation time of each time slice. Sizes from 1
+        up to the size leaving minbins bins are scanned for the first one
+        whose errors on every time slice are within sigmas times their
+        statistical uncertainty, error/sqrt(2(bins-1)), of that plateau.
+        """
+        taus = self.autocorrelation_times()
+        plateau = self.binned_errors_array(1) * np.sqrt(2.0 * np.maximum([taus[t] for t in self.times], 0.5))
+        largest = max(self.numconfigs // minbins, 1)
+        for size in range(1, largest + 1):
+            errors = self.binned_errors_array(size)
+            nbins = np.ceil(self.numconfigs / float(size))
+            if (errors * (1.0 + sigmas / np.sqrt(2.0 * max(nbins - 1.0, 1.0))) >= plateau).all():
+                break
+        else:
+            logging.warning("jackknife errors did not plateau by bin size %d", largest)
+
+        ratios = self.todict(errors / self.binned_errors_array(1))
+        for t in self.times:
+            logging.info("t=%s tau_int=%f error ratio=%f", t, taus[t], ratios[t])
+        logging.info("Auto binning chose bin size %d from %d configs", size, self.numconfigs)
+        return size
 
     def bins(self, n):
         """ Yield successive n-sized chunks from configs.
@@ -511,13 +442,9 @@ class Correlator(configtimeobj.Cfgtimeobj):
 
         for time in new_times:
             logging.info("redefinging correlator data for time {0} as C'({0}) = C({0}) - C({1})".format(time, t))
-            for cfg in self.configs:
-                self.data[cfg][time] = self.data[cfg][time] - self.data[cfg][t]
-        self.asv = None
-        self.jkasv = None
-        self.average = None
-        self.sums = None
-        self.vevdata = None
+        cols = [self.timeindex[time] for time in new_times]
+        self.array[:, cols] = self.array[:, cols] - self.array[:, [self.timeindex[t]]]
+        self.invalidate()
         self.times = new_times
 
     def period_check(self, period):
@@ -580,7 +507,6 @@ class Correlator(configtimeobj.Cfgtimeobj):
         asv = self.average_sub_vev()
         errors = self.jackknifed_errors()
 
-        removed_data = []
         # new_times = [t for t in self.times if asv[t] - 2.0 * errors[t] > 0.0]
         if self.period is not None:
             if self.period != len(self.times):
@@ -589,32 +515,21 @@ class Correlator(configtimeobj.Cfgtimeobj):
             self.period = len(self.times)
         period = self.period
         seperations = list(range(1,period/2+1))
-        biggest_change = 0.0
-        for t in self.times:
-            if t in seperations:
-                logging.debug("averaging %d %d", t, period-t)
-                for cfg in self.configs:
-                    prevdata = self.data[cfg][t]
-                    if anti:
-                        newdata = (self.data[cfg][t] - self.data[cfg][period-t])/2.0
-                    else:
-                        newdata = (self.data[cfg][t] + self.data[cfg][period-t])/2.0
-
-                    biggest_change = max(biggest_change, abs(prevdata - newdata)/prevdata)
-                    self.data[cfg][t] = newdata # (self.data[cfg][t] + self.data[cfg][period-t])/2.0
-            else:
-                removed_data.append(t)
-                for cfg in self.configs:
-                    del self.data[cfg][t]
+        removed_data = [t for t in self.times if t not in seperations]
+        for t in seperations:
+            logging.debug("averaging %d %d", t, period-t)
+        prevdata = self.array[:, [self.timeindex[t] for t in seperations]]
+        mirrored = self.array[:, [self.timeindex[period-t] for t in seperations]]
+        if anti:
+            newdata = (prevdata - mirrored)/2.0
+        else:
+            newdata = (prevdata + mirrored)/2.0
+        biggest_change = np.max(np.abs(prevdata - newdata)/prevdata)
+        self.set_array(newdata, self.configs, seperations)
         logging.info("Removed data for t={}".format(repr(removed_data)))
 
         logging.info("Correlator made symetric, largest change was {}".format(biggest_change))
-        self.times = seperations
-        self.asv = None
-        self.jkasv = None
-        self.average = None
-        self.sums = None
-        self.vevdata = None
+        self.invalidate()
         self.made_symmetric = True
 
     def determine_symmetry(self, recheck=False):
@@ -647,12 +562,33 @@ class Correlator(configtimeobj.Cfgtimeobj):
 
         logging.warn("Dividing correlator by {}!!!!!".format(d))
 
-        for c in self.configs:
-            for t in self.times:
-                self.data[c][t] = self.data[c][t]/d[t]
+        cols = self.tcols
+        self.array[:, cols] = self.array[:, cols] / np.array([d[t] for t in self.times])
 
-        self.asv = None
-        self.jkasv = None
-        self.average = None
-        self.sums = None
-        self.vevdata = None
+        self.invalidate()
+
+
+class JointCorrelator(Correlator):
+    """ Several correlators on the same configs joined along the time
+    axis for simultaneous fits. The fit window of each correlator is
+    stacked once into one (config x time) array with times 0..n-1, so the
+    resampling and covariance of the joint correlator cover every block.
+    ranges holds the original (tmin, tmax) of each block, blocks the
+    slice of the joint times it occupies and correlators the originals.
+    """
+
+    @classmethod
+    def fromCorrelators(cls, cors, tmins, tmaxs):
+        configs = cors[0].configs
+        if not all(configs == c.configs for c in cors):
+            raise ValueError("correlators to join must have the same configs")
+        ranges = zip(tmins, tmaxs)
+        columns = [cor.array[:, [cor.timeindex[t] for t in range(tmin, tmax + 1)]]
+                   for cor, (tmin, tmax) in zip(cors, ranges)]
+        joint = cls.fromArrays(np.ascontiguousarray(np.hstack(columns)), None, None, configs=configs)
+        ends = np.cumsum([tmax - tmin + 1 for tmin, tmax in ranges]).tolist()
+        joint.ranges = ranges
+        joint.correlators = cors
+        joint.blocks = [slice(start, end) for start, end in zip([0] + ends[:-1], ends)]
+        joint.emass_skip_times = set(ends) | set(end - 1 for end in ends)
+        return joint
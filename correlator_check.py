@@ -10,7 +10,7 @@ from scipy import stats
 
 def check(f, options):
 
-    cor = build_corr.corr_and_vev_from_pickle(f, None, None)
+    cor = build_corr.corr_and_vev_from_cache(f, None, None)
 
     logging.info("correlator with {} cfgs and {} times ".format(len(cor.configs),len(cor.times)))
     logging.info("correlator with period {}".format(cor.period))
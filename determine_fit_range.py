@@ -30,7 +30,7 @@ def determine_fit_range(options):
     rel_err = {t:0 for t in range(1,options.period/2)}
 
 
-    cors = [build_corr.corr_and_vev_from_pickle(f, None, None) for f in files]
+    cors = [build_corr.corr_and_vev_from_cache(f, None, None) for f in files]
 
     p = 1.05
 
@@ -1,16 +1,16 @@
 #!/usr/bin/env python
 import logging
 import numpy as np
-import pandas as pd
 from scipy import linalg as LA
 from numpy.linalg import cond
 import determine_operators
 import argparse
-import pandas_reader
 import os.path
 from level_identifier import readops
-
-import build_corr
+from cormatrix import CorrelatorMatrix, hermitian
+import gevp
+from resampling import NBOOTSTRAPS
+import main as effective_mass
 
 DIAGTOL = 0.009
 
@@ -25,14 +25,11 @@ def hermitionize(M):
     return (M+M.H)/2.0
 
 
-def diagonalize(correlator_pannel, t0, td, generalized=False):
-    length = correlator_pannel.shape[0]
-    n = int(np.sqrt(length))
+def diagonalize(cormatrix, t0, td, generalized=False):
     assert t0 is not None
-    # Here we access the pannel major_xs gives time(n), mean incase it
-    # was a multi correlator should have no effect on an already averaged one
-    A = np.matrix(np.reshape(correlator_pannel.major_xs(td).mean().values, (n, n)))
-    B = np.matrix(np.reshape(correlator_pannel.major_xs(t0).mean().values, (n, n)))
+    # Mean over the configs, should have no effect on an already averaged one
+    A = np.matrix(cormatrix.mean(td))
+    B = np.matrix(cormatrix.mean(t0))
     # Require A and B to be hermition for our generalized eigen value
     # problem method to work. Here we force the matricies to be
     # hermtion. This is justified since it is just useing the other
@@ -64,69 +61,62 @@ def diagonalize(correlator_pannel, t0, td, generalized=False):
     n = len(evecs)
     logging.debug("Matrix size {N}x{N}".format(N=n))
 
-    def rotate(x):
-        M = np.matrix(np.resize(x, (n, n)))
-        M = hermitionize(M)
-        D = V.H * M * V
-        R = np.array(D).flatten()
-        P = pd.Series(R)
-        return P
-
-    diag = correlator_pannel.apply(rotate, "items")
-    diag.items = ["{}{}".format(i,j) for i in reversed(range(n)) for j in reversed(range(n))]
+    # Levels are numbered from the largest eigenvalue down
+    diag = cormatrix.hermitian().rotate(np.asarray(V)[:, ::-1])
 
     # This method simultaniously diagaonlizes at t0 and td. Should be
     # identity at t0 and the eigenvalues at td
-    assert compare_matrix(np.reshape(diag.major_xs(t0).mean().values, (n, n)),
-                          np.identity(n)), "Rotation error: is not ~identity at t0"
-    assert compare_matrix(np.reshape(diag.major_xs(td).mean().values, (n, n)),
-                          np.diag(evals)), "Rotation error: Is not ~Lambda at td"
+    assert compare_matrix(diag.mean(t0), np.identity(n)), "Rotation error: is not ~identity at t0"
+    assert compare_matrix(diag.mean(td), np.diag(evals[::-1])), "Rotation error: Is not ~Lambda at td"
 
     return diag
 
 
-def principle(correlator_pannel, t0, generalized=False):
-    length = correlator_pannel.shape[0]
-    n = int(np.sqrt(length))
-    # Here we access the pannel major_xs gives time(n), mean incase it
-    # was a multi correlator should have no effect on an already averaged one
-    B = np.matrix(np.reshape(correlator_pannel.major_xs(t0).mean().values, (n, n)))
+def principle(cormatrix, t0, generalized=False):
+    n = len(cormatrix)
+    # Mean over the configs, should have no effect on an already averaged one
+    B = np.matrix(cormatrix.mean(t0))
     # Require B to be hermition for our generalized eigen value
     # problem method to work. Here we force the matricies to be
     # hermtion. This is justified since it is just useing the other
     # measurement of the same value and averaging them.
     B = hermitionize(B)
-    # Instead of using generalized eigen problem, we could solve a
-    # regular eigen problem involving Binvqrt
 
     logging.debug("Matrix size {N}x{N}".format(N=n))
 
-    Binvsqrt =  LA.inv(LA.sqrtm(B))
+    # Solve on every config and time at once, B only needs to be
+    # factored once. Levels are followed across the times by their
+    # eigenvectors, starting from the largest eigenvalue down after t0
+    t0index = cormatrix.timeindex(t0)
+    evals, V = gevp.solve(hermitian(cormatrix.array), np.asarray(B))
+    evals, V = gevp.track(evals, V, np.asarray(B), min(t0index+1, len(cormatrix.times)-1), t0index)
+    logging.info("lowest eval={}".format(evals.min()))
 
-    def rotate(x):
-        # We are rotating on each one, so compute a new A for each
-        A = hermitionize(np.matrix(np.resize(x, (n, n))))
-        logging.info("condition number: {}".format(cond(Binvsqrt*A*Binvsqrt)))
-        evals, evecs = LA.eigh(Binvsqrt*A*Binvsqrt)
-        logging.info("lowest eval={}".format(min(evals)))
-        evecs = np.matrix(evecs)
-        V = np.matrix(Binvsqrt)*evecs
+    diag = cormatrix.hermitian().rotate(V)
 
-        D = V.H * A * V
-        R = np.array(D).flatten()
-        P = pd.Series(R)
-        return P
+    # Each config and time is rotated by its own eigenvectors, so each
+    # should be diagonal with its eigenvalues
+    assert compare_matrix(diag.array, evals[..., np.newaxis]*np.identity(n)), "Rotation error: is not ~diagonal"
 
-    diag = correlator_pannel.apply(rotate, "items")
-    diag.items = ["{}{}".format(i,j) for i in reversed(range(n)) for j in reversed(range(n))]
+    return diag
 
-    # This method simultaniously diagaonlizes at t0 and td. Should be
-    # identity at t0 and the eigenvalues at td
-    assert compare_matrix(np.reshape(diag.major_xs(t0).mean().values, (n, n)),
-                          np.identity(n)), "Rotation error: is not ~identity at t0"
 
-    return diag
 
+def resampled_diagonalize(cormatrix, t0, td, jackknife=False, bootstraps=NBOOTSTRAPS):
+    """Diagonalize at t0 and td on the average and on every resample in
+    one batch. Returns the rotation coefficients of the average with
+    errors (of the real and imaginary parts) and the rotated correlator of
+    each level with errors, each resample being rotated by its own
+    coefficients"""
+    evals, V, _, replicaV, replicas = gevp.resampled_rotations(cormatrix, t0, td, jackknife, bootstraps)
+    logging.info("eigenvalues are {}".format(evals))
+    Verrors = (gevp.resampled_errors(replicaV.real, jackknife) +
+               1j*gevp.resampled_errors(replicaV.imag, jackknife))
+
+    rotated = np.einsum('in,tin->tn', np.conj(V), np.matmul(cormatrix.mean(), V)).real
+    replica_rotated = np.einsum('rin,rtin->rtn', np.conj(replicaV),
+                                np.matmul(replicas, replicaV[:, np.newaxis])).real
+    return V, Verrors, rotated, gevp.resampled_errors(replica_rotated, jackknife)
 
 
 def parenformat(x):
@@ -140,27 +130,53 @@ def parenformatn(x):
     return ["({},{})".format(np.real(i), np.imag(i)) for i in x]
 
 
-def write_cor_matrix(correlator_pannel, outputwild, ops, suffix=""):
-    """Write the correlator pannel to files """
-    ops = map(str,ops)
+def write_cor_matrix(cormatrix, outputwild, suffix="", average=False):
+    """Write the correlator matrix to text files, one for each element. If
+    average only the mean over configs is written. Each file is written
+    in one pass"""
     if not os.path.exists(os.path.dirname(outputwild)):
         os.makedirs(os.path.dirname(outputwild))
-    for snk in ops:
-        for src in ops:
+    times = map(str, cormatrix.times)
+    ops = map(str, cormatrix.ops)
+    for i, snk in enumerate(ops):
+        for j, src in enumerate(ops):
             filename = outputwild.format(snk, src)+suffix
-            first = True
-            cor = correlator_pannel[snk+src]
-            if cor.ndim == 1:
-                cor.apply(parenformat).to_csv(filename, sep=",", header=True, index_label="#time")
-                continue
-            for n in cor:
-                if first:
-                    cor[n].apply(parenformat).to_csv(filename, sep=",", header=True, index_label="#time")
-                    first = False
-                else:
-                    cor[n].apply(parenformat).to_csv(filename, sep=",", header=False, mode="a")
+            values = cormatrix.array[:, :, i, j]
+            if average:
+                blocks = [(snk+src, values.mean(0))]
+            else:
+                blocks = zip(cormatrix.configs, values)
+            with open(filename, "w", 1 << 20) as corfile:
+                corfile.write("#time,{}\n".format(blocks[0][0]))
+                for _, cor in blocks:
+                    corfile.write("".join("{},{!r}\n".format(t, parenformat(v))
+                                          for t, v in zip(times, cor.tolist())))
     logging.info("Wrote correlator matrix to {}{}".format(outputwild.format("SNK", "SRC"), suffix))
 
+
+def write_principal_correlators(filename, times, evals, errors):
+    """Write the principal correlators of each level and their errors"""
+    logging.info("Writing principal correlators to {}".format(filename))
+    with open(filename, "w") as pfile:
+        pfile.write("#time, " + ", ".join("level{0}, level{0} error".format(l) for l in range(evals.shape[1])))
+        pfile.write("\n")
+        for t, values, errs in zip(times, evals, errors):
+            pfile.write("{}, {}\n".format(t, ", ".join("{}, {}".format(v, e) for v, e in zip(values, errs))))
+
+
+def write_coeffs(filename, V, errors):
+    """Write the rotation coefficients and errors in the format read by
+    zfactor.read_coeffs_file, the id of each is op then level"""
+    logging.info("Writing rotation coefficients to {}".format(filename))
+    with open(filename, "w") as cfile:
+        cfile.write("# rotation coefficients\n")
+        for level in range(V.shape[1]):
+            for op in range(V.shape[0]):
+                v, e = V[op, level], errors[op, level]
+                cfile.write("{:d}{:03d} ({},{}) ({},{})\n".format(op+1, level+1, v.real, v.imag,
+                                                                  e.real, e.imag))
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Diagonalize correlator matrix")
     parser.add_argument("-v", "--verbose", action="store_true",
@@ -185,12 +201,26 @@ if __name__ == "__main__":
     parser.add_argument("-e", "--write_eigenvalues", type=str, required=False,
                         help="just write the eigenvalues")
     parser.add_argument("-m", "--returnmaxeigen", action="store_true", required=False,
-                        help="return max eigenvalue")
+                        help="print the largest eigenvalue of the GEVP at tstar")
     parser.add_argument("--symmetric", action="store_true",
                         help="make the correlator symmetric")
+    parser.add_argument("--principal-errors", type=str, required=False,
+                        help="write the principal correlators of the average with resampled errors to file")
+    parser.add_argument("--coeffs", type=str, required=False,
+                        help="rediagonalize on each resample and write the rotation coeffs with errors to file")
+    parser.add_argument("--rotated-errors", type=str, required=False,
+                        help="rediagonalize on each resample and write the rotated correlators with errors to file")
+    parser.add_argument("--jackknife", action="store_true",
+                        help="jackknife instead of bootstrap")
+    parser.add_argument("-b", "--bootstraps", type=int, required=False, default=NBOOTSTRAPS,
+                        help="Number of straps")
+    parser.add_argument("--seed", type=int, default=4, required=False,
+                        help="set the random seed")
 
     parser.add_argument("-o", "--outputformat", type=str, required=False,
                         help="format to write output")
+    parser.add_argument("--binary", type=str, required=False,
+                        help="write the rotated correlator matrix to a single binary file")
     args = parser.parse_args()
 
     if args.verbose:
@@ -218,49 +248,63 @@ if __name__ == "__main__":
         parser.print_help()
         parser.exit()
 
-    cor_matrix = {}
-    cor_matrix_multi = {}
-    cor_matrix_ave = {}
-    for snk in args.operators:
-        for src in args.operators:
-            filename = args.input_dir + args.filewild.format(snk, src)
-            logging.info("reading {}".format(filename))
-            try:
-                tmpcor = pandas_reader.read_configcols_paraenformat(filename)
-            except:
-                tmpcor = pandas_reader.read_configcols_normal(filename)
-
-
-            cor_matrix[snk+src] = tmpcor
-
+    if args.principle and (args.coeffs or args.rotated_errors):
+        parser.print_help()
+        logging.error("Can not write coeffs or rotated errors for the principle correlators")
+        parser.exit()
 
-    p = pd.Panel(cor_matrix)
+    cormatrix = CorrelatorMatrix.fromFilewild(args.input_dir, args.filewild, args.operators)
 
     if args.returnmaxeigen:
+        if args.tnaught is None:
+            parser.print_help()
+            logging.error("Must have tnaught for the max eigenvalue")
+            parser.exit()
         logging.info("just returning the max eigen")
-        print diagonalize(p, args.tnaught, args.tstar, generalized=args.generalized)
+        evals, _ = gevp.solve(cormatrix.mean(args.tstar)[np.newaxis], cormatrix.mean(args.tnaught))
+        print max(evals[0])
+
+    if args.principal_errors:
+        if args.tnaught is None:
+            parser.print_help()
+            logging.error("Must have tnaught for the principal correlators")
+            parser.exit()
+        np.random.seed(args.seed)
+        evals, errors, _ = gevp.resampled_principal_correlators(cormatrix, args.tnaught, args.tstar,
+                                                                jackknife=args.jackknife,
+                                                                bootstraps=args.bootstraps)
+        write_principal_correlators(args.principal_errors, cormatrix.times, evals, errors)
 
     if args.principle:
-        diag = principle(p, args.tnaught, generalized=args.generalized)
+        diag = principle(cormatrix, args.tnaught, generalized=args.generalized)
     else:
         if args.tnaught is None:
             parser.print_help()
             logging.error("Must have tnaught if not principle")
             parser.exit()
-        diag = diagonalize(p, args.tnaught, args.tstar, generalized=args.generalized)
-    diagave = diag.mean(2)
-
-    levels = range(len(args.operators))
+        diag = diagonalize(cormatrix, args.tnaught, args.tstar, generalized=args.generalized)
+        if args.coeffs or args.rotated_errors:
+            np.random.seed(args.seed)
+            V, Verrors, rotated, errors = resampled_diagonalize(cormatrix, args.tnaught, args.tstar,
+                                                                jackknife=args.jackknife,
+                                                                bootstraps=args.bootstraps)
+            if args.coeffs:
+                write_coeffs(args.coeffs, V, Verrors)
+            if args.rotated_errors:
+                write_principal_correlators(args.rotated_errors, cormatrix.times, rotated, errors)
+
+    levels = diag.ops
     if args.outputformat:
-        write_cor_matrix(diag, args.outputformat, levels, suffix=".full")
-        write_cor_matrix(diagave, args.outputformat, levels, suffix=".ave")
+        write_cor_matrix(diag, args.outputformat, suffix=".full")
+        write_cor_matrix(diag, args.outputformat, suffix=".ave", average=True)
+    if args.binary:
+        diag.save(args.binary)
 
     if args.analyize:
-        exe_folder, _ = os.path.split(os.path.realpath(__file__))
-        output_dir, outputformat = os.path.split(args.outputformat)
-        outputformat += ".full"
-        opstring = "-r " + " -r ".join([str(l) for l in levels])
-        runstring = '{}/main.py -i {}/ -f {} -nv -o {}/ {}'.format(exe_folder, output_dir,
-                                                                   outputformat, args.analyize, opstring)
-        logging.info("executing {}".format(runstring))
-        os.system(runstring)
+        if not os.path.exists(args.analyize):
+            os.makedirs(args.analyize)
+        options = effective_mass.parser.parse_args(["-o", args.analyize] +
+                                                   [o for l in levels for o in ("-r", str(l))])
+        logging.info("running effective mass analysis of the levels into {}".format(args.analyize))
+        effective_mass.setup(options, diag)
+        effective_mass.main()
@@ -9,10 +9,12 @@ import build_corr
 import argparse
 import os
 import math
+import multiprocessing
 
 from parser_fit import fitparser, functions
-from fit_parents import InvalidFit
+from fit_parents import InvalidFit, FitContext
 from copy import deepcopy
+from cStringIO import StringIO
 
 from scipy import linalg
 from scipy import stats
@@ -24,6 +26,9 @@ from scipy.optimize import leastsq
 # from scipy.optimize import minimize
 
 import progress_bar
+import resampling
+import batch_fit
+import fitstore
 
 OUTPUT = 25
 ALWAYSINFO = 26
@@ -52,10 +57,6 @@ def fit(fn, cor, tmin, tmax, filestub=None, bootstraps=NBOOTSTRAPS, return_quali
         logging.info("Writing output to file {}".format(filename))
 
     if filestub:
-        eval_filename = filestub + ".evals"
-        eval_file = open(eval_filename, 'w')
-        eval_file.write("# evals seqeuntial\n")
-
         tstride_filename = filestub + ".tstride"
         tstride_file = open(tstride_filename, 'w')
         tstride_file.write("{}\n".format(tstride))
@@ -90,185 +91,219 @@ def fit(fn, cor, tmin, tmax, filestub=None, bootstraps=NBOOTSTRAPS, return_quali
         logging.info("no indexes on fit function, using normal fitrange")
 
     x = np.array(fitrange)
+    context = FitContext(fn, x)
     dof = len(x) - len(fn.parameter_names)
-    orig_ave_cor = cor.average_sub_vev()
-    y = [orig_ave_cor[t] for t in fitrange]
-    logging.info("x {}".format(x))
-    logging.info("y {}".format(y))
-    original_ensamble_params, success = leastsq(fun, initial_guess, args=(x, y), maxfev=10000)
-
-    original_cov = covariance_matrix(cor, fitrange)
-    logging.info("inverting original cov")
-    igonre_error_original_cov = options.debug_ignoreinverterror or options.debug_uncorrelated
-    inv_original_cov = bestInverse(original_cov, print_error=True, ignore_error=igonre_error_original_cov)
 
+    # Identical fits are loaded from the store rather than refit, the
+    # debug options which need each strap's correlator always refit
+    store_key = stored = None
+    if options.store and not (options.write_each_boot or options.debug or options.debugguess
+                              or options.debug_outputcov):
+        store_key = fitstore.fit_key(fn, cor, tmin, tmax, tstride, bootstraps, options)
+        stored = fitstore.load(options.store, store_key)
+
+    if stored is not None:
+        stored_arrays, stored_info = stored
+        original_ensamble_params = stored_arrays.get("uncorrelated")
+        original_ensamble_correlatedfit = stored_arrays["ensemble"].tolist()
+        original_ensamble_chisqr = stored_info["chisqr"]
+        boot_params = stored_arrays["params"].tolist()
+        boot_chisqr = stored_arrays["chisqr"].tolist()
+        bootstraps = stored_info["straps"]
+        failcount = bootstraps - len(boot_params)
+    else:
+        if filestub and options.evals:
+            eval_filename = filestub + ".evals"
+            eval_file = open(eval_filename, 'w')
+            eval_file.write("# evals seqeuntial\n")
 
-    logging.info("original ensemble full cov")
-    matrix_stats(original_cov, None, cond=True)
+        orig_ave_cor = cor.average_sub_vev()
+        y = [orig_ave_cor[t] for t in fitrange]
+        logging.info("x {}".format(x))
+        logging.info("y {}".format(y))
+        original_ensamble_params, success = leastsq(fun, initial_guess, args=(x, y), maxfev=10000)
 
-    if options.debug_singlecov:
-        logging.info("original ensemble single cov")
         original_cov = covariance_matrix(cor, fitrange)
-        inv_original_cov = bestInverse(original_cov, print_error=True, ignore_error=options.debug_ignoreinverterror)
-        matrix_stats(original_cov, eval_file, cond=True)
-
-    if options.debug_singleuncorrelated:
-        logging.debug("Using uncorrlated")
-        jke = cor.jackknifed_errors()
-        original_cov = np.diag([jke[t]**2 for t in fitrange])
-        inv_original_cov = bestInverse(original_cov, print_error=True, ignore_error=options.debug_ignoreinverterror)
-        matrix_stats(original_cov, eval_file, cond=True)
-
-
-    if options.debug_outputcov:
-        def invert_error(M,i):
-            return np.max(np.abs((np.dot(M, i) - np.identity(len(i)))))
-        def invert_error_one(M,i):
-            return np.sum(np.abs((np.dot(M, i) - np.identity(len(i)))))
-        def invert_error_two(M,i):
-            return np.sum(((np.dot(M, i) - np.identity(len(i))))**2)
-
-        logging.info("inv=\n{}".format(inv_original_cov))
-        logging.info("invert errors:")
-        logging.info("inv error max norm {}".format(invert_error(original_cov, inv_original_cov)))
-        logging.info("inv error one norm {}".format(invert_error_one(original_cov, inv_original_cov)))
-        logging.info("inv error two norm {}".format(invert_error_two(original_cov, inv_original_cov)))
-        exit(0)
-
-
-    if options.debugguess:
-        #return original_ensamble_params, [0.01, 0.01, 0.01, 0.01] # For testing initila guess in plot
-        if options.plot:
-            plot_fit(fn, cor, tmin, tmax, options, initial_guess)
-        return initial_guess, [0.01, 0.01, 0.01, 0.01]  # For testing initila guess in plot
-    if not success:
-        raise InvalidFit("original exnamble leastsq failed")
-    if options.first_pass:
-        initial_guess = original_ensamble_params
-        logging.info("initial_guess after first pass: {}".format(repr(initial_guess)))
-
-    def cov_fit(correlator, guess):
-        ave_cor = correlator.average_sub_vev()
-        y = [ave_cor[t] for t in fitrange]
-
-
-        if options.debug_uncorrelated:
-            logging.debug("Using uncorrlated")
-            fcov = covariance_matrix(correlator, fitrange)
-            cov = np.diag(np.diag(fcov))
-            # jke = correlator.jackknifed_errors()
-            # cov = np.diag([jke[t]**2 for t in fitrange])
-
-        elif options.debug_singlecov:
-            cov = original_cov
-        else:
-            cov = covariance_matrix(correlator, fitrange)
-
-        matrix_stats(cov, eval_file)
-
-
-        if options.debug_singlecov or options.debug_singleuncorrelated:
-            inv_cov = inv_original_cov
-        else:
-            inv_cov = bestInverse(cov, ignore_error=options.debug_ignoreinverterror)
+        logging.info("factoring original cov")
+        igonre_error_original_cov = options.debug_ignoreinverterror or options.debug_uncorrelated
+        original_whitening = whitening_matrix(original_cov, print_error=True, ignore_error=igonre_error_original_cov)
 
-        matrix_stats(cov, eval_file)
 
-        if options.debug_identcov:
-            results.log(30, "using identcov debug option")
-            inv_cov = np.identity(len(cov))
+        logging.info("original ensemble full cov")
+        matrix_stats(original_cov, None, cond=True)
 
+        if options.debug_singlecov:
+            logging.info("original ensemble single cov")
+            original_cov = covariance_matrix(cor, fitrange)
+            original_whitening = whitening_matrix(original_cov, print_error=True, ignore_error=options.debug_ignoreinverterror)
+            matrix_stats(original_cov, eval_file, cond=True)
 
-        aoc = np.array([ave_cor[t] for t in fitrange])
-        #logging.debug("guess {}".format(str(guess)))
-
-        def cov_fun(g):
-            """ Function to be minizied. computed using matrix mult"""
-            vect = aoc - fn.formula(g, x)
-            return vect.dot(inv_cov).dot(vect)
+        if options.debug_singleuncorrelated:
+            logging.debug("Using uncorrlated")
+            jke = cor.jackknifed_errors()
+            original_cov = np.diag([jke[t]**2 for t in fitrange])
+            original_whitening = whitening_matrix(original_cov, print_error=True, ignore_error=options.debug_ignoreinverterror)
+            matrix_stats(original_cov, eval_file, cond=True)
+
+
+        if options.debug_outputcov:
+            def invert_error(M,i):
+                return np.max(np.abs((np.dot(M, i) - np.identity(len(i)))))
+            def invert_error_one(M,i):
+                return np.sum(np.abs((np.dot(M, i) - np.identity(len(i)))))
+            def invert_error_two(M,i):
+                return np.sum(((np.dot(M, i) - np.identity(len(i))))**2)
+
+            inv_original_cov = original_whitening.T.dot(original_whitening)
+            logging.info("inv=\n{}".format(inv_original_cov))
+            logging.info("invert errors:")
+            logging.info("inv error max norm {}".format(invert_error(original_cov, inv_original_cov)))
+            logging.info("inv error one norm {}".format(invert_error_one(original_cov, inv_original_cov)))
+            logging.info("inv error two norm {}".format(invert_error_two(original_cov, inv_original_cov)))
+            exit(0)
+
+
+        if options.debugguess:
+            #return original_ensamble_params, [0.01, 0.01, 0.01, 0.01] # For testing initila guess in plot
+            if options.plot:
+                plot_fit(fn, cor, tmin, tmax, options, initial_guess)
+            return initial_guess, [0.01, 0.01, 0.01, 0.01]  # For testing initila guess in plot
+        if not success:
+            raise InvalidFit("original exnamble leastsq failed")
         if options.first_pass:
-            uncorrelated_fit_values, success = leastsq(fun, guess, args=(x, y), maxfev=100000)
-            if not success:
-                raise InvalidFit("leastsq failed")
-            logging.debug("firstpass guess {}".format(str(uncorrelated_fit_values)))
-            if guess[0] < 0.0:
-                logging.warn("first pass found mass to be negative {}, lets not use it".format(guess[0]))
+            initial_guess = original_ensamble_params
+            logging.info("initial_guess after first pass: {}".format(repr(initial_guess)))
+
+        def fit_whitening(cov, evals_output=eval_file):
+            """ The whitening matrix to fit with for the covariance cov, after
+            the debug covariance options"""
+            if options.debug_uncorrelated:
+                logging.debug("Using uncorrlated")
+                cov = np.diag(np.diag(cov))
+                # jke = correlator.jackknifed_errors()
+                # cov = np.diag([jke[t]**2 for t in fitrange])
+
+            elif options.debug_singlecov:
+                cov = original_cov
+
+            if evals_output:
+                matrix_stats(cov, evals_output)
+
+            if options.debug_singlecov or options.debug_singleuncorrelated:
+                whitening = original_whitening
             else:
-                guess = uncorrelated_fit_values
-
-            if len(guess) > 2 and guess[2] < 0.0:
-                logging.warn("first pass found mass2 to be negative {}, lets flip it".format(guess[2]))
-                logging.info("first pass results are {}".format(repr(guess)))
-                guess[2] = -guess[2]
-
-        def clamp(n, minn, maxn):
-                return max(min(maxn, n), minn)
-        bounded_guess = [clamp(g, b[0], b[1]) for g, b in zip(guess, fn.bounds)]
-        #logging.debug("guess {}, bounded guess {}".format(repr(guess), repr(bounded_guess)))
-
-        m = fn.custom_minuit(aoc, inv_cov, x, guess=bounded_guess)
-        #m.set_strategy(2)
-        migradinfo = m.migrad()
-        minuit_results = [m.values[name] for name in fn.parameter_names]
-        chisqr = migradinfo[0]["fval"]
-        if m.get_fmin().is_valid:
-            return minuit_results, chisqr
-        else:
-            logging.error("minuit failed!!")
-            logging.error("was at {}".format(minuit_results))
-            raise InvalidFit("minuit failed")
-
-    # end cov_fit
-
-    original_ensamble_correlatedfit, original_ensamble_chisqr = cov_fit(cor, initial_guess)
-    isvalidfit = fn.valid(original_ensamble_correlatedfit)
-    if not isvalidfit:
-        raise InvalidFit("Full ensamble failed")
-
-
-    boot_params = []
-    boot_chisqr = []
-    failcount = 0
-    attempted = 0
-
-    for strap in bootstrap_ensamble(cor, N=bootstraps, filelog=filestub, jackknife=options.jackknife):
-
-        if options.jackknife:
-            bootstraps = len(cor.configs)
+                whitening = whitening_matrix(cov, ignore_error=options.debug_ignoreinverterror)
+
+            if options.debug_identcov:
+                results.log(30, "using identcov debug option")
+                whitening = np.identity(len(cov))
+            return whitening
+
+        def cov_fit(aoc, cov, guess, evals_output=eval_file, errors=False):
+            """ Fit to aoc with covariance cov from guess, or from the warm
+            start of context if guess is None"""
+            y = aoc
+            whitening = fit_whitening(cov, evals_output)
+
+            #logging.debug("guess {}".format(str(guess)))
+            if options.first_pass and guess is not None:
+                uncorrelated_fit_values, success = leastsq(fun, guess, args=(x, y), maxfev=100000)
+                if not success:
+                    raise InvalidFit("leastsq failed")
+                logging.debug("firstpass guess {}".format(str(uncorrelated_fit_values)))
+                if guess[0] < 0.0:
+                    logging.warn("first pass found mass to be negative {}, lets not use it".format(guess[0]))
+                else:
+                    guess = uncorrelated_fit_values
+
+                if len(guess) > 2 and guess[2] < 0.0:
+                    logging.warn("first pass found mass2 to be negative {}, lets flip it".format(guess[2]))
+                    logging.info("first pass results are {}".format(repr(guess)))
+                    guess[2] = -guess[2]
+
+            context.set_data(aoc, whitening)
+            return correlated_fit(context, guess, varpro=options.varpro, errors=errors,
+                                  gradient=options.gradient)
+
+        # end cov_fit
+
+        original_ensamble_correlatedfit, original_errors, original_ensamble_chisqr = cov_fit(
+            np.array(y), covariance_matrix(cor, fitrange), initial_guess, errors=True)
+        isvalidfit = fn.valid(original_ensamble_correlatedfit)
+        if not isvalidfit:
+            raise InvalidFit("Full ensamble failed")
+
+        # Start each strap from the full ensemble fit with its errors as the
+        # step sizes, the guess is only needed for reguess and first_pass
+        warm = not (options.reguess or options.first_pass)
+        if warm:
+            context.warm_start(original_ensamble_correlatedfit, original_errors, gradient=options.gradient)
+
+        boot_params = []
+        boot_chisqr = []
+        failcount = 0
+        attempted = 0
+
+        straps = bootstrap_ensamble(cor, N=bootstraps, filelog=filestub, jackknife=options.jackknife)
+        bootstraps = len(straps)
+        strap_averages = straps.averages(fitrange)
+        strap_covariances = straps.covariances(fitrange)
+
+        batched = {}
+        if options.batch and warm and hasattr(fn, "jacobian"):
+            batched = batch_fit_straps(fn, x, strap_averages, strap_covariances, original_ensamble_correlatedfit,
+                                       fit_whitening, eval_file is not None)
+        elif options.batch:
+            logging.warn("can not batch fit {} with these options, using minuit".format(fn.description))
+
+        def fit_strap(i):
+            if i in batched:
+                return batched[i]
+            if options.reguess:
+                newguess = fn.starting_guess(straps.correlator(i), options.period, tmax, tmin)
+            elif warm:
+                newguess = None
+            else:
+                newguess = initial_guess
+            evals = StringIO() if eval_file else None
+            fitted_params, _, fitted_chisqr = cov_fit(strap_averages[i], strap_covariances[i], newguess,
+                                                      evals_output=evals)
+            return fitted_params, fitted_chisqr, evals.getvalue() if evals else None
 
         pb = progress_bar.progress_bar(bootstraps)
 
-        attempted +=1
-        pb.update(attempted)
-        if options.reguess:
-            newguess = fn.starting_guess(strap, options.period, tmax, tmin)
-        else:
-            newguess = initial_guess
-        try:
-            fitted_params, fitted_chisqr = cov_fit(strap, newguess)
-        except (InversionError, InvalidFit) as e:
-            if options.debug_ignoreinverterror:
-                fitted_params = None
+        for result in map_fits(fit_strap, bootstraps, jobs=options.jobs):
+
+            attempted +=1
+            pb.update(attempted)
+            if isinstance(result, Exception):
+                if options.debug_ignoreinverterror:
+                    fitted_params = None
+                else:
+                    raise result
             else:
-                raise e
-        if fitted_params is not None:
-            boot_params.append(fitted_params)
-            boot_chisqr.append(fitted_chisqr)
-            logging.debug("bootstrap converged")
-            if options.write_each_boot:
-                write_fitted_cor(fn, strap, tmin, tmax, options, fitted_params, postfix=".bootstrap{}".format(attempted))
-            if options.debug:
-                plot_fit(fn, strap, tmin, tmax, options, fitted_params, postfix=".bootstrap{}".format(attempted))
-        else:
-            logging.error("bootstrap failed to converge!")
-            #raise InvalidFit("one bootstrap failed")
-            #raw_input("test")
-            failcount+=1
-            logging.debug("fails:{} attempts:{}, ratio:{}".format(failcount, attempted, failcount/float(attempted)))
-            # if failcount/float(attempted) > 0.15 and attempted > 40:
-            #     raise InvalidFit("more than 20% of boostraps failed to converge")
-        del strap
-    pb.done()
+                fitted_params, fitted_chisqr, evals = result
+                if eval_file:
+                    eval_file.write(evals)
+            if fitted_params is not None:
+                boot_params.append(fitted_params)
+                boot_chisqr.append(fitted_chisqr)
+                logging.debug("bootstrap converged")
+                if options.write_each_boot or options.debug:
+                    strap = straps.correlator(attempted-1)
+                if options.write_each_boot:
+                    write_fitted_cor(fn, strap, tmin, tmax, options, fitted_params, postfix=".bootstrap{}".format(attempted))
+                if options.debug:
+                    plot_fit(fn, strap, tmin, tmax, options, fitted_params, postfix=".bootstrap{}".format(attempted))
+            else:
+                logging.error("bootstrap failed to converge!")
+                #raise InvalidFit("one bootstrap failed")
+                #raw_input("test")
+                failcount+=1
+                logging.debug("fails:{} attempts:{}, ratio:{}".format(failcount, attempted, failcount/float(attempted)))
+                # if failcount/float(attempted) > 0.15 and attempted > 40:
+                #     raise InvalidFit("more than 20% of boostraps failed to converge")
+        pb.done()
 
 
     if failcount > 0:
@@ -281,7 +316,8 @@ def fit(fn, cor, tmin, tmax, filestub=None, bootstraps=NBOOTSTRAPS, return_quali
         plot_histograms(fn.parameter_names, boot_params, options)
 
     results.info('')
-    results.info('Uncorelated total fit: %s', {n: p for n, p in zip(fn.parameter_names, original_ensamble_params)})
+    if original_ensamble_params is not None:
+        results.info('Uncorelated total fit: %s', {n: p for n, p in zip(fn.parameter_names, original_ensamble_params)})
     results.info('Correlated total fit:  %s', {n: p for n, p in zip(fn.parameter_names, original_ensamble_correlatedfit)})
 
     factor = 1
@@ -351,6 +387,23 @@ def fit(fn, cor, tmin, tmax, filestub=None, bootstraps=NBOOTSTRAPS, return_quali
     logging.debug("chiave:{}, chi_med:{}, chi_min:{}, chi_std:{}, chi_range{}".format(
         chi_average, chi_median, chi_min, chi_std, chi_range))
 
+    # Identical fits written to other filestubs are recorded on the same entry
+    filestubs = stored_info["filestubs"] if stored is not None else []
+    if filestub and os.path.abspath(filestub) not in filestubs:
+        filestubs = filestubs + [os.path.abspath(filestub)]
+    if store_key and (stored is None or filestubs != stored_info["filestubs"]):
+        arrays = stored_arrays if stored is not None else {
+            "params": np.array(boot_params), "chisqr": np.array(boot_chisqr),
+            "ensemble": np.array(original_ensamble_correlatedfit),
+            "uncorrelated": np.array(original_ensamble_params)}
+        fitstore.save(options.store, store_key, arrays,
+                      {"function": type(fn).__name__, "description": fn.description,
+                       "parameter_names": list(fn.parameter_names), "tmin": int(tmin), "tmax": int(tmax),
+                       "tstride": tstride, "fitrange": [int(t) for t in fitrange], "straps": bootstraps,
+                       "seed": options.random, "jackknife": options.jackknife, "filestubs": filestubs,
+                       "averages": boot_averages.tolist(), "errors": boot_std.tolist(),
+                       "chisqr": chi_sqr, "dof": dof, "quality": quality_of_fit(dof, chi_sqr)})
+
 
     if bootstraps > 1 and filestub:
         bootfilename = filestub+".boot"
@@ -377,6 +430,90 @@ def fit(fn, cor, tmin, tmax, filestub=None, bootstraps=NBOOTSTRAPS, return_quali
         return boot_averages, boot_std
 
 
+def batch_fit_straps(fn, x, averages, covariances, start, fit_whitening, evals=False):
+    """ Fit all of the straps at once with batch_fit, starting from start.
+    Returns a dict of the (params, chi^2, evals) for each strap that
+    converged, the rest are left to be fit with minuit"""
+    whitenings = np.zeros(covariances.shape)
+    evals_outputs = []
+    usable = np.ones(len(averages), dtype=bool)
+    for i, cov in enumerate(covariances):
+        evals_outputs.append(StringIO() if evals else None)
+        try:
+            whitenings[i] = fit_whitening(cov, evals_outputs[i])
+        except InversionError:
+            whitenings[i] = np.identity(len(x))
+            usable[i] = False
+    params, chisqrs, converged = batch_fit.levenberg_marquardt(fn, x, averages, whitenings, start)
+    done = np.flatnonzero(usable & converged)
+    if len(done) < len(averages):
+        logging.info("{} straps did not converge in the batch fit, using minuit".format(len(averages)-len(done)))
+    return {i: (params[i].tolist(), chisqrs[i], evals_outputs[i].getvalue() if evals else None) for i in done}
+
+
+def correlated_fit(context, guess, varpro=False, errors=True, gradient=False):
+    """ Minimize the correlated chi^2 of the fit function of context to its
+    data starting from guess, or from the warm start of context if guess
+    is None. Returns the fitted parameters, their errors and the chi^2.
+    With varpro the amplitudes are solved for at each step and minuit only
+    searches over the masses, the errors then come from the hessian of the
+    full chi^2 at the minimum and are skipped if errors is False. With
+    gradient minuit is given the analytic gradient of the chi^2, falling
+    back to numerical derivatives if that fails"""
+    fn = context.fn
+    def clamp(n, minn, maxn):
+            return max(min(maxn, n), minn)
+    if guess is not None:
+        guess = [clamp(g, b[0], b[1]) for g, b in zip(guess, fn.bounds)]
+    #logging.debug("guess {}, bounded guess {}".format(repr(guess), repr(bounded_guess)))
+
+    if varpro and hasattr(fn, "linear_basis"):
+        return projected_fit(context, guess if guess is not None else context.start, errors)
+    if varpro:
+        logging.warn("{} can not be fit by variable projection, using the full fit".format(fn.description))
+
+    if gradient and not hasattr(fn, "jacobian"):
+        logging.warn("{} has no analytic gradient, using numerical derivatives".format(fn.description))
+        gradient = False
+    if guess is None:
+        m = context.rerun()
+    else:
+        m = context.minuit(guess, gradient=gradient)
+        #m.set_strategy(2)
+        m.migrad()
+    if gradient and not m.get_fmin().is_valid:
+        logging.debug("minuit failed with the analytic gradient, retrying without")
+        m = context.minuit(guess if guess is not None else context.start)
+        m.migrad()
+    minuit_results = [m.values[name] for name in fn.parameter_names]
+    chisqr = m.fval
+    if m.get_fmin().is_valid:
+        return minuit_results, [m.errors[name] for name in fn.parameter_names], chisqr
+    else:
+        logging.error("minuit failed!!")
+        logging.error("was at {}".format(minuit_results))
+        raise InvalidFit("minuit failed")
+
+
+def projected_fit(context, guess, errors=True):
+    """ Variable projection fit, the amplitudes are eliminated by linear
+    least squares so minuit only minimizes over the masses"""
+    m = context.projected_minuit(guess)
+    m.migrad()
+    masses = [m.values[name] for name in m.parameters]
+    if not m.get_fmin().is_valid:
+        logging.error("minuit failed!!")
+        logging.error("was at masses {}".format(masses))
+        raise InvalidFit("minuit failed")
+    minuit_results = context.projected_params(masses)
+    chisqr = m.fval
+    if not errors:
+        return minuit_results, None, chisqr
+    full = context.minuit(minuit_results)
+    full.hesse()
+    return minuit_results, [full.errors[name] for name in context.fn.parameter_names], chisqr
+
+
 def quality_of_fit(degrees_of_freedom, chi_sqr):
     dof = degrees_of_freedom
     return gammaincc(dof/2.0, chi_sqr / 2.0)
@@ -426,8 +563,9 @@ def plot_fit(fn, cor, tmin, tmax, options, fitted_params, errors=None, postfix=N
 
     plt.ylim(plot_helpers.auto_fit_range(min(corvals),max(corvals)))
     plt.xlim([0, tmax + 2])
-    emass = cor.periodic_effective_mass(emass_dt, fast=False, period=options.period)
-    emass_errors = cor.periodic_effective_mass_errors(emass_dt, fast=False, period=options.period).values()
+    emass, emass_errors = cor.effective_mass_and_errors(emass_dt, kind=cor.periodic_kind(), fast=False,
+                                                        period=options.period)
+    emass_errors = emass_errors.values()
     emassplot = plt.subplot(212)
     emassplot.set_ylabel("${\mathrm{\mathbf{m}_{eff}}}$")
     dataplt = emassplot.errorbar(emass.keys(), emass.values(), yerr=emass_errors, fmt='o')
@@ -480,66 +618,68 @@ def plot_histograms(names, paramters, options):
 
 
 
-def bootstrap_cfgs(cor):
-    return np.random.choice(cor.configs, size=len(cor.configs))
+# The fitter for the worker processes, they are forked after it is set
+# so it does not have to be pickled
+current_fitter = None
 
 
-def bootstrap(cor, filelog=None):
-    newcfgs = bootstrap_cfgs(cor)
-    if filelog:
-        with open(filelog+".straps", 'a') as bootfile:
-            bootfile.write(",".join([str(c) for c in newcfgs]))
-            bootfile.write("\n")
-    newcor = {i: cor.get(config=c) for i, c in enumerate(newcfgs)}
-    if cor.vev1 is None:
-        newvev1 = newvev2 = None
-    else:
-        newvev1 = {i: cor.vev1[c] for i, c in enumerate(newcfgs)}
-        newvev2 = {i: cor.vev2[c] for i, c in enumerate(newcfgs)}
-    return correlator.Correlator.fromDataDicts(newcor, newvev1, newvev2)
-
-
-def jackknife_ensemble(cor):
-    oldcfgs = cor.configs
-    jkensambles = []
-    for cfg in cor.configs:
-        newcfgs = [n for n in cor.configs if n != cfg]
-        newcor = {i: cor.get(config=c) for i, c in enumerate(newcfgs)}
-        if cor.vev1 is None:
-            newvev1 = newvev2 = None
-        else:
-            newvev1 = {i: cor.vev1[c] for i, c in enumerate(newcfgs)}
-            newvev2 = {i: cor.vev2[c] for i, c in enumerate(newcfgs)}
-        # jkensambles.append()
-        yield correlator.Correlator.fromDataDicts(newcor, newvev1, newvev2)
+def call_fitter(i):
+    try:
+        return current_fitter(i)
+    except (InversionError, RuntimeError) as e:
+        return e
+
+
+def map_fits(fitter, N, jobs=1):
+    """ Yield the results of fitter for 0..N-1 in order. Failed fits
+    are yielded as the exception. With more than one job the fits are
+    farmed out to a pool of processes. Anything random, like the
+    straps, is drawn before this is called so the results do not depend
+    on jobs.
+    """
+    global current_fitter
+    previous_fitter = current_fitter
+    current_fitter = fitter
+    try:
+        if jobs is None or jobs < 2 or N < 2:
+            for i in range(N):
+                yield call_fitter(i)
+            return
+
+        logging.info("running {} fits with {} processes".format(N, jobs))
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for result in pool.imap(call_fitter, range(N), chunksize=max(1, N/(jobs*4))):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        current_fitter = previous_fitter
+
 
 def bootstrap_ensamble(cor, N=NBOOTSTRAPS, filelog=None, jackknife=False):
     if jackknife:
         logging.warn("using jackknife instead of bootstrap")
-        return jackknife_ensemble(cor)
+        return resampling.Resamples.jackknife(cor)
 
     if N > 1:
+        straps = resampling.Resamples.bootstrap(cor, N)
         if filelog:
-            with open(filelog+".straps", 'w') as bootfile:
-                bootfile.write("# boot straps used for fitting")
-        return (bootstrap(cor, filelog) for i in range(N))
+            straps.writestraps(filelog+".straps")
+        return straps
     else:
         logging.info("Not bootstraping!")
-        return [cor]
+        return resampling.Resamples.single(cor)
 
 def covariance_matrix(cor, times):
     nm1 = (1.0 / (len(cor.configs) - 1))
     nm0 = 1.0 / (len(cor.configs))
-    N = len(times)
-    mymat = np.zeros((N, N))
-    start_time = cor.times[0]
     asv = cor.average_sub_vev()
     aoc = np.fromiter((asv[t] for t in times), np.float)
-    for v in cor.data.values():
-        b = np.fromiter((v.values()[t] for t in times), np.float) - aoc
-        # b = np.array(v.values()[tmin-start_time:tmax-start_time]).flat-aoc
-        mymat += np.outer(b, b)
-    return mymat*nm1*nm0
+    b = cor.array[:, [cor.timeindex[t] for t in times]].reshape(len(cor.configs), len(times)) - aoc
+    return b.T.dot(b)*nm1*nm0
 
 
 
@@ -573,22 +713,76 @@ def jk_covariance_matrix(cor, times):
     return mymat
 
 
-def CholeskyInverse(t):
+def scan_fit_ranges(fn, cor, fitranges, filestub=None, tstride=1, options=None):
+    """ Do a single correlated fit to the full ensemble for each
+    (tmin, tmax) in fitranges. The covariance matrix over all times is
+    computed once and each fit uses its sub block. Returns a table with
+    rows of (tmin, tmax, params, errors, chi^2/dof, quality), the rows
+    are also written to filestub.ranges as they finish. Functions fitting
+    their own fixed ranges (with indexes) can not be scanned.
     """
-    Computes inverse of matrix given its Cholesky upper Triangular
-    decomposition t.
-    """
-    nrows = len(t)
-    B = np.zeros_like(t)
+    if hasattr(fn, "indexes"):
+        raise InvalidFit("Can not scan fit ranges of a function with fixed indexes")
+    asv = cor.average_sub_vev()
+    full_aoc = np.array([asv[t] for t in cor.times])
+    full_cov = covariance_matrix(cor, cor.times)
+    position = {t: i for i, t in enumerate(cor.times)}
+
+    def fit_range(i):
+        tmin, tmax = fitranges[i]
+        if(tmax-tmin < len(fn.parameter_names)):
+            raise InvalidFit("Can not fit to less points than parameters")
+        fitrange = range(tmin, tmax+1, tstride)
+        x = np.array(fitrange)
+        rcor = cor
+        if fn.subtract:
+            # The subtracted data depends on tmin so can not use the full covariance
+            rcor = deepcopy(cor)
+            fn.subtract = tmin - 1
+            rcor.subtract(tmin-1)
+            rasv = rcor.average_sub_vev()
+            aoc = np.array([rasv[t] for t in fitrange])
+            cov = covariance_matrix(rcor, fitrange)
+        else:
+            index = [position[t] for t in fitrange]
+            aoc = full_aoc[index]
+            cov = full_cov[np.ix_(index, index)]
+        whitening = whitening_matrix(cov, ignore_error=options.debug_ignoreinverterror)
+        guess = fn.starting_guess(rcor, options.period, tmax, tmin)
+        if options.first_pass:
+            fun = lambda v, mx, my: (fn.formula(v, mx) - my)
+            guess, success = leastsq(fun, guess, args=(x, aoc), maxfev=10000)
+            if not success:
+                raise InvalidFit("leastsq failed")
+        context = FitContext(fn, x, aoc, whitening)
+        params, errors, chisqr = correlated_fit(context, guess, varpro=options.varpro,
+                                                gradient=options.gradient)
+        dof = len(x) - len(fn.parameter_names)
+        return tmin, tmax, params, errors, chisqr/dof, quality_of_fit(dof, chisqr)
 
-    # Backward step for inverse.
-    for j in reversed(range(nrows)):
-        tjj = t[j][j]
-        S = np.sum([t[j][k] * B[j][k] for k in range(j + 1, nrows)])
-        B[j][j] = 1.0 / tjj**2 - S / tjj  # noqa
-        for i in reversed(range(j)):
-            B[j][i] = B[i][j] = -np.sum([t[i][k] * B[k][j] for k in range(i + 1, nrows)]) / t[i][i]
-    return B
+    outfile = None
+    if filestub:
+        outfile = open(filestub+".ranges", 'w')
+        names = ", ".join("{0}, {0}_err".format(n) for n in fn.parameter_names)
+        outfile.write("#tmin, tmax, {}, chi/dof, quality\n".format(names))
+
+    table = []
+    for (tmin, tmax), result in zip(fitranges, map_fits(fit_range, len(fitranges), jobs=options.jobs)):
+        if isinstance(result, InversionError):
+            logging.warn("Covariance matrix failed, skipping this tmin,tmax {},{}".format(tmin, tmax))
+            continue
+        if isinstance(result, Exception):
+            logging.warn("Fitter failed, skipping this tmin,tmax {},{}".format(tmin, tmax))
+            continue
+        table.append(result)
+        if outfile:
+            _, _, params, errors, chidof, qual = result
+            values = ", ".join("{}, {}".format(p, e) for p, e in zip(params, errors))
+            outfile.write("{}, {}, {}, {}, {}\n".format(tmin, tmax, values, chidof, qual))
+            outfile.flush()
+    if outfile:
+        outfile.close()
+    return table
 
 
 def best_fit_range(fn, cor, options=None):
@@ -599,6 +793,7 @@ def best_fit_range(fn, cor, options=None):
     logger.setLevel(ALWAYSINFO)
     best = 0
     best_ranges = []
+    fitranges = []
     for tmin in cor.times:
         if fn.subtract and tmin == min(cor.times) or tmin < 1:
             continue
@@ -606,25 +801,19 @@ def best_fit_range(fn, cor, options=None):
         for tmax in tmaxes:
             if tmin > tmax:
                 continue
-            try:
-                _, _, qual = fit(fn, cor, tmin, tmax, filestub=None, bootstraps=1, return_chi=True, return_quality=False, options=options)
-                metric = 1/qual
-                if qual < 1.5:
-                    metric = (tmax-tmin)+metric
-                # else:
-                #     metric = qual
-                #if metric > best:
-                # best = metric
-                best_ranges.append((metric, tmin, tmax))
-                if metric > 0.2:
-                    logging.log(ALWAYSINFO, "Fit range ({},{})"
-                                " is good with chi/dof {} using {} points".format(tmin, tmax, qual, tmax-tmin))
-            except RuntimeError:
-                logging.warn("Fitter failed, skipping this tmin,tmax {},{}".format(tmin, tmax))
-            except InversionError:
-                logging.warn("Covariance matrix failed, skipping this tmin,tmax {},{}".format(tmin, tmax))
-            # except Exception:
-            #     logging.warn("Fitter failed, skipping this tmin,tmax")
+            fitranges.append((tmin, tmax))
+    for tmin, tmax, _, _, qual, _ in scan_fit_ranges(fn, cor, fitranges, options=options):
+        metric = 1/qual
+        if qual < 1.5:
+            metric = (tmax-tmin)+metric
+        # else:
+        #     metric = qual
+        #if metric > best:
+        # best = metric
+        best_ranges.append((metric, tmin, tmax))
+        if metric > 0.2:
+            logging.log(ALWAYSINFO, "Fit range ({},{})"
+                        " is good with chi/dof {} using {} points".format(tmin, tmax, qual, tmax-tmin))
     logger.setLevel(previous_loglevel)
     logging.debug("Restored logging state to original")
     return [(tmin, tmax) for _, tmin, tmax in sorted(best_ranges, reverse=True)]
@@ -652,17 +841,40 @@ def auto_fit(funct, cor, filestub=None, bootstraps=NBOOTSTRAPS, return_quality=F
 
 def allfits(funct, cor, filestub=None, bootstraps=NBOOTSTRAPS, options=None):
     logging.info("Fitting ALL fit ranges")
+    fitranges = []
     for tmin in cor.times:
         tmaxes = [options.time_end] if options.time_end else range(tmin + len(funct.parameter_names)*4, max(cor.times))
         for tmax in tmaxes:
             if tmin > tmax:
                 continue
-            try:
-                _, _, qual = fit(funct, cor, tmin, tmax, filestub=filestub+"_{}_{}".format(tmin, tmax), bootstraps=bootstraps, return_chi=True, return_quality=False, options=options)
-            except RuntimeError:
-                logging.warn("Fitter failed, skipping this tmin,tmax {},{}".format(tmin, tmax))
-            except InversionError:
+            fitranges.append((tmin, tmax))
+
+    # Each range is fit in its own process, so the straps are fit serially
+    range_options = deepcopy(options)
+    range_options.jobs = 1
+
+    def fit_range(i):
+        tmin, tmax = fitranges[i]
+        ave, std, chidof = fit(funct, cor, tmin, tmax, filestub=filestub+"_{}_{}".format(tmin, tmax),
+                               bootstraps=bootstraps, return_chi=True, return_quality=False,
+                               options=range_options)
+        dof = len(range(tmin, tmax+1, options.tstride)) - len(funct.parameter_names)
+        return tmin, tmax, ave, std, chidof, quality_of_fit(dof, chidof*dof)
+
+    with open(filestub+".ranges", 'w') as outfile:
+        names = ", ".join("{0}, {0}_err".format(n) for n in funct.parameter_names)
+        outfile.write("#tmin, tmax, {}, chi/dof, quality\n".format(names))
+        for (tmin, tmax), result in zip(fitranges, map_fits(fit_range, len(fitranges), jobs=options.jobs)):
+            if isinstance(result, InversionError):
                 logging.warn("Covariance matrix failed, skipping this tmin,tmax {},{}".format(tmin, tmax))
+                continue
+            if isinstance(result, Exception):
+                logging.warn("Fitter failed, skipping this tmin,tmax {},{}".format(tmin, tmax))
+                continue
+            _, _, params, errors, chidof, qual = result
+            values = ", ".join("{}, {}".format(p, e) for p, e in zip(params, errors))
+            outfile.write("{}, {}, {}, {}, {}\n".format(tmin, tmax, values, chidof, qual))
+            outfile.flush()
     logging.info("fit all ranges")
     exit(0)
 
@@ -687,52 +899,41 @@ def matrix_stats(M, output, cond=False):
         output.write("\n")
     logging.debug("evals {}".format(outstring))
 
-def bestInverse(M, print_error=False, ignore_error=False):
+def whitening_matrix(M, print_error=False, ignore_error=False):
+    """ Factor M = L L^T and return L^-1, found with a triangular solve,
+    so the correlated chi^2 is |L^-1 r|^2 without ever inverting M. M is
+    rejected if the estimated condition number would make the solve lose
+    more than TOLERANCE of precision"""
     TOLERANCE = 1.5E-7
     if ignore_error:
         TOLERANCE = 100.0
 
-    def invert_error(i):
-        return np.max(np.abs((np.dot(M, i) - np.identity(len(i)))))
-
-    try:
-        inv = linalg.inv(M)         # Will raise error if singular
-    except np.linalg.linalg.LinAlgError:
-        logging.error("linalg invert failed")
-        raise InversionError("linalg invert failed")
-
-    error = invert_error(inv)
-
     try:
-        chol = linalg.cholesky(M, check_finite=False)
+        chol = linalg.cholesky(M, lower=True, check_finite=False)
     except np.linalg.linalg.LinAlgError:
         logging.error("Not positive definite!")
         logging.exception("Could not invert Not positive definite!")
-        logging.info("Invert error {}".format(error))
         raise InversionError("Cholesky invert failed")
 
-    else:
-        chol_inv = CholeskyInverse(chol)
-        chol_error = invert_error(chol_inv)
-
+    cond = condition_estimate(M, chol)
+    if print_error:
+        logging.info("Estimated condition number {}".format(cond))
+    logging.debug("Estimated condition number {}".format(cond))
+    if cond * np.finfo(float).eps > TOLERANCE:
+        logging.error("Estimated condition number, {}".format(cond))
+        raise InversionError("Could not invert within tolerance")
 
+    return linalg.solve_triangular(chol, np.identity(len(M)), lower=True, check_finite=False)
 
-        if print_error:
-            logging.info("Inversions errors were inv={}, chol={}".format(error, chol_error))
-        logging.debug("Inversions errors were inv={}, chol={}".format(error, chol_error))
 
-        if chol_error > TOLERANCE and error > TOLERANCE:
-            logging.error("Error, {}".format(error))
-            logging.error("chol_Error, {}".format(chol_error))
-            matrix_stats(M, None)
-            raise InversionError("Could not invert within tolerance")
-
-        if chol_error < error:
-            logging.debug("Using choleskey inverse")
-            inv = chol_inv
-        else:
-            logging.debug("Using standard inverse")
-    return inv
+def condition_estimate(M, chol):
+    """ Estimate of the 1-norm condition number of M from its lower
+    Cholesky factor, without an eigen decomposition"""
+    anorm = np.max(np.sum(np.abs(M), axis=0))
+    rcond, info = linalg.lapack.dpocon(chol, anorm, uplo='L')
+    if info != 0 or rcond == 0.0:
+        return np.inf
+    return 1.0 / rcond
 
 
 if __name__ == "__main__":
@@ -797,7 +998,7 @@ if __name__ == "__main__":
         vev2 = args.vev2
 
 
-    cor = build_corr.corr_and_vev_from_pickle(corrfile, vev1, vev2)
+    cor = build_corr.corr_and_vev_from_cache(corrfile, vev1, vev2)
 
     if args.symmetric or args.antisymmetric:
         corsym = cor.determine_symmetry()
@@ -819,6 +1020,8 @@ if __name__ == "__main__":
 
     cor.prune_invalid(delete=True, sigma=args.prune)
 
+    if args.auto_bin:
+        args.bin = cor.auto_bin_size()
     if args.bin:
         cor = cor.reduce_to_bins(args.bin)
 
@@ -59,6 +59,125 @@ def twoexp_sqr_const_guess(cor, period, tmax, tmin):
     return twoexp_sqr_guess(cor, tmax, tmin) + [0.001]
 
 
+def linear_solve(basis, data, whitening):
+    """ Weighted linear least squares for the coefficients of the columns
+    of basis, returns the coefficients and the chi^2"""
+    wbasis = whitening.dot(basis)
+    wdata = whitening.dot(data)
+    coeffs = np.linalg.lstsq(wbasis, wdata, rcond=None)[0]
+    residual = wdata - wbasis.dot(coeffs)
+    return coeffs, residual.dot(residual)
+
+
+class FitContext(object):
+    """ The data, times and whitening matrix for fitting fn. All of the per
+    fit state lives here rather than on fn, so one fit function can be used
+    for many fits at once. The data can be swapped with set_data and a
+    Minuit object set up by warm_start can be rerun on each new data set.
+    """
+
+    def __init__(self, fn, times, data=None, whitening=None):
+        self.fn = fn
+        self.times = times
+        self.aoc = data
+        self.whitening = whitening
+        self.start = None
+        self.warm = None
+
+    def set_data(self, data, whitening):
+        self.aoc = data
+        self.whitening = whitening
+
+    def chisqr(self, *params):
+        white = self.whitening.dot(self.aoc - self.fn.formula(params, self.times))
+        return white.dot(white)
+
+    def gradient(self, *params):
+        """ Gradient of the chi^2 from the analytic jacobian of the formula"""
+        white = self.whitening.dot(self.aoc - self.fn.formula(params, self.times))
+        return (-2.0*self.whitening.dot(self.fn.jacobian(params, self.times)).T.dot(white)).tolist()
+
+    def initial_errors(self, params):
+        """ Parameter errors of the linearized chi^2 at params. Falls back to
+        10% of the parameter for directions the data does not constrain"""
+        wjac = self.whitening.dot(self.fn.jacobian(params, self.times))
+        try:
+            with np.errstate(invalid="ignore"):
+                errors = np.sqrt(np.diag(np.linalg.inv(wjac.T.dot(wjac))))
+        except np.linalg.LinAlgError:
+            errors = np.zeros(len(params))
+        fallback = np.maximum(0.1*np.abs(params), 1e-3)
+        bad = ~np.isfinite(errors) | (errors <= 0.0)
+        return np.where(bad, fallback, errors).tolist()
+
+    def minuit(self, guess, steps=None, gradient=False):
+        """ A Minuit object for the chi^2 starting at guess. The step sizes
+        are steps if given. With gradient Minuit is passed the analytic
+        gradient and, since migrad then no longer estimates the scale from
+        its numerical derivatives, steps default to initial_errors"""
+        names = self.fn.parameter_names
+        options = self.fn.minuit_options(guess)
+        options.update(zip(names, guess))
+        if gradient:
+            options.update(("error_"+n, e) for n, e in zip(names, self.initial_errors(guess)))
+            options["grad"] = self.gradient
+        if steps is not None:
+            options.update(("error_"+n, e) for n, e in zip(names, steps))
+        return Minuit(self.chisqr, forced_parameters=names, **options)
+
+    def warm_start(self, params, steps, gradient=False):
+        """ Set up a Minuit object starting from params, usually the full
+        ensemble solution, with steps, usually its errors, to be rerun on
+        each new data set"""
+        self.start = list(params)
+        self.warm = self.minuit(params, steps=steps, gradient=gradient)
+
+    def rerun(self):
+        """ Run migrad from the warm start on the current data. The
+        state is reset each time so the result does not depend on which
+        fits came before"""
+        self.warm.migrad(resume=False)
+        return self.warm
+
+    def projected_chisqr(self, *masses):
+        basis = self.fn.linear_basis(masses, self.times)
+        _, chisqr = linear_solve(basis, self.aoc, self.whitening)
+        return chisqr
+
+    def projected_params(self, masses):
+        basis = self.fn.linear_basis(masses, self.times)
+        coeffs, _ = linear_solve(basis, self.aoc, self.whitening)
+        return self.fn.from_linear(masses, coeffs)
+
+    def projected_minuit(self, guess):
+        """ A Minuit object for the variable projection chi^2 over just the
+        masses, starting from the masses in guess"""
+        names = self.fn.projected_names
+        options = self.fn.projected_options(guess)
+        options.update((n, guess[self.fn.parameter_names.index(n)]) for n in names)
+        return Minuit(self.projected_chisqr, forced_parameters=names, **options)
+
+
+class linear_amplitudes(object):
+    """ Parent class for functions which are linear in their amplitudes,
+    for fitting by variable projection. The amplitudes are solved for by
+    linear least squares for each set of masses, so minuit only searches
+    over the masses. Children give linear_basis, the function for each
+    linear coefficient at the given masses, and from_linear to turn the
+    masses and coefficients back into the parameters."""
+    projected_names = ["mass"]
+
+    def projected_options(self, guess):
+        return dict(error_mass=guess[0]*0.1, limit_mass=mass_bounds, print_level=0, errordef=1.0, pedantic=False)
+
+    def relative_amplitude(self, coeffs):
+        """ The second coefficient relative to the first, which has to be
+        far enough from zero to divide by"""
+        if abs(coeffs[0]) <= 1e-12*abs(coeffs[1]):
+            raise InvalidFit("first amplitude {} is too small for the relative amplitude".format(coeffs[0]))
+        return float(coeffs[1]/coeffs[0])
+
+
 class periodic(object):
     """ Parent class for functions which are periodic and need to know the time extent"""
     def setNt(self, Nt):
@@ -70,7 +189,7 @@ class periodic(object):
                 print "Not a valid number"
 
 
-class mass_amp(object):
+class mass_amp(linear_amplitudes):
     """Parent class for functions which take a mass and an amplitude"""
     def __init__(self):
         self.starting_guess = massamp_guess
@@ -78,25 +197,21 @@ class mass_amp(object):
         self.parameter_names = ["mass", "amp"]
         self.subtract = False
 
-    def my_cov_fun(self, mass, amp):
-        vect = self.aoc - self.formula((mass, amp), self.times)
-        return vect.dot(self.inv_cov).dot(vect)
-
     def valid(self, *kargs):
         return True
 
-    def custom_minuit(self, data, invmatrix, times, guess):
-        self.aoc = data
-        self.inv_cov = invmatrix
-        self.times = times
-        dof = len(data)-len(guess)
-        m = Minuit(self.my_cov_fun, mass=guess[0], error_mass=guess[0]*0.1, limit_mass=mass_bounds,
-                   amp=guess[1], error_amp=guess[1]*0.1,
-                   print_level=0, errordef=1.0, pedantic=True)
-        return m
+    def minuit_options(self, guess):
+        return dict(error_mass=guess[0]*0.1, limit_mass=mass_bounds, error_amp=guess[1]*0.1,
+                    print_level=0, errordef=1.0, pedantic=True)
 
+    def linear_basis(self, masses, times):
+        return self.formula((masses[0], 1.0), times)[:, np.newaxis]
 
-class mass_amp_subtracted(object):
+    def from_linear(self, masses, coeffs):
+        return [masses[0], float(coeffs[0])]
+
+
+class mass_amp_subtracted(linear_amplitudes):
     """Parent class for functions which take a mass and an amplitude"""
     def __init__(self):
         self.starting_guess = subtracted_guess
@@ -104,23 +219,20 @@ class mass_amp_subtracted(object):
         self.parameter_names = ["mass", "amp"]
         self.subtract = True
 
-    def my_cov_fun(self, mass, amp):
-        vect = self.aoc - self.formula((mass, amp), self.times)
-        return vect.dot(self.inv_cov).dot(vect)
-
     def valid(self, *kargs):
         return True
 
-    def custom_minuit(self, data, invmatrix, times, guess):
-        self.aoc = data
-        self.inv_cov = invmatrix
-        self.times = times
-        m = Minuit(self.my_cov_fun, mass=guess[0], amp=guess[1],
-                   print_level=0, pedantic=False)
-        return m
+    def minuit_options(self, guess):
+        return dict(print_level=0, pedantic=False)
+
+    def linear_basis(self, masses, times):
+        return self.formula((masses[0], 1.0), times)[:, np.newaxis]
 
+    def from_linear(self, masses, coeffs):
+        return [masses[0], float(coeffs[0])]
 
-class mass_amp_const(object):
+
+class mass_amp_const(linear_amplitudes):
     """Parent class for functions which take a mass and an amplitude"""
     def __init__(self):
         self.starting_guess = const_guess
@@ -128,34 +240,32 @@ class mass_amp_const(object):
         self.parameter_names = ["mass", "amp", "const"]
         self.subtract = False
 
-    def my_cov_fun(self, mass, amp, const):
-        vect = self.aoc - self.formula((mass, amp, const), self.times)
-        return vect.dot(self.inv_cov).dot(vect)
-
     def valid(self, *kargs):
         return True
 
-    def custom_minuit(self, data, invmatrix, times, guess):
-        self.aoc = data
-        self.inv_cov = invmatrix
-        self.times = times
-        m = Minuit(self.my_cov_fun, mass=guess[0], amp=guess[1], const=guess[2],
-                   print_level=0, pedantic=False)
-        return m
+    def minuit_options(self, guess):
+        return dict(print_level=0, pedantic=False)
+
+    def projected_options(self, guess):
+        return dict(print_level=0, pedantic=False)
+
+    def linear_basis(self, masses, times):
+        return np.column_stack([self.formula((masses[0], 1.0, 0.0), times),
+                                self.formula((masses[0], 0.0, 1.0), times)])
+
+    def from_linear(self, masses, coeffs):
+        return [masses[0], float(coeffs[0]), float(coeffs[1])]
 
 
-class twice_mass_amp(object):
+class twice_mass_amp(linear_amplitudes):
     """Parent class for functions which take a mass and an amplitude"""
     def __init__(self):
         self.starting_guess = twoexp_sqr_guess
         self.bounds = [mass_bounds, amp_bounds, mass_bounds, amp_bounds]
         self.parameter_names = ["mass", "amp", "mass2", "amp2"]
+        self.projected_names = ["mass", "mass2"]
         self.subtract = False
 
-    def my_cov_fun(self, mass, amp, mass2, amp2):
-        vect = self.aoc - self.formula((mass, amp, mass2, amp2), self.times)
-        return vect.dot(self.inv_cov).dot(vect)
-
     def valid(self, params):
         if params is None:
             return False
@@ -168,28 +278,31 @@ class twice_mass_amp(object):
         else:
             return True
 
-    def custom_minuit(self, data, invmatrix, times, guess):
-        self.aoc = data
-        self.inv_cov = invmatrix
-        self.times = times
-        m = Minuit(self.my_cov_fun, mass=guess[0], amp=guess[1], mass2=guess[2], amp2=guess[3],
-                   print_level=0, pedantic=False, limit_amp2=amp_bounds, limit_mass2=mass_bounds,
-                   limit_mass=mass_bounds, limit_amp=amp_bounds)
-        return m
+    def minuit_options(self, guess):
+        return dict(print_level=0, pedantic=False, limit_amp2=amp_bounds, limit_mass2=mass_bounds,
+                    limit_mass=mass_bounds, limit_amp=amp_bounds)
+
+    def projected_options(self, guess):
+        return dict(print_level=0, pedantic=False, limit_mass=mass_bounds, limit_mass2=mass_bounds)
 
+    def linear_basis(self, masses, times):
+        """ amp2 multiplies amp, so the coefficients are amp and amp*amp2"""
+        first = self.formula((masses[0], 1.0, masses[1], 0.0), times)
+        return np.column_stack([first, self.formula((masses[0], 1.0, masses[1], 1.0), times) - first])
 
-class twice_mass_amp_const(object):
+    def from_linear(self, masses, coeffs):
+        return [masses[0], float(coeffs[0]), masses[1], self.relative_amplitude(coeffs)]
+
+
+class twice_mass_amp_const(linear_amplitudes):
     """Parent class for functions which take a mass and an amplitude"""
     def __init__(self):
         self.starting_guess = twoexp_sqr_const_guess
         self.bounds = [mass_bounds, amp_bounds, mass_bounds, amp_bounds, const_bounds]
         self.parameter_names = ["mass", "amp", "mass2", "amp2", "const"]
+        self.projected_names = ["mass", "mass2"]
         self.subtract = False
 
-    def my_cov_fun(self, mass, amp, mass2, amp2, const):
-        vect = self.aoc - self.formula((mass, amp, mass2, amp2, const), self.times)
-        return vect.dot(self.inv_cov).dot(vect)
-
     def valid(self, params):
         if not params:
             return False
@@ -201,11 +314,18 @@ class twice_mass_amp_const(object):
         else:
             return True
 
-    def custom_minuit(self, data, invmatrix, times, guess):
-        self.aoc = data
-        self.inv_cov = invmatrix
-        self.times = times
-        m = Minuit(self.my_cov_fun, mass=guess[0], amp=guess[1], mass2=guess[2], amp2=guess[3], const=guess[4],
-                   print_level=0, pedantic=False, limit_amp2=amp_bounds, limit_mass2=mass_bounds,
-                   limit_mass=mass_bounds, limit_amp=amp_bounds)
-        return m
+    def minuit_options(self, guess):
+        return dict(print_level=0, pedantic=False, limit_amp2=amp_bounds, limit_mass2=mass_bounds,
+                    limit_mass=mass_bounds, limit_amp=amp_bounds)
+
+    def projected_options(self, guess):
+        return dict(print_level=0, pedantic=False, limit_mass=mass_bounds, limit_mass2=mass_bounds)
+
+    def linear_basis(self, masses, times):
+        """ amp2 multiplies amp, so the coefficients are amp, amp*amp2 and const"""
+        first = self.formula((masses[0], 1.0, masses[1], 0.0, 0.0), times)
+        return np.column_stack([first, self.formula((masses[0], 1.0, masses[1], 1.0, 0.0), times) - first,
+                                self.formula((masses[0], 0.0, masses[1], 0.0, 1.0), times)])
+
+    def from_linear(self, masses, coeffs):
+        return [masses[0], float(coeffs[0]), masses[1], self.relative_amplitude(coeffs), float(coeffs[2])]
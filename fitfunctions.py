@@ -1,6 +1,38 @@
 import numpy as np
 import fit_parents as fp
 
+
+def columns(*derivatives):
+    """ Stack the derivatives with respect to each parameter along the last
+    axis. Parameters given as (samples x 1) arrays broadcast against the
+    times so a batch of parameters gives (samples x times x parameters)"""
+    return np.stack(np.broadcast_arrays(*derivatives), axis=-1)
+
+
+def with_const(jacobian):
+    """ Add the derivative with respect to a constant term"""
+    return np.concatenate([jacobian, np.ones(jacobian.shape[:-1] + (1,))], axis=-1)
+
+
+def periodic_exp_jacobian(v, x, Nt, sign=1.0):
+    """ Jacobian of v[1](exp(-v[0]x) + sign*exp(v[0](x-Nt)))"""
+    fwd = np.exp((-1.0) * v[0] * x)
+    back = sign*np.exp(v[0] * (x-Nt))
+    return columns(v[1]*((-1.0)*x*fwd + (x-Nt)*back), fwd + back)
+
+
+def periodic_two_exp_jacobian(v, x, Nt):
+    """ Jacobian of the periodic_two_exp formula"""
+    fwd = np.exp((-1.0)*v[0]*x)
+    back = np.exp(v[0]*(x-Nt))
+    fwd2 = np.exp((-1.0)*(v[2]**2)*x)
+    back2 = np.exp((v[2]**2)*(x-Nt))
+    return columns(v[1]*((-1.0)*x*fwd*(1.0 + v[3]*fwd2) + (x-Nt)*back*(1.0 + v[3]*back2)),
+                   fwd*(1.0 + v[3]*fwd2) + back*(1.0 + v[3]*back2),
+                   v[1]*v[3]*2.0*v[2]*((-1.0)*x*fwd*fwd2 + (x-Nt)*back*back2),
+                   v[1]*(fwd*fwd2 + back*back2))
+
+
 class cosh(fp.mass_amp, fp.periodic):
     def __init__(self, Nt=None):
         super(cosh, self).__init__()
@@ -12,6 +44,10 @@ class cosh(fp.mass_amp, fp.periodic):
         #return ((2*v[1])/np.exp(v[0]*Nt/2.0) * np.cosh((-1.0)* v[0]*((x-(Nt/2.0)))))
         return (v[1] * np.cosh((-1.0)*v[0]*((x-(self.Nt/2.0)))))
 
+    def jacobian(self, v, x):
+        shifted = x-(self.Nt/2.0)
+        return columns(v[1] * shifted * np.sinh(v[0]*shifted), np.cosh(v[0]*shifted))
+
 
 class single_exp(fp.mass_amp):
     def __init__(self, **kargs):
@@ -22,6 +58,10 @@ class single_exp(fp.mass_amp):
     def formula(self, v, x):
         return (v[1] * np.exp((-1.0) * v[0] * x))
 
+    def jacobian(self, v, x):
+        fwd = np.exp((-1.0) * v[0] * x)
+        return columns((-1.0) * v[1] * x * fwd, fwd)
+
 
 class periodic_exp(fp.mass_amp, fp.periodic):
     def __init__(self, Nt=None):
@@ -33,6 +73,9 @@ class periodic_exp(fp.mass_amp, fp.periodic):
     def formula(self, v, x):
         return (v[1] * (np.exp((-1.0) * v[0] * x) + np.exp(v[0] * (x-(self.Nt)))))
 
+    def jacobian(self, v, x):
+        return periodic_exp_jacobian(v, x, self.Nt)
+
 class antiperiodic_exp(fp.mass_amp, fp.periodic):
     def __init__(self, Nt=None):
         super(antiperiodic_exp, self).__init__()
@@ -43,6 +86,9 @@ class antiperiodic_exp(fp.mass_amp, fp.periodic):
     def formula(self, v, x):
         return (v[1] * (np.exp((-1.0) * v[0] * x) - np.exp(v[0] * (x-(self.Nt)))))
 
+    def jacobian(self, v, x):
+        return periodic_exp_jacobian(v, x, self.Nt, sign=-1.0)
+
 
 class periodic_exp_subtracted(fp.mass_amp, fp.periodic):
     def __init__(self, Nt=None):
@@ -56,6 +102,9 @@ class periodic_exp_subtracted(fp.mass_amp, fp.periodic):
     def formula(self, v, x):
         return (v[1] * (np.exp((-1.0) * v[0] * x) + np.exp(v[0] * (x-(self.Nt))))) - (v[1] * (np.exp((-1.0) * v[0] * self.subtract) + np.exp(v[0] * (self.subtract-(self.Nt)))))
 
+    def jacobian(self, v, x):
+        return periodic_exp_jacobian(v, x, self.Nt) - periodic_exp_jacobian(v, np.array([self.subtract]), self.Nt)
+
 
 class periodic_exp_const(fp.mass_amp_const, fp.periodic):
     def __init__(self, Nt=None):
@@ -67,6 +116,9 @@ class periodic_exp_const(fp.mass_amp_const, fp.periodic):
     def formula(self, v, x):
         return (v[1] * (np.exp((-1.0) * v[0] * x) + np.exp(v[0] * (x-(self.Nt)))))+v[2]
 
+    def jacobian(self, v, x):
+        return with_const(periodic_exp_jacobian(v, x, self.Nt))
+
 
 class cosh_const(fp.mass_amp_const, fp.periodic):
     def __init__(self, Nt=None):
@@ -78,6 +130,10 @@ class cosh_const(fp.mass_amp_const, fp.periodic):
     def formula(self, v, x):
         return (v[1] * np.cosh((-1.0)*v[0]*((x-(self.Nt/2.0)))))+v[2]
 
+    def jacobian(self, v, x):
+        shifted = x-(self.Nt/2.0)
+        return with_const(columns(v[1] * shifted * np.sinh(v[0]*shifted), np.cosh(v[0]*shifted)))
+
 
 class two_exp(fp.twice_mass_amp):
     def __init__(self, **kargs):
@@ -89,6 +145,12 @@ class two_exp(fp.twice_mass_amp):
     def formula(self, v, x):
         return (v[1] * np.exp((-1.0) * v[0] * x)*(1.0 + v[3]*np.exp((-1.0)*(v[2]**2)*x)))
 
+    def jacobian(self, v, x):
+        fwd = np.exp((-1.0) * v[0] * x)
+        fwd2 = np.exp((-1.0)*(v[2]**2)*x)
+        return columns((-1.0) * x * v[1] * fwd * (1.0 + v[3]*fwd2), fwd * (1.0 + v[3]*fwd2),
+                       (-2.0) * v[2] * x * v[1] * v[3] * fwd * fwd2, v[1] * fwd * fwd2)
+
 
 class periodic_two_exp(fp.twice_mass_amp, fp.periodic):
     def __init__(self, Nt=None):
@@ -103,6 +165,9 @@ class periodic_two_exp(fp.twice_mass_amp, fp.periodic):
                 return ((v[1]*np.exp((-1.0)*v[0]*x)*(1.0 + v[3]*np.exp((-1.0)*(v[2]**2)*x))) +
                         (v[1]*np.exp(v[0]*(x-(self.Nt)))*(1.0 + v[3]*np.exp((v[2]**2)*(x-(self.Nt))))))  # noqa
 
+    def jacobian(self, v, x):
+        return periodic_two_exp_jacobian(v, x, self.Nt)
+
 
 class periodic_two_exp_subtracted(fp.twice_mass_amp, fp.periodic):
     def __init__(self, Nt=None):
@@ -120,6 +185,9 @@ class periodic_two_exp_subtracted(fp.twice_mass_amp, fp.periodic):
                 ((v[1]*np.exp((-1.0)*v[0]*self.subtract)*(1.0 + v[3]*np.exp((-1.0)*(v[2]**2)*self.subtract))) +
                  (v[1]*np.exp(v[0]*(self.subtract-(self.Nt)))*(1.0 + v[3]*np.exp((v[2]**2)*(self.subtract-(self.Nt)))))))  # noqa
 
+    def jacobian(self, v, x):
+        return periodic_two_exp_jacobian(v, x, self.Nt) - periodic_two_exp_jacobian(v, np.array([self.subtract]), self.Nt)
+
 
 class periodic_two_exp_const(fp.twice_mass_amp_const, fp.periodic):
     def __init__(self, Nt=None):
@@ -134,6 +202,9 @@ class periodic_two_exp_const(fp.twice_mass_amp_const, fp.periodic):
                 return ((v[1]*np.exp((-1.0)*v[0]*x)*(1.0 + v[3]*np.exp((-1.0)*(v[2]**2)*x))) +
                         (v[1]*np.exp(v[0]*(x-(self.Nt)))*(1.0 + v[3]*np.exp((v[2]**2)*(x-(self.Nt))))))+v[4]  # noqa
 
+    def jacobian(self, v, x):
+        return with_const(periodic_two_exp_jacobian(v, x, self.Nt))
+
 
 # def pade_guess(*args, **kargs):
 #     first_two = fit_parents.massamp_guess(args[0], args[1])
@@ -0,0 +1,118 @@
+""" Store of bootstrap fit results keyed by everything that determines
+them. The key is a hash of the fitted data, the fit function, the fit
+range, the number of bootstraps, the random seed and the options that
+change the fit, so running an identical fit again loads the bootstrap
+parameters instead of refitting. Each result is a .npz file in the store
+directory named by its key, holding the bootstrap parameters and chi^2
+and the full ensemble fits along with a json description of the fit
+which can be queried.
+"""
+import numpy as np
+import logging
+import hashlib
+import json
+import time
+import glob
+import os
+
+STORE_VERSION = 1
+
+# Options which change the fitted bootstrap parameters
+FIT_OPTIONS = ("period", "jackknife", "first_pass", "reguess", "varpro", "gradient", "batch",
+               "minuit", "nofallback", "debug_identcov", "debug_uncorrelated",
+               "debug_singleuncorrelated", "debug_singlecov", "debug_ignoreinverterror")
+
+
+def data_hash(cor):
+    """ Hash of the correlator data and vevs over its current times"""
+    sha = hashlib.sha1()
+    sha.update(repr((cor.configs, cor.times)))
+    sha.update(np.ascontiguousarray(cor.as_array()).tostring())
+    if cor.vev1 is not None:
+        for v in (cor.vev1, cor.vev2):
+            sha.update(np.array([v[c] for c in cor.configs]).tostring())
+    return sha.hexdigest()
+
+
+def fit_key(fn, cor, tmin, tmax, tstride, bootstraps, options):
+    description = {"version": STORE_VERSION, "data": data_hash(cor),
+                   "function": type(fn).__name__, "description": fn.description,
+                   "parameters": list(fn.parameter_names), "Nt": getattr(fn, "Nt", None),
+                   "ranges": getattr(fn, "ranges", None), "shared": getattr(fn, "shared", None),
+                   "tmin": tmin, "tmax": tmax, "tstride": tstride,
+                   "bootstraps": bootstraps, "seed": options.random}
+    description.update((o, getattr(options, o, None)) for o in FIT_OPTIONS)
+    return hashlib.sha1(json.dumps(description, sort_keys=True)).hexdigest()
+
+
+def entry_file(directory, key):
+    return os.path.join(directory, key + ".npz")
+
+
+def load(directory, key):
+    """ The stored arrays and info of a fit, or None if it is not stored"""
+    filename = entry_file(directory, key)
+    if not os.path.isfile(filename):
+        return None
+    try:
+        with np.load(filename) as stored:
+            arrays = {name: stored[name] for name in stored.files if name != "info"}
+            info = json.loads(str(stored["info"]))
+    except (IOError, ValueError, KeyError) as e:
+        logging.warn("Could not read stored fit {}: {}".format(filename, e))
+        return None
+    logging.info("loaded stored fit {}".format(filename))
+    return arrays, info
+
+
+def save(directory, key, arrays, info):
+    """ Store the arrays of a fit along with info, which must be json
+    serializable. Failing to write is only a warning"""
+    filename = entry_file(directory, key)
+    info = dict(info, key=key, written=time.time())
+    tmpfile = "{}.tmp{}".format(filename, os.getpid())
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(tmpfile, 'wb') as f:
+            np.savez(f, info=np.array(json.dumps(info)), **arrays)
+        os.rename(tmpfile, filename)
+        logging.info("stored fit {}".format(filename))
+    except (IOError, OSError) as e:
+        logging.warn("Failed to store fit {}: {}".format(filename, e))
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+
+
+def query(directory, **criteria):
+    """ The info of every stored fit whose info matches all of criteria,
+    oldest first. Only the info of each entry is read"""
+    found = []
+    for filename in glob.glob(os.path.join(directory, "*.npz")):
+        try:
+            with np.load(filename) as stored:
+                info = json.loads(str(stored["info"]))
+        except (IOError, ValueError, KeyError):
+            logging.debug("skipping unreadable {}".format(filename))
+            continue
+        if all(info.get(k) == v for k, v in criteria.iteritems()):
+            found.append(info)
+    return sorted(found, key=lambda info: info["written"])
+
+
+def results(info):
+    """ Dict of the (average, error) of each parameter of a stored fit"""
+    return dict(zip(info["parameter_names"], zip(info["averages"], info["errors"])))
+
+
+def by_filestub(directory):
+    """ The info of the most recent stored fit written to each filestub"""
+    return {filestub: info for info in query(directory) for filestub in info["filestubs"]}
+
+
+def latest(directory, **criteria):
+    """ The info of the most recent stored fit matching criteria, or None"""
+    found = query(directory, **criteria)
+    if not found:
+        return None
+    return found[-1]
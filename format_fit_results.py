@@ -2,6 +2,8 @@
 import logging
 import argparse
 import re
+import os
+import fitstore
 
 
 def format_fit_results(filewild):
@@ -27,10 +29,31 @@ def format_fit_results(filewild):
             print "{}, {}, {}, {}, {}".format(level, -1, -1, -1, -1)
         level += 1
 
+def format_stored_results(filewild, store):
+    """ format_fit_results from the fit store, filewild is for the fit
+    output files and each fit is found by its filestub"""
+    stored = fitstore.by_filestub(store)
+    level = 0
+    while True:
+        filestub = os.path.abspath(os.path.splitext(filewild.format(level))[0])
+        if filestub not in stored:
+            logging.debug("No stored fit for {}".format(filestub))
+            break
+        fitted = fitstore.results(stored[filestub])
+        try:
+            (amp, amperror), (mass, masserror) = fitted["amp"], fitted["mass"]
+            print "{}, {}, {}, {}, {}".format(level, amp, amperror, mass, masserror)
+        except KeyError:
+            logging.debug("Fit {} does not have mass and amp".format(filestub))
+            print "{}, {}, {}, {}, {}".format(level, -1, -1, -1, -1)
+        level += 1
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="combine fit results to many levels into a single file")
     parser.add_argument("-v", "--verbose", action="store_true",
                         help="increase output verbosity")
+    parser.add_argument("--store", type=str, required=False,
+                        help="read the results from this fit store instead of the output files")
     parser.add_argument('filewild', metavar='f', type=str, help='wildcard for fit outputs')
     args = parser.parse_args()
 
@@ -40,4 +63,7 @@ if __name__ == "__main__":
     else:
         logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 
-    format_fit_results(args.filewild)
+    if args.store:
+        format_stored_results(args.filewild, args.store)
+    else:
+        format_fit_results(args.filewild)
@@ -0,0 +1,163 @@
+""" Generalized eigenvalue problem C(t) v = lambda C(t0) v of a correlator
+matrix, solved for every time slice and every resample at once. Each
+resample needs a single Cholesky factorization C(t0) = L L^H, after
+which the problem at each time is the ordinary hermitian eigenproblem of
+L^-1 C(t) L^-H, solved with one batched eigh.
+"""
+import numpy as np
+import logging
+from cormatrix import hermitian, sandwich
+from resampling import NBOOTSTRAPS
+
+
+def solve(C, Ct0):
+    """ Solve the GEVP for matrices C (... x time x N x N) with reference
+    matrices Ct0 (... x N x N). Returns the eigenvalues (... x time x N),
+    in increasing order on each time, and eigenvectors as the columns of
+    (... x time x N x N) normalized so v^H C(t0) v = 1. Where Ct0 is not
+    positive definite the results are NaN"""
+    Ct0 = hermitian(Ct0)
+    try:
+        L = np.linalg.cholesky(Ct0)
+        bad = None
+    except np.linalg.LinAlgError:
+        bad = np.linalg.eigvalsh(Ct0).min(axis=-1) <= 0
+        logging.warn("C(t0) is not positive definite on {} of {}".format(bad.sum(), bad.size))
+        L = np.linalg.cholesky(np.where(bad[..., np.newaxis, np.newaxis], np.identity(Ct0.shape[-1]), Ct0))
+    Linv = np.linalg.inv(L)[..., np.newaxis, :, :]
+    LinvH = np.conj(np.swapaxes(Linv, -1, -2))
+    evals, evecs = np.linalg.eigh(hermitian(sandwich(LinvH, C)))
+    evecs = np.matmul(LinvH, evecs)
+    if bad is not None:
+        evals[bad] = np.nan
+        evecs[bad] = np.nan
+    return evals, evecs
+
+
+def reorder(evals, evecs, order):
+    """ Reorder the levels of (... x N) eigenvalues and the matching
+    eigenvector columns by (... x N) order"""
+    evecs = np.take_along_axis(evecs, order[..., np.newaxis, :], axis=-1)
+    return np.take_along_axis(evals, order, axis=-1), evecs
+
+
+def match_levels(overlaps):
+    """ Greedily pair the levels of two bases by largest overlap.
+    overlaps is (... x N x N) between the old levels (rows) and the new
+    levels (columns), returns (... x N) the new level for each old one"""
+    overlaps = np.array(overlaps, dtype=float)
+    N = overlaps.shape[-1]
+    flat = overlaps.reshape(-1, N, N)
+    order = np.empty(flat.shape[:2], dtype=int)
+    rows = np.arange(len(flat))
+    for _ in range(N):
+        best = flat.reshape(len(flat), -1).argmax(axis=1)
+        old, new = np.divmod(best, N)
+        order[rows, old] = new
+        flat[rows, old, :] = -1.0
+        flat[rows, :, new] = -1.0
+    return order.reshape(overlaps.shape[:-1])
+
+
+def track(evals, evecs, Ct0, tref, t0index=None):
+    """ Order the levels consistently across the times (axis -3 of
+    evecs). At the time index tref they are ordered by decreasing
+    eigenvalue. Moving away from tref each level follows the eigenvector
+    with the largest overlap, in the C(t0) inner product, with its vector
+    on the previous time. On t0 itself the problem is degenerate, so its
+    vectors are never used as the previous time."""
+    evals, evecs = evals.copy(), evecs.copy()
+    N = evals.shape[-1]
+    descending = np.broadcast_to(np.arange(N)[::-1], evals[..., tref, :].shape)
+    evals[..., tref, :], evecs[..., tref, :, :] = reorder(evals[..., tref, :], evecs[..., tref, :, :],
+                                                          descending)
+    metric = np.matmul(hermitian(Ct0), evecs[..., tref, :, :])
+    times = evals.shape[-2]
+    for steps in (range(tref+1, times), range(tref-1, -1, -1)):
+        previous = metric
+        for t in steps:
+            overlaps = np.abs(np.matmul(np.conj(np.swapaxes(previous, -1, -2)), evecs[..., t, :, :]))**2
+            order = match_levels(overlaps)
+            evals[..., t, :], evecs[..., t, :, :] = reorder(evals[..., t, :], evecs[..., t, :, :], order)
+            if t != t0index:
+                previous = np.matmul(hermitian(Ct0), evecs[..., t, :, :])
+    return evals, evecs
+
+
+def align(evals, evecs, reference, Ct0):
+    """ Match the levels of eigenvalues (... x N) and eigenvectors
+    (... x N x N) to the columns of reference (N x N). Each reference
+    level takes the vector with the largest overlap v_ref^H C(t0) v, and
+    that vector's phase is chosen to make the overlap real and positive"""
+    overlaps = np.matmul(np.conj(reference.T), np.matmul(Ct0, evecs))
+    order = match_levels(np.abs(overlaps)**2)
+    evals, evecs = reorder(evals, evecs, order)
+    matched = np.take_along_axis(overlaps, order[..., np.newaxis, :], axis=-1)
+    matched = np.diagonal(matched, axis1=-2, axis2=-1)
+    return evals, evecs*np.exp(-1j*np.angle(matched))[..., np.newaxis, :]
+
+
+def principal_correlators(C, t0index, tref=None):
+    """ The tracked eigenvalues and eigenvectors of (... x time x N x N)
+    matrices C with the reference time t0index. Levels are ordered by
+    decreasing eigenvalue at tref, which defaults to the time after t0"""
+    if tref is None:
+        tref = t0index + 1 if t0index + 1 < C.shape[-3] else t0index
+    Ct0 = C[..., t0index, :, :]
+    evals, evecs = solve(C, Ct0)
+    return track(evals, evecs, Ct0, tref, t0index)
+
+
+def resampled_errors(replicas, jackknife=False):
+    """ Errors from the spread of the values on each resample, the
+    first axis of replicas. Resamples which failed (NaN) are left out"""
+    good = np.isfinite(replicas).all(axis=tuple(range(1, np.ndim(replicas))))
+    if not good.all():
+        logging.warn("leaving out {} failed resamples".format((~good).sum()))
+    factor = np.sqrt(good.sum()-1) if jackknife else 1
+    return factor * np.std(replicas[good], 0)
+
+
+def resampled_principal_correlators(cormatrix, t0, tref=None, jackknife=False, bootstraps=NBOOTSTRAPS):
+    """ The principal correlators of the config averaged matrix along with
+    their errors from the jackknife or bootstrap resamples of the configs.
+    The ensemble average and all the resamples are solved as one batch.
+    Returns the eigenvalues (time x N), their errors and the eigenvalues
+    of every resample (resample x time x N)"""
+    if jackknife:
+        replicas = cormatrix.jackknife_means()
+    else:
+        replicas = cormatrix.bootstrap_means(bootstraps)
+    matrices = np.concatenate([cormatrix.mean()[np.newaxis], replicas])
+    t0index = cormatrix.timeindex(t0)
+    if tref is not None:
+        tref = cormatrix.timeindex(tref)
+    logging.info("solving GEVP for {} resamples".format(len(replicas)))
+    evals, _ = principal_correlators(matrices, t0index, tref)
+    return evals[0], resampled_errors(evals[1:], jackknife), evals[1:]
+
+
+def resampled_rotations(cormatrix, t0, td, jackknife=False, bootstraps=NBOOTSTRAPS):
+    """ Solve the GEVP at td with reference time t0 on the config averaged
+    matrix and on every jackknife or bootstrap resample as one batch. The
+    levels are ordered by decreasing eigenvalue on the average, with the
+    largest component of each eigenvector real and positive, and the
+    levels and phases of each resample are matched to those. Returns the
+    eigenvalues and eigenvectors of the average, those of each resample
+    and the (resample x time x N x N) resampled averages"""
+    if jackknife:
+        replicas = cormatrix.jackknife_means()
+    else:
+        replicas = cormatrix.bootstrap_means(bootstraps)
+    slices = [cormatrix.timeindex(t0), cormatrix.timeindex(td)]
+    matrices = np.concatenate([cormatrix.mean()[np.newaxis, slices], replicas[:, slices]])
+    logging.info("diagonalizing {} resamples".format(len(replicas)))
+    evals, evecs = solve(matrices[:, 1:], matrices[:, 0])
+    evals, evecs = evals[:, 0], evecs[:, 0]
+
+    N = len(cormatrix)
+    evals0, evecs0 = reorder(evals[0], evecs[0], np.arange(N)[::-1])
+    largest = evecs0[np.abs(evecs0).argmax(axis=0), np.arange(N)]
+    evecs0 = evecs0*np.exp(-1j*np.angle(largest))
+    evals, evecs = align(evals[1:], evecs[1:], evecs0, hermitian(matrices[1:, 0]))
+    return evals0, evecs0, evals, evecs, replicas
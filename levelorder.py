@@ -4,6 +4,8 @@ import argparse
 import re
 import os
 import glob
+import fnmatch
+import fitstore
 
 def print_results(results):
     for r in results:
@@ -48,10 +50,32 @@ def format_fit_results(filewild):
     print_order(results)
 
 
+def format_stored_results(filewild, store):
+    """ format_fit_results from the fit store, for the fits whose
+    filestubs match filewild"""
+    results = []
+    pattern = os.path.abspath(os.path.splitext(filewild.format("*"))[0])
+    for filestub, info in fitstore.by_filestub(store).iteritems():
+        if not fnmatch.fnmatch(filestub, pattern):
+            continue
+        fitted = fitstore.results(info)
+        if "mass" not in fitted or "amp" not in fitted:
+            logging.debug("Fit {} does not have mass and amp".format(filestub))
+            continue
+        comment = ""
+        if "mass2" not in fitted:
+            comment = " # single exp fit"
+        level = int(re.search(r'level(\d+)', filestub).group(1))
+        results.append((level, fitted["amp"][0], fitted["amp"][1], fitted["mass"][0], fitted["mass"][1], comment))
+    print_order(sorted(results))
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="combine fit results to many levels into a single file")
     parser.add_argument("-v", "--verbose", action="store_true",
                         help="increase output verbosity")
+    parser.add_argument("--store", type=str, required=False,
+                        help="read the results from this fit store instead of the output files")
     parser.add_argument('filewild', metavar='f', type=str, help='wildcard for fit outputs')
     args = parser.parse_args()
 
@@ -61,4 +85,7 @@ if __name__ == "__main__":
     else:
         logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 
-    format_fit_results(args.filewild)
+    if args.store:
+        format_stored_results(args.filewild, args.store)
+    else:
+        format_fit_results(args.filewild)
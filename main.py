@@ -8,12 +8,14 @@ import sys
 import determine_operators
 import fit
 import inspect
+import correlator
+from cormatrix import CorrelatorMatrix
 
 function_list = inspect.getmembers(sys.modules["fitfunctions"], inspect.isclass)
 functions = {name: f for name, f in function_list}
 
 parser = argparse.ArgumentParser(description="compute and plot effective masses")
-parser.add_argument("-i", "--input-dir", type=str, required=True,
+parser.add_argument("-i", "--input-dir", type=str, required=False,
                     help="directory to read files from")
 parser.add_argument("-o", "--output-dir", type=str, required=True,
                     help="directory to write plots to")
@@ -22,6 +24,8 @@ parser.add_argument("-ob", "--output-bins", type=str, required=False,
 parser.add_argument("-r", "--operators", action='append', required=False,
                     help="operator to make \n\n e.g. -r a1pp_0_optype0_op1")
 parser.add_argument("-b", "--bins", type=int, default=1, help="number of bins")
+parser.add_argument("--auto-bins", action="store_true",
+                    help="choose the bin size for each correlator where the errors plateau")
 parser.add_argument("-m", "--make-from-operators",
                     help="build from operators rather than correlator files", action="store_true")
 parser.add_argument("--off-diagonals", action="store_true",
@@ -38,6 +42,9 @@ parser.add_argument("-fv", "--format-vev", type=str, required=False,
                     "e.g. {}-A1gp.conn.vev where {} are replaced with operator strings"
                     "Defaults to '{}.vev'",
                     default=None)
+parser.add_argument("--cormatrix", type=str, required=False,
+                    help="read the correlators from a binary correlator matrix file, "
+                    "as written by diagonalize.py --binary, instead of the input files")
 parser.add_argument("-nv", "--no-vev", action="store_true", required=False,
                     help="Specify no vev so should be set to zeros\n")
 parser.add_argument("-dt", "--delta-t", nargs='+', required=False, default=[1, 3], type=int,
@@ -53,49 +60,71 @@ parser.add_argument("-c", "--configs", type=int, required=False, help="specify t
 parser.add_argument("-t", "--times", required=False, type=int, help="specify the times to be used\n")
 
 
-args = parser.parse_args()
+args = None
+funct = None
+cormatrix = None
+cor_template = None
+vev_template = None
 
-if args.fit:
-    raise DeprecationWarning("Fit no long works (plotting fits was reworked)")
-    funct = functions[args.function](Nt=args.period)
 
-if not args.operators:
-    print "Operators not specified, attempting to automagically determine"
-    ops = determine_operators.matching_operators(args.input_dir, args.format)
-    print ops
-    if not ops:
-        print "Error: no operators found"
+def setup(options, matrix=None):
+    """Check the parsed options and set them for the analysis. matrix is a
+    CorrelatorMatrix to analyze in memory instead of reading files"""
+    global args, cormatrix, cor_template, vev_template, funct
+    args = options
+
+    if args.fit:
+        raise DeprecationWarning("Fit no long works (plotting fits was reworked)")
+        funct = functions[args.function](Nt=args.period)
+
+    cormatrix = matrix
+    if cormatrix is None and args.cormatrix:
+        cormatrix = CorrelatorMatrix.load(args.cormatrix)
+    if cormatrix is not None and not args.operators:
+        args.operators = map(str, cormatrix.ops)
+
+    if cormatrix is None and not args.input_dir:
+        print "Error: must specify an input directory or a correlator matrix"
         parser.print_help()
         parser.exit()
-    args.operators = ops
 
-cor_template = args.format
-if (not args.make_from_operators) and (not args.format_vev and not args.no_vev):
-    print "Error: must specify vev format or no-vev (-nv)"
-    parser.print_help()
-    print "\nError: must specify vev format or no-vev (-nv)"
-    parser.exit()
-vev_template = args.format_vev
-
-args.input_dir = os.path.normpath(args.input_dir) + os.sep
-args.output_dir = os.path.normpath(args.output_dir) + os.sep
+    if not args.operators:
+        print "Operators not specified, attempting to automagically determine"
+        ops = determine_operators.matching_operators(args.input_dir, args.format)
+        print ops
+        if not ops:
+            print "Error: no operators found"
+            parser.print_help()
+            parser.exit()
+        args.operators = ops
+
+    cor_template = args.format
+    if (not args.make_from_operators) and (not args.format_vev and not args.no_vev) and cormatrix is None:
+        print "Error: must specify vev format or no-vev (-nv)"
+        parser.print_help()
+        print "\nError: must specify vev format or no-vev (-nv)"
+        parser.exit()
+    vev_template = args.format_vev
 
-if not os.path.exists(args.input_dir):
-    print "input directory doesnt exist"
-    parser.print_help()
-    parser.exit()
+    if args.input_dir:
+        args.input_dir = os.path.normpath(args.input_dir) + os.sep
+    args.output_dir = os.path.normpath(args.output_dir) + os.sep
 
+    if cormatrix is None and not os.path.exists(args.input_dir):
+        print "input directory doesnt exist"
+        parser.print_help()
+        parser.exit()
 
-if not args.output_bins:
-    args.output_bins = args.output_dir
+    if not args.output_bins:
+        args.output_bins = args.output_dir
 
-if args.verbose:
-    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
-    logging.debug("Verbose debuging mode activated")
-else:
-    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+    if args.verbose:
+        logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
+        logging.debug("Verbose debuging mode activated")
+    else:
+        logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 
-logging.info("Running with operators" + str([x.strip() for x in args.operators]))
+    logging.info("Running with operators" + str([x.strip() for x in args.operators]))
 
 
 def main():
@@ -111,19 +140,20 @@ def main():
             else:
                 correlator = diagonal_file(args.input_dir, oper)
 
-            if args.bins > 1:
-                correlator = correlator.reduce_to_bins(args.bins)
-                correlator.writefullfile(args.output_bins + "binned_%d_%s" % (args.bins, oper))
+            bins = correlator.auto_bin_size() if args.auto_bins else args.bins
+            if bins > 1:
+                correlator = correlator.reduce_to_bins(bins)
+                correlator.writefullfile(args.output_bins + "binned_%d_%s" % (bins, oper))
             if args.fit:
                 try:
                     correlator.prune_invalid(delete=True)
                     fitparams = fit.auto_fit(funct, correlator, return_quality=True)
-                    plot_corr(correlator, args.output_dir, oper, fitparams)
+                    plot_corr(correlator, args.output_dir, oper, fitparams, options=args)
                 except RuntimeError:
                     logging.error("could not fit, skipping fit")
-                    plot_corr(correlator, args.output_dir, oper)
+                    plot_corr(correlator, args.output_dir, oper, options=args)
             else:
-                plot_corr(correlator, args.output_dir, oper)
+                plot_corr(correlator, args.output_dir, oper, options=args)
             logging.info("done with %s %s to %s\n---\n", oper, oper, args.output_dir)
     else:
         for src_oper in args.operators:
@@ -134,22 +164,28 @@ def main():
                     else:
                         correlator = off_diagonal_file(args.input_dir, src_oper, snk_oper)
 
-                    if args.bins > 1:
-                        binedcor = correlator.reduce_to_bins(args.bins)
-                        plot_corr(binedcor, args.output_dir, src_oper + snk_oper)
+                    bins = correlator.auto_bin_size() if args.auto_bins else args.bins
+                    if bins > 1:
+                        binedcor = correlator.reduce_to_bins(bins)
+                        plot_corr(binedcor, args.output_dir, src_oper + snk_oper, options=args)
                         binedcor.writefullfile(args.output_bins + "binned_%d_%s_%s" %
-                                               (args.bins, src_oper, snk_oper))
+                                               (bins, src_oper, snk_oper))
                     else:
-                        plot_corr(correlator, args.output_dir, src_oper + snk_oper)
+                        plot_corr(correlator, args.output_dir, src_oper + snk_oper, options=args)
                     logging.info("done with %s %s to %s\n---\n", src_oper, snk_oper, args.output_dir)
                 except IOError:
                     logging.error("File not found for {} and {}\nContinuing".format(src_oper, snk_oper))
                     continue
 
 
-def plot_corr(corr, out_folder, name, fitparams=None):
+def plot_corr(corr, out_folder, name, fitparams=None, options=None):
+    """ Plot the correlator and its effective masses into out_folder. The
+    options default to those given to setup, or the parser defaults when
+    setup was never called"""
+    if options is None:
+        options = args if args is not None else parser.parse_args(["-o", out_folder])
 
-    if args.prune:
+    if options.prune:
         corr.prune_invalid()
 
     avgcorr = corr.average_sub_vev()
@@ -159,10 +195,12 @@ def plot_corr(corr, out_folder, name, fitparams=None):
     plot.plotwitherrorbarsnames("%scorrelator.%s" % (out_folder, name),
                                 plot_corr_info, avgcorr.keys(), autoscale=True)
 
-    emass_dts = args.delta_t
+    emass_dts = options.delta_t
+    emasses = corr.effective_masses(emass_dts)
+    if options.periodic:
+        cosh_emasses = corr.effective_masses(emass_dts, kind=corr.periodic_kind())
     for dt in emass_dts:
-        emass = corr.effective_mass(dt)
-        emass_errors = corr.effective_mass_errors(dt)
+        emass, emass_errors = emasses[dt]
         plot_emass = {"%s emass dt=%d, \t error" % (name, dt): (emass, emass_errors)}
         if fitparams:
             fitcomment = "fit({},{}) m={} e={} qual:{}\n".format(fitparams[0], fitparams[1],
@@ -173,9 +211,8 @@ def plot_corr(corr, out_folder, name, fitparams=None):
         plot.plotwitherrorbarsnames("%semass%d.%s" % (out_folder, dt, name),  plot_emass,
                                     emass.keys(), autoscale=True, addcomment=fitcomment)
 
-        if args.periodic:             # Do it all again with periodic
-            cosh_emass = corr.periodic_effective_mass(dt)
-            cosh_emass_errors = corr.periodic_effective_mass_errors(dt)
+        if options.periodic:          # Do it all again with periodic
+            cosh_emass, cosh_emass_errors = cosh_emasses[dt]
             plot_cosh_emass = {"%s cosh_emass dt=%d, \t error" % (name, dt): (cosh_emass, cosh_emass_errors)}
             plot.plotwitherrorbarsnames("%scosh_emass%d.%s" % (out_folder, dt, name),  plot_cosh_emass,
                                         cosh_emass.keys(), autoscale=True)
@@ -211,7 +248,16 @@ def off_diagonal_ops(data_folder, src_op, snk_op):
     return build_corr.from_opfiles(srcop_file, snkop_file)
 
 
+def matrix_element(snk_op, src_op):
+    """correlator of one element of the binary correlator matrix, like the
+    text files only the real part is used"""
+    return correlator.Correlator.fromArrays(cormatrix.element(snk_op, src_op).real, None, None,
+                                            configs=cormatrix.configs, times=cormatrix.times)
+
+
 def diagonal_file(data_folder, op):
+    if cormatrix is not None:
+        return matrix_element(op, op)
     corrfile = data_folder + cor_template.format(op, op)
     if(args.no_vev):
         return build_corr.corr_and_vev_from_files(corrfile, cfgs=args.configs, ts=args.times)
@@ -221,6 +267,8 @@ def diagonal_file(data_folder, op):
 
 
 def off_diagonal_file(data_folder, src_op, snk_op):
+    if cormatrix is not None:
+        return matrix_element(src_op, snk_op)
     corrfile = data_folder + cor_template.format(src_op, snk_op)
     if(args.no_vev):
         return build_corr.corr_and_vev_from_files(corrfile, cfgs=args.configs, ts=args.times)
@@ -230,4 +278,5 @@ def off_diagonal_file(data_folder, src_op, snk_op):
         return build_corr.corr_and_vev_from_files(corrfile, src_vev_file, snk_vev_file, cfgs=args.configs, ts=args.times)
 
 if __name__ == "__main__":
+    setup(parser.parse_args())
     main()
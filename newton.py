@@ -43,3 +43,44 @@ def newton_sinh_for_m(i, j, ave_cor, guess, T):
         return guess
     logging.debug("newtons method converged to {}".format(result))
     return result
+
+
+def newton_for_m_array(i, j, ratio, guess, T, anti=False, tol=1.48e-8, maxiter=50):
+    """ Solve the cosh (or sinh if anti) ratio equation for every element
+    of the arrays at once, i and j are the times and ratio the ratio of
+    the correlator at those times. Returns the masses and whether each
+    converged, elements that did not converge are left at the guess.
+    """
+    sign = -1.0 if anti else 1.0
+    i, j, ratio, guess = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (i, j, ratio, guess)])
+    m = guess.copy()
+    converged = np.zeros(m.shape, dtype=bool)
+    active = np.isfinite(m)
+
+    with np.errstate(all="ignore"):
+        for _ in range(maxiter):
+            if not active.any():
+                break
+            x, a, b = m[active], i[active], j[active]
+            numerator = np.exp(-x*a) + sign*np.exp(-x*(T-a))
+            dnumerator = -a*np.exp(-x*a) - sign*(T-a)*np.exp(-x*(T-a))
+            denominator = np.exp(-x*b) + sign*np.exp(-x*(T-b))
+            ddenominator = -b*np.exp(-x*b) - sign*(T-b)*np.exp(-x*(T-b))
+            f = numerator/denominator - ratio[active]
+            fprime = (dnumerator*denominator - numerator*ddenominator) / denominator**2
+            step = f / fprime
+
+            failed = ~np.isfinite(step)
+            done = np.abs(step) < tol
+            m[active] = x - np.where(failed, 0.0, step)
+            indexes = np.flatnonzero(active)
+            converged.flat[indexes[done & ~failed]] = True
+            active.flat[indexes[done | failed]] = False
+
+    failed = np.isfinite(guess) & ~converged
+    if failed.any():
+        logging.error("Newtons failed to converge (T={}) for {} of {}, "
+                      "using the guess for those".format(T, failed.sum(), failed.size))
+        m[failed] = guess[failed]
+    logging.debug("newtons method converged for {} of {}".format(converged.sum(), converged.size))
+    return m, converged
@@ -4,6 +4,8 @@ import pandas as pd
 import re
 import numpy as np
 from cStringIO import StringIO
+from itertools import islice
+import stream_reader
 
 import warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
@@ -11,6 +13,9 @@ warnings.simplefilter(action="ignore", category=FutureWarning)
 
 pair = re.compile(r'\(([^,\)]+),([^,\)]+)\)')
 
+# Lines tokenized at once when reading paren format files
+BLOCK_LINES = 100000
+
 
 def parse_pair(s):
     return complex(*map(float, pair.match(s).groups()))
@@ -58,15 +63,46 @@ def read_normal(filename):
         df = pd.read_csv(f, delimiter=',', names=["time", "correlator"])
     return df
 
+def read_paraenformat_array(filename, real=True):
+    """ Read a file of "t (re,im)" lines, one block of times per config,
+    into a (config x time) array. The lines are read and tokenized at once
+    a block of BLOCK_LINES at a time. Returns the times and the array"""
+    blocks = []
+    with open(filename) as f:
+        lines = stream_reader.data_lines(f)
+        while True:
+            block = list(islice(lines, BLOCK_LINES))
+            if not block:
+                break
+            if not blocks and "(" not in block[0]:
+                raise ValueError("{} is not in the paren complex format".format(filename))
+            blocks.append(stream_reader.parse_lines(block, True, 3))
+    if not blocks:
+        raise ValueError("{} is not in the paren complex format".format(filename))
+    values = np.concatenate(blocks)
+
+    alltimes = values[:, 0]
+    numtimes = len(np.unique(alltimes))
+    if len(alltimes) % numtimes:
+        raise ValueError("Inconsistant time counts!")
+    alltimes = alltimes.reshape(-1, numtimes)
+    if not (alltimes == alltimes[0]).all():
+        raise ValueError("Inconsistant times in configs!")
+    times = alltimes[0].astype(int).tolist()
+    logging.info("Read file, got {} configs and {} times".format(alltimes.shape[0], numtimes))
+
+    if real:
+        return times, values[:, 1].reshape(-1, numtimes)
+    return times, (values[:, 1] + 1j*values[:, 2]).reshape(-1, numtimes)
+
+
 def read_configcols_paraenformat(filename):
-    f = lines_without_comments(filename)
-    df = pd.read_csv(f, delimiter=' ', names=["time", "correlator"],
-                     converters={1: parse_pair})
-    grouped = df.groupby('time')
-    joined = df.groupby('time').apply(
-        lambda g: pd.Series(g['correlator'].values)
-    ).rename(columns=lambda x: 'correlator%s' % x)
-    return joined
+    times, array = read_paraenformat_array(filename, real=False)
+    order = np.argsort(times, kind="mergesort")
+    columns = ['correlator%s' % c for c in range(array.shape[0])]
+    return pd.DataFrame(array.T[order], index=pd.Index(np.array(times)[order], name="time"),
+                        columns=columns)
+
 
 def read_configcols_normal(filename):
     f = lines_without_comments(filename)
@@ -105,42 +141,8 @@ def read_single_time_commaformat(filename, t):
 
 
 def read_datadict_paraenformat_real(filename, real=True):
-    f = lines_without_comments(filename)
-    df = pd.read_csv(f, delimiter=' ', names=["time", "correlator"],
-                     converters={1: parse_pair})
-
-    if(real):
-        df = df.apply(np.real, reduce=False)  # Take the real part
-
-    vc = df.time.value_counts()
-    times = vc.index
-    time_counts = vc.values
-    df["config"] = pd.Series(map(lambda x: x/len(times), df.index))
-    vcc = df.config.value_counts()
-    cfgs = vcc.index
-    cfgs_counts = vcc.values
-
-    df = df.set_index("config")
-    df = df.set_index("time", append=True)
-
-    logging.info("Read file, got {} configs and {} times".format(time_counts[0], cfgs_counts[0]))
-
-    logging.debug("checking consistancy")
-    assert all(time_counts[0] == count for count in time_counts), "Inconsistant time counts!"
-    assert all(cfgs_counts[0] == count for count in cfgs_counts), "Inconsistant cfgs counts!"
-
-    data_dict = {}
-    for c in cfgs:
-        # data_dict[c] = {}
-        tmp_dict = {}
-        for t in times:
-            tmp_dict[t] = df.ix[(c, t)][0]
-
-        data_dict[c] = tmp_dict
-
-    return data_dict
-    # for row in df.iterrows():
-    #     print row
+    times, array = read_paraenformat_array(filename, real)
+    return {c: dict(zip(times, row)) for c, row in enumerate(array.tolist())}
 
 
 def read_datadict_commacomplex(filename, real=True):
@@ -74,10 +74,24 @@ fitparser.add_argument("--debug_noretry", action="store_true",
                        help="do not retry fit ")
 fitparser.add_argument("--debug_ignoreinverterror", action="store_true",
                        help="do not fail if invert fails")
+fitparser.add_argument("--evals", action="store_true",
+                       help="write the eigenvalues of each covariance matrix to the .evals file")
+fitparser.add_argument("--varpro", action="store_true",
+                       help="solve for the amplitudes by linear least squares so minuit only fits the masses")
+fitparser.add_argument("--gradient", action="store_true",
+                       help="give minuit the analytic gradient of the chi^2 instead of numerical derivatives")
+fitparser.add_argument("--batch", action="store_true",
+                       help="fit all of the straps at once with a vectorized Levenberg-Marquardt, using minuit only for those that fail")
 fitparser.add_argument("--jackknife", action="store_true",
                        help="jackknife instead of bootstrap")
 fitparser.add_argument("--bin", type=int, required=False,
                        help="bin the correlators first")
+fitparser.add_argument("--auto-bin", action="store_true",
+                       help="bin the correlators first with the smallest bin size at which the errors plateau")
+fitparser.add_argument("--store", type=str, required=False,
+                       help="directory of stored fit results, identical fits are loaded from it instead of refit")
+fitparser.add_argument("-j", "--jobs", type=int, default=1, required=False,
+                       help="number of processes to fit the bootstraps or fit ranges with")
 fitparser.add_argument("--tstride", type=int, default=1, required=False,
                        help="skip every N points")
 fitparser.add_argument("--nofallback", action="store_true",
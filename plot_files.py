@@ -62,7 +62,7 @@ def determine_type(txt):
 
 def read_full_correlator(filename, emass=None, eamp=False, symmetric=False):
     logging.info("reading file {}".format(filename))
-    cor = build_corr.corr_and_vev_from_pickle(filename, None, None)
+    cor = build_corr.corr_and_vev_from_cache(filename, None, None)
     logging.info("File read.")
 
     if symmetric:
@@ -125,13 +125,11 @@ def guess_dimensions(rawdata):
     if(rawdata[0][0] != 0):
         raise Exception("does not start on time 0 can not guess")
 
-    time = 0
-    for datum in rawdata:
-        if(datum[0] == time):
-            time += 1
-        elif(datum[0] == 0):
-            configs = ((rawdata.shape[0]) / time)
-            logging.debug("guessing time = %d \tguessing configs = %d", time, configs)
-            return (time, configs)
-        else:
-            raise Exception("number of times could not be guessed")
+    times = rawdata[rawdata.dtype.names[0]]
+    restarts = np.flatnonzero(times == 0)
+    time = restarts[1] if len(restarts) > 1 else len(times)
+    if not np.array_equal(times[:time], np.arange(time)):
+        raise Exception("number of times could not be guessed")
+    configs = ((rawdata.shape[0]) / time)
+    logging.debug("guessing time = %d \tguessing configs = %d", time, configs)
+    return (time, configs)
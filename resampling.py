@@ -0,0 +1,158 @@
+import numpy as np
+import logging
+import correlator
+
+NBOOTSTRAPS = 1000
+
+
+def resample_weights(indexes, n):
+    """ (resample x config) array of the number of times each of the n
+    configs appears in each row of indexes"""
+    N = len(indexes)
+    offsets = indexes + n*np.arange(N)[:, np.newaxis]
+    return np.bincount(offsets.ravel(), minlength=N*n).reshape(N, n).astype(float)
+
+
+def bootstrap_weights(n, N=NBOOTSTRAPS):
+    """ The weights of N resamples of n configs drawn with replacement"""
+    return resample_weights(np.random.choice(n, size=(N, n)), n)
+
+
+class Resamples(object):
+    """ A set of resamples of a correlator. Each resample is a row of
+    weights giving the number of times each config is used, so the
+    averages and covariance matrices of every resample are computed at
+    once as array operations instead of building a new correlator for
+    each one.
+    """
+
+    def __init__(self, cor, indexes):
+        self.cor = cor
+        self.indexes = np.asarray(indexes, dtype=int)
+        self.N = len(self.indexes)
+        n = cor.numconfigs
+        self.weights = resample_weights(self.indexes, n)
+        self.sizes = self.weights.sum(axis=1)
+
+        if cor.vev1 is None:
+            self.vev1 = self.vev2 = None
+            self.vevs = np.zeros(self.N)
+        else:
+            self.vev1 = np.array([cor.vev1[c] for c in cor.configs])
+            self.vev2 = np.array([cor.vev2[c] for c in cor.configs])
+            self.vevs = (self.weights.dot(self.vev1)/self.sizes) * (self.weights.dot(self.vev2)/self.sizes)
+        logging.debug("created %d resamples of %d configs", self.N, n)
+
+    @classmethod
+    def bootstrap(cls, cor, N=NBOOTSTRAPS):
+        """ N resamples of the configs drawn with replacement """
+        n = cor.numconfigs
+        return cls(cor, np.random.choice(n, size=(N, n)))
+
+    @classmethod
+    def jackknife(cls, cor):
+        """ The resamples with each config left out in turn """
+        return Jackknife(cor)
+
+    @classmethod
+    def single(cls, cor):
+        """ The full ensemble as the only resample """
+        return cls(cor, [np.arange(cor.numconfigs)])
+
+    def __len__(self):
+        return self.N
+
+    def timeslices(self, times):
+        cols = [self.cor.timeindex[t] for t in times]
+        return self.cor.array[:, cols].reshape(self.cor.numconfigs, len(cols))
+
+    def averages(self, times):
+        """ (resample x time) array of the vev subtracted averages """
+        data = self.timeslices(times)
+        return self.weights.dot(data)/self.sizes[:, np.newaxis] - self.vevs[:, np.newaxis]
+
+    def covariances(self, times):
+        """ (resample x time x time) array of the covariance matrix of the
+        average for each resample, matches fit.covariance_matrix """
+        data = self.timeslices(times)
+        T = len(times)
+        # Center on the full ensemble mean first to keep the sums of
+        # squares from losing precision
+        centered = data - data.mean(axis=0)
+        means = self.weights.dot(centered)/self.sizes[:, np.newaxis]
+        squares = self.weights.dot((centered[:, :, np.newaxis]*centered[:, np.newaxis, :]).reshape(-1, T*T))
+        squares = squares.reshape(self.N, T, T)
+        n = self.sizes[:, np.newaxis, np.newaxis]
+        # The deviations are taken from the vev subtracted average, so
+        # the vevs show up as a constant offset
+        offset = np.ones(T) * self.vevs[:, np.newaxis]
+        squares += n * (offset[:, :, np.newaxis]*offset[:, np.newaxis, :] -
+                        means[:, :, np.newaxis]*means[:, np.newaxis, :])
+        return squares / (n * (n - 1.0))
+
+    def members(self, i):
+        """ Indexes of the configs in resample i """
+        return self.indexes[i]
+
+    def configs(self, i):
+        return [self.cor.configs[c] for c in self.members(i)]
+
+    def correlator(self, i):
+        """ Build the correlator for a single resample, only needed when
+        the full correlator methods are required """
+        cfgs = self.members(i)
+        if self.vev1 is None:
+            vev1 = vev2 = None
+        else:
+            vev1 = self.vev1[cfgs]
+            vev2 = self.vev2[cfgs]
+        return correlator.Correlator.fromArrays(self.cor.as_array()[cfgs], vev1, vev2,
+                                                times=self.cor.times)
+
+    def writestraps(self, filename):
+        with open(filename, 'w') as bootfile:
+            bootfile.write("# boot straps used for fitting")
+            for i in range(self.N):
+                bootfile.write(",".join([str(c) for c in self.configs(i)]))
+                bootfile.write("\n")
+
+
+class Jackknife(Resamples):
+    """ The resamples with each config left out in turn. Everything is
+    found from the totals over all the configs by taking each config back
+    out (a rank one downdate for the covariances), so no weights or
+    config lists of size configs x configs are built.
+    """
+
+    def __init__(self, cor):
+        self.cor = cor
+        n = cor.numconfigs
+        self.N = n
+        self.sizes = np.full(n, n - 1.0)
+        if cor.vev1 is None:
+            self.vev1 = self.vev2 = None
+            self.vevs = np.zeros(n)
+        else:
+            self.vev1 = np.array([cor.vev1[c] for c in cor.configs])
+            self.vev2 = np.array([cor.vev2[c] for c in cor.configs])
+            self.vevs = ((self.vev1.sum() - self.vev1)/(n - 1.0)) * ((self.vev2.sum() - self.vev2)/(n - 1.0))
+        logging.debug("created %d jackknife resamples", n)
+
+    def members(self, i):
+        return np.delete(np.arange(self.N), i)
+
+    def averages(self, times):
+        data = self.timeslices(times)
+        return (data.sum(axis=0) - data)/(self.N - 1.0) - self.vevs[:, np.newaxis]
+
+    def covariances(self, times):
+        data = self.timeslices(times)
+        T = len(times)
+        n = self.N - 1.0
+        centered = data - data.mean(axis=0)
+        means = (centered.sum(axis=0) - centered)/n
+        squares = centered.T.dot(centered) - centered[:, :, np.newaxis]*centered[:, np.newaxis, :]
+        offset = np.ones(T) * self.vevs[:, np.newaxis]
+        squares += n * (offset[:, :, np.newaxis]*offset[:, np.newaxis, :] -
+                        means[:, :, np.newaxis]*means[:, np.newaxis, :])
+        return squares / (n * (n - 1.0))
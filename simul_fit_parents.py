@@ -1,10 +1,10 @@
 import numpy as np
-from iminuit import Minuit
 
 from fit_parents import mass_bounds, amp_bounds, const_bounds
 
 class sharedmass_amp(object):
-    """Parent class for functions which take a mass and an amplitude"""
+    """Parent class for functions which take a shared mass and an
+    amplitude for each correlator"""
     def __init__(self):
         self.starting_guess = self.thisguess
         self.bounds = [mass_bounds, amp_bounds, amp_bounds]
@@ -12,42 +12,37 @@ class sharedmass_amp(object):
         self.subtract = False
         self.stride = 1
 
+    def setranges(self, ranges):
+        super(sharedmass_amp, self).setranges(ranges)
+        if ranges is not None:
+            self.bounds = [mass_bounds] + [amp_bounds]*len(ranges)
+            self.parameter_names = ["mass"] + ["amp{}".format(i+1) for i in range(len(ranges))]
+
     def thisguess(self, cor, period, *args):
         dt = 1
         ave = cor.average_sub_vev()
         emass = cor.periodic_effective_mass(dt, fast=True, period=period)
         mass_guess = np.mean([emass[i[1]-dt-1] for i in self.indexes])
 
-        mid1 = (self.indexes[0][0]+self.indexes[0][1])/2
-        mid2 = (self.indexes[1][0]+self.indexes[1][1])/2
-        rmid1 = (self.ranges[0][0]+self.ranges[0][1])/2
-        rmid2 = (self.ranges[1][0]+self.ranges[1][1])/2
-        amp_guess1 = ave[mid1]*np.exp(mass_guess*(rmid1))
-        amp_guess2 = ave[mid2]*np.exp(mass_guess*(rmid2))
-        return [mass_guess, amp_guess1, amp_guess2]
+        amp_guesses = []
+        for i, r in zip(self.indexes, self.ranges):
+            mid = (i[0]+i[1])/2
+            rmid = (r[0]+r[1])/2
+            amp_guesses.append(ave[mid]*np.exp(mass_guess*(rmid)))
+        return [mass_guess] + amp_guesses
 
 
-    def my_cov_fun(self, mass, amp1, amp2):
-        vect = self.aoc - self.formula((mass, amp1, amp2), self.times)
-        return vect.dot(self.inv_cov).dot(vect)
-
     def valid(self, *kargs):
         return True
 
-    def custom_minuit(self, data, invmatrix, times, guess):
-        self.aoc = data
-        self.inv_cov = invmatrix
-        self.times = times
-        dof = len(guess)+len(data)
-        m = Minuit(self.my_cov_fun, mass=guess[0], error_mass=guess[0]*0.1,
-                   amp1=guess[1], error_amp1=guess[1]*0.1,
-                   amp2=guess[2], error_amp2=guess[2]*0.1,
-                   errordef=1.0,
-                   print_level=0, pedantic=True)
-        return m
+    def minuit_options(self, guess):
+        options = {"error_"+name: g*0.1 for name, g in zip(self.parameter_names, guess)}
+        options.update(errordef=1.0, print_level=0, pedantic=True)
+        return options
 
 class shared_twice_mass_amp(object):
-    """Parent class for functions which take a mass and an amplitude"""
+    """Parent class for functions which take two shared masses and two
+    amplitudes for each correlator"""
     def __init__(self):
         self.starting_guess = self.thisguess
         self.bounds = [mass_bounds, amp_bounds, amp_bounds, mass_bounds, amp_bounds, amp_bounds]
@@ -55,6 +50,14 @@ class shared_twice_mass_amp(object):
         self.subtract = False
         self.stride = 1
 
+    def setranges(self, ranges):
+        super(shared_twice_mass_amp, self).setranges(ranges)
+        if ranges is not None:
+            K = len(ranges)
+            self.bounds = ([mass_bounds] + [amp_bounds]*K)*2
+            self.parameter_names = (["massa"] + ["amp{}a".format(i+1) for i in range(K)] +
+                                    ["massb"] + ["amp{}b".format(i+1) for i in range(K)])
+
     def thisguess(self, cor, period, *args):
         dt = 1
         ave = cor.average_sub_vev()
@@ -62,38 +65,28 @@ class shared_twice_mass_amp(object):
         massa_guess = np.mean([emass[i[1]-dt-1] for i in self.indexes])
         massb_guess = massa_guess
 
-        amp_guess1a = ave[self.indexes[0][0]]*np.exp(massa_guess*(self.ranges[0][0]))
-        amp_guess2a = ave[self.indexes[1][0]]*np.exp(massa_guess*(self.ranges[1][0]))
-        amp_guess1b = ave[self.indexes[0][0]]*np.exp(massb_guess*(self.ranges[0][0]))
-        amp_guess2b = ave[self.indexes[1][0]]*np.exp(massb_guess*(self.ranges[1][0]))
-        return [massa_guess, amp_guess1a, amp_guess2a, massb_guess, amp_guess1b, amp_guess2b]
-
+        amp_guessesa = [ave[i[0]]*np.exp(massa_guess*(r[0])) for i, r in zip(self.indexes, self.ranges)]
+        amp_guessesb = [ave[i[0]]*np.exp(massb_guess*(r[0])) for i, r in zip(self.indexes, self.ranges)]
+        return [massa_guess] + amp_guessesa + [massb_guess] + amp_guessesb
 
-    def my_cov_fun(self, massa, amp1a, amp2a, massb, amp1b, amp2b):
-        vect = self.aoc - self.formula((massa, amp1a, amp2a, massb, amp1b, amp2b), self.times)
-        return vect.dot(self.inv_cov).dot(vect)
 
     def valid(self, *kargs):
         return True
 
-    def custom_minuit(self, data, invmatrix, times, guess):
-        self.aoc = data
-        self.inv_cov = invmatrix
-        self.times = times
-        dof = len(guess)+len(data)
-        m = Minuit(self.my_cov_fun, massa=guess[0], error_massa=guess[0]*0.1,
-                   amp1a=guess[1], error_amp1a=guess[1]*0.1,
-                   amp2a=guess[2], error_amp2a=guess[2]*0.1,
-                   massb=guess[0], error_massb=guess[0]*0.1,
-                   amp1b=guess[1], error_amp1b=guess[1]*0.1,
-                   amp2b=guess[2], error_amp2b=guess[2]*0.1,
-                   errordef=1.0,
-                   print_level=0, pedantic=True)
-        return m
+    def minuit_options(self, guess):
+        options = {"error_"+name: g*0.1 for name, g in zip(self.parameter_names, guess)}
+        options.update(errordef=1.0, print_level=0, pedantic=True)
+        return options
 
 
 class multirange(object):
-    """ Parent class for functions which are periodic and need to know the time extent"""
+    """ Parent class for functions fit to a JointCorrelator, ranges are the
+    (tmin, tmax) of each correlator and indexes where they are in the
+    joint times. The times fit in each block, with the stride, are
+    precomputed in tx along with the block of each point"""
+    ranges = None
+    _stride = 1
+
     def setranges(self, ranges):
         self.ranges = ranges
         indexes = []
@@ -103,3 +96,120 @@ class multirange(object):
             indexes.append((prev, prev+length))
             prev = prev+length+1
         self.indexes = indexes
+        self.setblocks()
+
+    @property
+    def stride(self):
+        return self._stride
+
+    @stride.setter
+    def stride(self, stride):
+        self._stride = stride
+        self.setblocks()
+
+    def setblocks(self):
+        if self.ranges is None:
+            return
+        blocktimes = [np.arange(r[0], r[1]+1, self.stride) for r in self.ranges]
+        self.tx = np.concatenate(blocktimes)
+        self.blocks = np.repeat(np.arange(len(blocktimes)), [len(b) for b in blocktimes])
+
+    def per_block(self, values):
+        """ Spread one value per block over the points of the joint fit.
+        The values can also be (samples x 1) columns for batched fits"""
+        return np.concatenate([np.atleast_1d(v) for v in values], axis=-1)[..., self.blocks]
+
+
+class tied(multirange):
+    """ Any fitfunctions model fit to several correlators at once. The
+    parameters named in shared are the same for every correlator, each
+    of the others gets a copy per correlator numbered from 1, e.g.
+    tying periodic_exp with the mass shared fits mass, amp1, amp2, ...
+    Names already ending in a number are numbered as amp2_1, amp2_2, ...
+    """
+    def __init__(self, model, ranges, shared=("mass",)):
+        unknown = set(shared) - set(model.parameter_names)
+        if unknown:
+            raise ValueError("{} has no parameters {}".format(model.description, sorted(unknown)))
+        self.model = model
+        self.shared = [name for name in model.parameter_names if name in shared]
+        self.Nt = getattr(model, "Nt", None)
+        self.subtract = False
+        self.multi = True
+        self.description = "tied-" + model.description
+        self.starting_guess = self.thisguess
+        self.setranges(ranges)
+
+    def setranges(self, ranges):
+        super(tied, self).setranges(ranges)
+        self.parameter_names = []
+        self.bounds = []
+        self.columns = []
+        for name, bound in zip(self.model.parameter_names, self.model.bounds):
+            self.columns.append(len(self.parameter_names))
+            if name in self.shared:
+                self.parameter_names.append(name)
+                self.bounds.append(bound)
+            else:
+                self.parameter_names.extend(self.copy_name(name, i) for i in range(len(ranges)))
+                self.bounds.extend([bound]*len(ranges))
+        self.template = ", ".join("{}{{{}: f}}".format(name, i) for i, name in enumerate(self.parameter_names))
+
+    def copy_name(self, name, i):
+        if name[-1].isdigit():
+            return "{}_{}".format(name, i+1)
+        return "{}{}".format(name, i+1)
+
+    def model_params(self, v):
+        """ The model parameters at every point of the joint fit"""
+        K = len(self.ranges)
+        return [v[c] if name in self.shared else self.per_block(v[c:c+K])
+                for name, c in zip(self.model.parameter_names, self.columns)]
+
+    def block_params(self, v, i):
+        """ The model parameters of correlator i"""
+        return [v[c] if name in self.shared else v[c+i]
+                for name, c in zip(self.model.parameter_names, self.columns)]
+
+    def formula(self, v, x):
+        return self.model.formula(self.model_params(v), self.tx)
+
+    def jacobian(self, v, x):
+        modeljac = self.model.jacobian(self.model_params(v), self.tx)
+        jac = np.zeros(modeljac.shape[:-1] + (len(self.parameter_names),))
+        rows = np.arange(len(self.tx))
+        for j, (name, c) in enumerate(zip(self.model.parameter_names, self.columns)):
+            if name in self.shared:
+                jac[..., c] = modeljac[..., j]
+            else:
+                jac[..., rows, c + self.blocks] = modeljac[..., j]
+        return jac
+
+    def thisguess(self, cor, period, *args):
+        """ Guess each correlator of the JointCorrelator on its own, the
+        shared parameters start from the average of those guesses"""
+        guesses = np.array([self.model.starting_guess(c, period, tmax, tmin)
+                            for c, (tmin, tmax) in zip(cor.correlators, self.ranges)])
+        params = []
+        for j, name in enumerate(self.model.parameter_names):
+            if name in self.shared:
+                params.append(np.mean(guesses[:, j]))
+            else:
+                params.extend(guesses[:, j])
+        return params
+
+    def valid(self, params):
+        return all(self.model.valid(self.block_params(params, i)) for i in range(len(self.ranges)))
+
+    def minuit_options(self, guess):
+        """ The model options for each correlator, with those of the per
+        correlator parameters renamed to their copies"""
+        options = {}
+        for i in range(len(self.ranges)):
+            for key, value in self.model.minuit_options(self.block_params(guess, i)).iteritems():
+                prefix, _, name = key.partition("_")
+                if prefix in ("error", "limit", "fix") and name in self.model.parameter_names and name not in self.shared:
+                    options["{}_{}".format(prefix, self.copy_name(name, i))] = value
+                else:
+                    options.setdefault(key, value)
+        return options
@@ -10,19 +10,19 @@ class twocor_periodic_twoexp(sfp.shared_twice_mass_amp, fp.periodic, sfp.multira
         self.setNt(Nt)
         self.setranges(ranges)
         self.description = "two_cor-fwd-back-exp"
-        self.template = "m{0: f}, A1{1: f} A2{2: f}, m_b^2{3: f}, A1b{4: f} A2b{5: f}"
+        K = len(ranges) if ranges is not None else 2
+        self.template = "m{{0: f}}, {}, m_b^2{{{}: f}}, {}".format(
+            " ".join("A{0}{{{0}: f}}".format(i+1) for i in range(K)), K+1,
+            " ".join("A{}b{{{}: f}}".format(i+1, K+2+i) for i in range(K)))
         self.multi = True
 
     def formula(self, v, x):
-        ys = []
-        for i in range(len(self.ranges)):
-            r = self.ranges[i]
-            tx = np.arange(r[0], r[1]+1, self.stride)
-            ys.append( (v[1+i] * (np.exp((-1.0) * v[0] * tx)*(1.0 + v[4+i]*np.exp((-1.0)*(v[3]**2)*tx))))
-                    + (v[1+i] *(np.exp(v[0] * (tx-(self.Nt)))*(1.0 + v[4+i]*np.exp((v[3]**2) * (tx-(self.Nt))))))
-            )
-            # (v[1] * (np.exp((-1.0) * v[0] * x) + np.exp(v[0] * (x-(self.Nt)))))
-        return np.concatenate(ys)
+        tx = self.tx
+        K = len(self.ranges)
+        amp = self.per_block(v[1:K+1])
+        amp2 = self.per_block(v[K+2:2*K+2])
+        return ((amp * (np.exp((-1.0) * v[0] * tx)*(1.0 + amp2*np.exp((-1.0)*(v[K+1]**2)*tx))))
+                + (amp * (np.exp(v[0] * (tx-(self.Nt)))*(1.0 + amp2*np.exp((v[K+1]**2) * (tx-(self.Nt)))))))
 
 
 class twocor_periodic_exp(sfp.sharedmass_amp, fp.periodic, sfp.multirange):
@@ -36,13 +36,8 @@ class twocor_periodic_exp(sfp.sharedmass_amp, fp.periodic, sfp.multirange):
         self.multi = True
 
     def formula(self, v, x):
-        ys = []
-        for i in range(len(self.ranges)):
-            r = self.ranges[i]
-            tx = np.arange(r[0], r[1]+1, self.stride)
-            ys.append(v[1+i] * (np.exp((-1.0) * v[0] * tx) + np.exp(v[0] * (tx-(self.Nt)))))
-            # (v[1] * (np.exp((-1.0) * v[0] * x) + np.exp(v[0] * (x-(self.Nt)))))
-        return np.concatenate(ys)
+        tx = self.tx
+        return self.per_block(v[1:]) * (np.exp((-1.0) * v[0] * tx) + np.exp(v[0] * (tx-(self.Nt))))
 
 class twocor_antiperiodic_exp(sfp.sharedmass_amp, fp.periodic, sfp.multirange):
     individual = singlefitfunctions.periodic_exp
@@ -55,13 +50,8 @@ class twocor_antiperiodic_exp(sfp.sharedmass_amp, fp.periodic, sfp.multirange):
         self.multi = True
 
     def formula(self, v, x):
-        ys = []
-        for i in range(len(self.ranges)):
-            r = self.ranges[i]
-            tx = np.arange(r[0], r[1]+1, self.stride)
-            ys.append(v[1+i] * (np.exp((-1.0) * v[0] * tx) - np.exp(v[0] * (tx-(self.Nt)))))
-            # (v[1] * (np.exp((-1.0) * v[0] * x) + np.exp(v[0] * (x-(self.Nt)))))
-        return np.concatenate(ys)
+        tx = self.tx
+        return self.per_block(v[1:]) * (np.exp((-1.0) * v[0] * tx) - np.exp(v[0] * (tx-(self.Nt))))
 
 class twocor_antiperiodic_periodic_exp(sfp.sharedmass_amp, fp.periodic, sfp.multirange):
     individual = singlefitfunctions.periodic_exp
@@ -74,13 +64,7 @@ class twocor_antiperiodic_periodic_exp(sfp.sharedmass_amp, fp.periodic, sfp.mult
         self.multi = True
 
     def formula(self, v, x):
-        ys = []
-
-        r = self.ranges[0]
-        tx = np.arange(r[0], r[1]+1, self.stride)
-        ys.append(v[1] * (np.exp((-1.0) * v[0] * tx) - np.exp(v[0] * (tx-(self.Nt)))))
-        r = self.ranges[1]
-        tx = np.arange(r[0], r[1]+1, self.stride)
-        ys.append(v[2] * (np.exp((-1.0) * v[0] * tx) + np.exp(v[0] * (tx-(self.Nt)))))
-
-        return np.concatenate(ys)
+        # The first correlator is antiperiodic, the second periodic
+        tx = self.tx
+        sign = self.per_block([-1.0, 1.0])
+        return self.per_block(v[1:3]) * (np.exp((-1.0) * v[0] * tx) + sign*np.exp(v[0] * (tx-(self.Nt))))
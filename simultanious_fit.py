@@ -14,6 +14,7 @@ import argparse
 import os
 import math
 
+import simul_fit_parents
 from parser_fit import fitparser, functions
 from fit_parents import InvalidFit
 from copy import deepcopy
@@ -23,6 +24,8 @@ from scipy import stats
 from scipy.special import gammaincc
 from scipy.optimize import leastsq
 
+function_list = inspect.getmembers(sys.modules["simul_fitfunctions"], inspect.isclass)
+simul_functions = {name: f for name, f in function_list}
 
 
 
@@ -41,38 +44,34 @@ def consistant_argument_counts(args):
 
 
 def mergecors(cors, tmins, tmaxs):
-    configs = cors[0].configs
-    assert(all(configs == c.configs for c in cors))
+    return correlator.JointCorrelator.fromCorrelators(cors, tmins, tmaxs)
 
 
-    newdata = {}
-    dummyvev = {}
-    boundries = set()
-    for conf in configs:
-        dummyvev[conf] = 0.0
-        dataindex = 0
-        confdata = {}
-        for i in range(0,len(cors)):
-            for t in range(tmins[i], tmaxs[i]+1):
-                confdata[dataindex] = cors[i].get(config=conf, time=t)
-                dataindex +=1
-            boundries.add(dataindex-1)
-            boundries.add(dataindex)
-        newdata[conf] = confdata
+def tied_fit(model, cors, ranges, shared=("mass",), options=None, **kwargs):
+    """ Fit model to all of cors at once over their (tmin, tmax) ranges
+    with the shared parameters common to all of them. Other arguments are
+    passed to fit.fit, whose results are returned"""
+    multicor = mergecors(cors, [r[0] for r in ranges], [r[1] for r in ranges])
+    funct = simul_fit_parents.tied(model, ranges, shared=shared)
+    funct.stride = kwargs.get("tstride", 1)
+    return fit.fit(funct, multicor, min(multicor.times), max(multicor.times), options=options, **kwargs)
 
-    if cors[0].vev1 is None and cors[1].vev1 is None:
-        dummyvev = None
 
-    c = correlator.Correlator.fromDataDicts(newdata, dummyvev, dummyvev)
-    c.emass_skip_times = boundries
-    return c
+def make_function(options, ranges):
+    """ The simultaneous fit function chosen in options for ranges"""
+    if options.tie:
+        return simul_fit_parents.tied(functions[options.tie](Nt=options.period), ranges, shared=options.shared)
+    return simul_functions[options.function](Nt=options.period, ranges=ranges)
 
 
 def auto_fit(cors, options=None):
     logging.info("Finding best fit range")
     logging.debug("Temporarily setting the logger to warnings only")
 
-    individual_fitfun = functions[options.function].individual(options.period)
+    if options.tie:
+        individual_fitfun = functions[options.tie](Nt=options.period)
+    else:
+        individual_fitfun = simul_functions[options.function].individual(options.period)
 
     print cors
     ranges = []
@@ -138,7 +137,7 @@ def auto_fit(cors, options=None):
 
     # ranges = [(10,25), (10,25)]
     multicor = mergecors(cors, zip(*ranges)[0], zip(*ranges)[1])
-    funct = functions[options.function](Nt=options.period, ranges=ranges)
+    funct = make_function(options, ranges)
     fit.fit(funct, multicor, min(multicor.times), max(multicor.times),
             filestub=options.output_stub, return_chi=False, return_quality=True, options=options)
     print "done"
@@ -216,10 +215,12 @@ if __name__ == "__main__":
                         help="make the correlator symmetric")
 
 
-    function_list = inspect.getmembers(sys.modules["simul_fitfunctions"], inspect.isclass)
-    functions = {name: f for name, f in function_list}
-    parser.add_argument("-f", "--function", choices=functions.keys(),
-                           required=True, default="twocor_periodic_exp", help="function to fit to")
+    parser.add_argument("-f", "--function", choices=simul_functions.keys(),
+                           required=False, default="twocor_periodic_exp", help="function to fit to")
+    parser.add_argument("--tie", choices=functions.keys(), required=False,
+                        help="fit this single correlator function to all of the correlators at once instead")
+    parser.add_argument("--shared", nargs='+', default=["mass"],
+                        help="parameters of the --tie function common to all correlators, the rest are fit per correlator")
 
     args = parser.parse_args()
 
@@ -263,7 +264,7 @@ if __name__ == "__main__":
 
     consistant_argument_counts(args)
 
-    cors = []
+    read = []
     for i in range(len(args.inputfile)):
         corrfile = args.inputfile[i]
 
@@ -272,8 +273,15 @@ if __name__ == "__main__":
         if args.vev2:
             vev2 = args.vev2[i]
 
-        cor = build_corr.corr_and_vev_from_pickle(corrfile, vev1, vev2)
+        read.append(build_corr.corr_and_vev_from_cache(corrfile, vev1, vev2))
 
+    # The joint fit needs the same configs in every correlator, so they
+    # are all binned by the largest of their bin sizes
+    if args.auto_bin:
+        args.bin = max(cor.auto_bin_size() for cor in read)
+
+    cors = []
+    for i, cor in enumerate(read):
         if args.bin:
             cor = cor.reduce_to_bins(args.bin)
 
@@ -312,7 +320,7 @@ if __name__ == "__main__":
             multicor.symmetry = "symmetric" # hack
             multicor.period = args.period
 
-            funct = functions[args.function](Nt=args.period, ranges=zip(args.time_start, args.time_end))
+            funct = make_function(args, zip(args.time_start, args.time_end))
 
             funct.stride = args.tstride
 
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+""" Read correlator files a block of configs at a time, for files too
+large to hold in memory. Both the comma format
+
+t1,    data
+t2,    data
+
+and the paren format
+
+t1 (real,imag)
+t2 (real,imag)
+
+are read, with each config being one run of times. The Accumulator
+keeps running sums over the blocks so averages, errors and covariance
+matrices can be made without the full data.
+"""
+
+import numpy as np
+import logging
+import re
+from itertools import islice, chain
+
+paren_punctuation = re.compile(r'[(),]')
+
+
+def data_lines(f):
+    for line in f:
+        if line.strip() and not line.startswith("#"):
+            yield line
+
+
+def line_time(line, paren):
+    if paren:
+        return int(line.split(None, 1)[0])
+    return int(line.split(",", 1)[0])
+
+
+def parse_lines(lines, paren, columns):
+    """ Tokenize a list of lines at once into a (lines x columns) array"""
+    text = "".join(lines)
+    if paren:
+        text = paren_punctuation.sub(" ", text)
+    else:
+        text = text.replace(",", " ")
+    values = np.fromstring(text, sep=" ")
+    if len(values) != len(lines)*columns:
+        raise ValueError("Could not parse lines, expected {} columns".format(columns))
+    return values.reshape(len(lines), columns)
+
+
+def read_blocks(filename, configs=100, real=True):
+    """ Generator yielding (times, array) for each block of up to configs
+    configs in the file, the array is (config x time). Only one block is
+    in memory at a time.
+    """
+    logging.info("streaming data from %s in blocks of %d configs", filename, configs)
+    with open(filename) as f:
+        lines = data_lines(f)
+        head = list(islice(lines, 1))
+        if not head:
+            raise ValueError("No data in {}".format(filename))
+        paren = "(" in head[0]
+        columns = 3 if paren else len(head[0].split(","))
+
+        # Read the first config to find the times
+        first_time = line_time(head[0], paren)
+        for line in lines:
+            head.append(line)
+            if line_time(line, paren) == first_time:
+                numtimes = len(head) - 1
+                break
+        else:
+            numtimes = len(head)
+        times = None
+        lines = chain(head, lines)
+
+        while True:
+            chunk = list(islice(lines, configs*numtimes))
+            if not chunk:
+                break
+            if len(chunk) % numtimes:
+                raise ValueError("Inconsistant time counts!")
+            values = parse_lines(chunk, paren, columns).reshape(-1, numtimes, columns)
+            if times is None:
+                times = values[0, :, 0].astype(int).tolist()
+                logging.debug("streaming found %d times", numtimes)
+            if not (values[:, :, 0] == times).all():
+                raise ValueError("Inconsistant times in configs!")
+            if real or columns < 3:
+                yield times, values[:, :, 1]
+            else:
+                yield times, values[:, :, 1] + 1j*values[:, :, 2]
+
+
+class Accumulator(object):
+    """ Running sums and sums of products over configs of real
+    (config x time) blocks. The sums are taken about the mean of the first
+    block to keep them from losing precision.
+    """
+
+    def __init__(self, times):
+        self.times = list(times)
+        self.timeindex = {t: i for i, t in enumerate(self.times)}
+        self.numconfigs = 0
+        self.shift = None
+        self.sums = None
+        self.squares = None
+
+    def add(self, block):
+        if self.shift is None:
+            self.shift = block.mean(axis=0)
+            self.sums = np.zeros(len(self.times))
+            self.squares = np.zeros((len(self.times), len(self.times)))
+        deviations = block - self.shift
+        self.numconfigs += len(block)
+        self.sums += deviations.sum(axis=0)
+        self.squares += deviations.T.dot(deviations)
+
+    def cols(self, times):
+        if times is None:
+            return range(len(self.times))
+        return [self.timeindex[t] for t in times]
+
+    def sum_of_squares(self):
+        """ Sum over configs of the products of the deviations from the mean"""
+        means = self.sums / self.numconfigs
+        return self.squares - self.numconfigs*np.outer(means, means)
+
+    def average_over_configs_array(self):
+        return self.shift + self.sums / self.numconfigs
+
+    def average_sub_vev(self, vev=0.0):
+        """ The averages with the product of the vevs, vev, subtracted"""
+        return dict(zip(self.times, (self.average_over_configs_array() - vev).tolist()))
+
+    def jackknifed_errors(self):
+        """ Jackknife errors of the averages, for an average these are the
+        standard errors so are given by the sums of squares"""
+        n = float(self.numconfigs)
+        return dict(zip(self.times, np.sqrt(np.diag(self.sum_of_squares()) / (n*(n-1))).tolist()))
+
+    def covariance_matrix(self, times=None, vev=0.0):
+        """ Covariance matrix of the average over the given times, matches
+        fit.covariance_matrix for a correlator with the vev product vev"""
+        cols = self.cols(times)
+        n = float(self.numconfigs)
+        squares = self.sum_of_squares()[np.ix_(cols, cols)] + n*vev*vev
+        return squares / (n*(n-1))
+
+
+def accumulate(filename, configs=100):
+    """ Stream a file through an Accumulator """
+    acc = None
+    for times, block in read_blocks(filename, configs):
+        if acc is None:
+            acc = Accumulator(times)
+        acc.add(block)
+    logging.info("accumulated %d configs from %s", acc.numconfigs, filename)
+    return acc
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import numpy as np
+import fit
+import fitfunctions
+import batch_fit
+from fit_parents import FitContext
+
+
+class TestBatchFit(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(6)
+        self.fn = fitfunctions.periodic_two_exp(Nt=32)
+        self.x = np.arange(1, 15)
+        exact = self.fn.formula([0.3, 2.0, 0.7, 0.5], self.x)
+        self.data = exact * (1 + 0.01*np.random.randn(5, len(self.x)))
+        self.whitening = np.array([np.diag(1.0/(0.01*exact))]*5)
+
+    def test_matches_minuit(self):
+        start = [0.32, 1.9, 0.75, 0.4]
+        params, chisqr, converged = batch_fit.levenberg_marquardt(self.fn, self.x, self.data, self.whitening, start)
+        self.assertTrue(converged.all())
+        for i in range(len(self.data)):
+            context = FitContext(self.fn, self.x, self.data[i], self.whitening[i])
+            single, _, single_chisqr = fit.correlated_fit(context, start)
+            self.assertTrue(np.allclose(params[i], single, rtol=1e-3))
+            self.assertLess(chisqr[i], single_chisqr + 1e-4)
+
+    def test_flags_failures(self):
+        self.data[2, 3] = np.nan
+        _, _, converged = batch_fit.levenberg_marquardt(self.fn, self.x, self.data, self.whitening,
+                                                        [0.32, 1.9, 0.75, 0.4])
+        self.assertEqual(converged.tolist(), [True, True, False, True, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
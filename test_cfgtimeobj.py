@@ -33,6 +33,32 @@ class TestCorrelator(unittest.TestCase):
         self.assertEqual(self.cto.jackknifed_full_average()['a'], 3.0)
         self.assertEqual(self.cto.jackknifed_full_average()['b'], 2.0)
         self.assertEqual(self.cto.jackknifed_full_average()['c'], 2.5)
+    def test_array_backend(self):
+        self.assertEqual(self.cto.array.shape, (3, 2))
+        self.assertEqual(self.cto.get(time=1), {'a': 2.0, 'b': 4.0, 'c': 0.0})
+        fromarray = configtimeobj.Cfgtimeobj.fromArray(self.cto.array.copy(), self.cto.configs, self.cto.times)
+        self.assertEqual(fromarray.average_over_configs(), {0: 3.0, 1: 2.0})
+
+    def test_views_write_through(self):
+        self.cto.get(config='c')[1] = 3.0
+        self.assertEqual(self.cto.get(config='c', time=1), 3.0)
+        self.cto['a'] = {0: 2.0, 1: 2.0}
+        self.assertEqual(self.cto.sum_over_configs(), {0: 10.0, 1: 9.0})
+
+    def test_memoized_invalidation(self):
+        self.assertEqual(self.cto.sum_over_configs(), {0: 9.0, 1: 6.0})
+        self.assertIs(self.cto.sum_over_configs(), self.cto.sum_over_configs())
+        self.cto.get(time=1)['c'] = 3.0
+        self.assertEqual(self.cto.sum_over_configs(), {0: 9.0, 1: 9.0})
+        self.cto.times = [0]
+        self.assertEqual(self.cto.sum_over_configs(), {0: 9.0})
+
+    def test_restrict_times(self):
+        self.cto.times = [1]
+        self.assertEqual(self.cto.average_over_configs(), {1: 2.0})
+        self.assertEqual(self.cto.get(config='a'), {1: 2.0})
+        self.assertEqual(self.cto.get(config='a', time=0), 1.0)
+
     # def test_errorbars(self):
     #     self.assertEqual(self.cto.jackknifed_errors(), {0: math.sqrt(float(4)/float(3)), 1:  math.sqrt(float(4)/float(3)) })
 
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+import cormatrix
+import diagonalize
+import zfactor
+
+
+class TestCorrelatorMatrix(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(3)
+        self.ops = ["a", "b", "c"]
+        self.times = range(8)
+        energies = np.array([0.4, 0.7, 1.1])
+        Z = rng.normal(size=(3, 3)) + 2*np.identity(3)
+        decays = np.exp(-np.outer(self.times, energies))
+        exact = np.einsum('in,tn,jn->tij', Z, decays, Z)
+        noise = 1 + 0.02*rng.normal(size=(20, 8, 3, 3))
+        self.array = exact*noise + 1e-3j*rng.normal(size=noise.shape)
+        self.files = {"{}-{}".format(snk, src): self.array[:, :, i, j]
+                      for i, snk in enumerate(self.ops) for j, src in enumerate(self.ops)}
+
+    def reader(self, filename):
+        return self.times, ["c{}".format(c) for c in range(20)], self.files[filename]
+
+    def test_from_filewild(self):
+        cm = cormatrix.CorrelatorMatrix.fromFilewild("", "{}-{}", self.ops, reader=self.reader)
+        self.assertEqual(cm.array.shape, (20, 8, 3, 3))
+        np.testing.assert_array_equal(cm.element("b", "c"), self.array[:, :, 1, 2])
+        np.testing.assert_array_equal(cm.mean(3), self.array[:, 3].mean(0))
+
+    def test_mismatched_files(self):
+        self.files["c-a"] = self.files["c-a"][:-1]
+        self.assertRaises(ValueError, cormatrix.CorrelatorMatrix.fromFilewild,
+                          "", "{}-{}", self.ops, reader=self.reader)
+
+    def test_rotate(self):
+        cm = cormatrix.CorrelatorMatrix(self.array, self.times, range(20), self.ops)
+        V = np.random.RandomState(4).normal(size=(3, 2)) + 0.5j
+        rotated = cm.rotate(V)
+        self.assertEqual(rotated.ops, [0, 1])
+        expected = np.matrix(V).H * np.matrix(self.array[7, 5]) * np.matrix(V)
+        np.testing.assert_allclose(rotated.array[7, 5], expected)
+
+    def test_diagonalize(self):
+        cm = cormatrix.CorrelatorMatrix(self.array, self.times, range(20), self.ops)
+        diag = diagonalize.diagonalize(cm, 1, 4)
+        np.testing.assert_allclose(diag.mean(1), np.identity(3), atol=1e-10)
+        evals = np.diag(diag.mean(4)).real
+        self.assertTrue((np.diff(evals) < 0).all())
+        gen = diagonalize.diagonalize(cm, 1, 4, generalized=True)
+        np.testing.assert_allclose(np.diag(gen.mean(4)).real, evals)
+
+    def test_coeffs_file(self):
+        cm = cormatrix.CorrelatorMatrix(self.array, self.times, range(20), self.ops)
+        V, errors, rotated, rotated_errors = diagonalize.resampled_diagonalize(cm, 1, 4, jackknife=True)
+        np.testing.assert_allclose(rotated[1], np.ones(3), atol=1e-10)
+        self.assertEqual(rotated_errors.shape, (8, 3))
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, "coeffs")
+            diagonalize.write_coeffs(filename, V, errors)
+            read = zfactor.read_coeffs_file(filename)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(list(read.index[:4]), [1001, 2001, 3001, 1002])
+        np.testing.assert_allclose(read.identities.values.reshape((3, 3)).T.astype(complex), V)
+        np.testing.assert_allclose(read.error.values.reshape((3, 3)).T.astype(complex), errors)
+
+    def test_write(self):
+        cm = cormatrix.CorrelatorMatrix(self.array[:2, :3], range(3), ["c0", "c1"], self.ops)
+        directory = tempfile.mkdtemp()
+        try:
+            cm.save(os.path.join(directory, "matrix.npz"))
+            loaded = cormatrix.CorrelatorMatrix.load(os.path.join(directory, "matrix.npz"))
+            diagonalize.write_cor_matrix(cm, os.path.join(directory, "{}_{}.dat"), suffix=".full")
+            diagonalize.write_cor_matrix(cm, os.path.join(directory, "{}_{}.dat"), suffix=".ave", average=True)
+            with open(os.path.join(directory, "a_b.dat.full")) as f:
+                full = f.read().splitlines()
+            with open(os.path.join(directory, "c_c.dat.ave")) as f:
+                ave = f.read().splitlines()
+        finally:
+            shutil.rmtree(directory)
+        np.testing.assert_array_equal(loaded.array, cm.array)
+        self.assertEqual((loaded.times, loaded.configs, loaded.ops), (cm.times, cm.configs, cm.ops))
+        self.assertEqual(len(full), 7)
+        self.assertEqual(full[0], "#time,c0")
+        self.assertEqual(full[4], "0,{!r}".format(complex(cm.array[1, 0, 0, 1])))
+        self.assertEqual(ave[0], "#time,cc")
+        self.assertEqual(ave[3], "2,{!r}".format(complex(cm.array[:, 2, 2, 2].mean())))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+import corrcache
+
+
+class TestCorrcache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "cor.dat")
+        with open(self.source, 'w') as f:
+            f.write("0 (1.0,0.0)\n")
+        self.arrays = {"corr": np.arange(6.0).reshape(2, 3), "times": [0, 1, 2]}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_roundtrip(self):
+        self.assertIsNone(corrcache.load("test", [self.source]))
+        corrcache.store("test", [self.source, None], self.arrays, {"symmetry": None})
+        arrays, info = corrcache.load("test", [self.source])
+        self.assertTrue(np.array_equal(arrays["corr"], self.arrays["corr"]))
+        self.assertEqual(arrays["times"].tolist(), [0, 1, 2])
+        self.assertEqual(info, {"symmetry": None})
+        arrays["corr"][0, 0] = 10.0
+        self.assertEqual(corrcache.load("test", [self.source])[0]["corr"][0, 0], 0.0)
+
+    def test_invalidation(self):
+        corrcache.store("test", [self.source], self.arrays)
+        os.utime(self.source, (0, 0))
+        self.assertIsNotNone(corrcache.load("test", [self.source]))
+        with open(self.source, 'w') as f:
+            f.write("0 (2.0,0.0)\n")
+        self.assertIsNone(corrcache.load("test", [self.source]))
+
+
+if __name__ == '__main__':
+    unittest.main()
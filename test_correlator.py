@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import numpy as np
+import correlator
+
+
+class TestBinning(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(5)
+        N = 2000
+        rho = 0.8
+        noise = np.zeros((N, 4))
+        for i in range(1, N):
+            noise[i] = rho*noise[i-1] + np.sqrt(1 - rho**2)*np.random.randn(4)
+        self.tau = 0.5*(1 + rho)/(1 - rho)
+        self.data = np.exp(-0.3*np.arange(4)) * (1 + 0.1*noise)
+        self.vev = 0.01*np.random.randn(N)
+        self.cor = correlator.Correlator.fromArrays(self.data, self.vev, self.vev.copy())
+
+    def test_reduce_to_bins(self):
+        binned = self.cor.reduce_to_bins(8)
+        self.assertEqual(binned.numconfigs, 250)
+        self.assertTrue(np.allclose(binned.get(config=3, time=2), self.data[24:32, 2].mean()))
+        self.assertTrue(np.allclose(binned.vev1[3], self.vev[24:32].mean()))
+        errors = binned.jackknifed_errors()
+        self.assertTrue(np.allclose(self.cor.binned_errors_array(8), [errors[t] for t in binned.times]))
+
+    def test_autocorrelation_times(self):
+        taus = self.cor.autocorrelation_times()
+        for t in self.cor.times:
+            self.assertAlmostEqual(taus[t], self.tau, delta=2.0)
+
+    def test_auto_bin_size(self):
+        size = self.cor.auto_bin_size()
+        self.assertTrue(2*self.tau < size <= 100)
+        uncorrelated = correlator.Correlator.fromArrays(np.random.randn(2000, 4), None, None)
+        self.assertTrue(uncorrelated.auto_bin_size() < size)
+
+
+class TestJointCorrelator(unittest.TestCase):
+
+    def test_blocks(self):
+        cors = [correlator.Correlator.fromArrays(np.arange(20.0).reshape(4, 5) + 100*i, None, None)
+                for i in range(3)]
+        joint = correlator.JointCorrelator.fromCorrelators(cors, [0, 2, 1], [2, 4, 1])
+        self.assertEqual(joint.times, list(range(7)))
+        self.assertEqual(joint.blocks, [slice(0, 3), slice(3, 6), slice(6, 7)])
+        self.assertEqual(joint.get(config=1, time=4), 108.0)
+        self.assertEqual(joint.get(config=2, time=6), 211.0)
+        self.assertTrue(joint.array.flags['C_CONTIGUOUS'])
+
+
+if __name__ == '__main__':
+    unittest.main()
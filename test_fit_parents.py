@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import numpy as np
+import fit
+import fitfunctions
+from fit_parents import FitContext, InvalidFit
+
+
+class TestVariableProjection(unittest.TestCase):
+
+    def check_matches(self, fn, params, times):
+        np.random.seed(3)
+        exact = fn.formula(params, times)
+        data = exact * (1 + 0.01*np.random.randn(len(times)))
+        whitening = np.diag(1.0/(0.01*exact))
+        context = FitContext(fn, times, data, whitening)
+        full, full_errors, full_chisqr = fit.correlated_fit(context, params)
+        projected, errors, chisqr = fit.correlated_fit(context, params, varpro=True)
+        self.assertTrue(np.allclose(projected, full, rtol=1e-3))
+        self.assertTrue(np.allclose(errors, full_errors, rtol=0.1))
+        self.assertLess(chisqr, full_chisqr + 1e-4)
+
+    def test_single(self):
+        self.check_matches(fitfunctions.periodic_exp(Nt=32), [0.3, 2.0], np.arange(3, 15))
+
+    def test_const(self):
+        self.check_matches(fitfunctions.periodic_exp_const(Nt=32), [0.3, 2.0, 0.01], np.arange(3, 15))
+
+    def test_two_exp(self):
+        self.check_matches(fitfunctions.periodic_two_exp(Nt=32), [0.3, 2.0, 0.7, 0.5], np.arange(1, 15))
+
+    def test_zero_amplitude(self):
+        fn = fitfunctions.periodic_two_exp(Nt=32)
+        self.assertRaises(InvalidFit, fn.from_linear, [0.3, 0.7], [0.0, 1.0])
+
+
+class TestGradient(unittest.TestCase):
+
+    def test_gradient_fit(self):
+        np.random.seed(3)
+        fn = fitfunctions.periodic_exp(Nt=32)
+        times = np.arange(3, 15)
+        exact = fn.formula([0.3, 2.0], times)
+        data = exact * (1 + 0.01*np.random.randn(len(times)))
+        whitening = np.diag(1.0/(0.01*exact))
+        context = FitContext(fn, times, data, whitening)
+        full, _, full_chisqr = fit.correlated_fit(context, [0.35, 1.5])
+        params, _, chisqr = fit.correlated_fit(context, [0.35, 1.5], gradient=True)
+        self.assertTrue(np.allclose(params, full, rtol=1e-4))
+        self.assertAlmostEqual(chisqr, full_chisqr, places=4)
+
+
+class TestFitContext(unittest.TestCase):
+
+    def test_warm_start(self):
+        np.random.seed(4)
+        fn = fitfunctions.periodic_exp(Nt=32)
+        times = np.arange(3, 15)
+        exact = fn.formula([0.3, 2.0], times)
+        whitening = np.diag(1.0/(0.01*exact))
+        samples = [exact * (1 + 0.01*np.random.randn(len(times))) for _ in range(3)]
+        context = FitContext(fn, times, samples[0], whitening)
+        central, errors, _ = fit.correlated_fit(context, [0.35, 1.5])
+        context.warm_start(central, errors)
+        warm = []
+        for data in samples[1:] + samples[1:2]:
+            context.set_data(data, whitening)
+            warm.append(fit.correlated_fit(context, None))
+        self.assertEqual(warm[0], warm[2])
+        for data, (params, _, chisqr) in zip(samples[1:], warm):
+            cold, _, cold_chisqr = fit.correlated_fit(FitContext(fn, times, data, whitening), [0.35, 1.5])
+            self.assertTrue(np.allclose(params, cold, rtol=1e-4))
+            self.assertAlmostEqual(chisqr, cold_chisqr, places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
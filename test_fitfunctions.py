@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import numpy as np
+import fitfunctions
+
+
+class TestJacobians(unittest.TestCase):
+
+    def check_jacobian(self, fn, params):
+        x = np.arange(2, 20, dtype=float)
+        jac = fn.jacobian(params, x)
+        self.assertEqual(jac.shape, (len(x), len(params)))
+        for i in range(len(params)):
+            step = np.zeros(len(params))
+            step[i] = 1e-6
+            numeric = (fn.formula(params + step, x) - fn.formula(params - step, x)) / 2e-6
+            self.assertTrue(np.allclose(jac[:, i], numeric, rtol=1e-5, atol=1e-10), fn.description)
+
+    def test_single(self):
+        for f in [fitfunctions.cosh, fitfunctions.single_exp, fitfunctions.periodic_exp,
+                  fitfunctions.antiperiodic_exp, fitfunctions.periodic_exp_subtracted]:
+            self.check_jacobian(f(Nt=32), np.array([0.3, 2.0]))
+
+    def test_const(self):
+        for f in [fitfunctions.periodic_exp_const, fitfunctions.cosh_const]:
+            self.check_jacobian(f(Nt=32), np.array([0.3, 2.0, 0.01]))
+
+    def test_two_exp(self):
+        for f in [fitfunctions.two_exp, fitfunctions.periodic_two_exp,
+                  fitfunctions.periodic_two_exp_subtracted]:
+            self.check_jacobian(f(Nt=32), np.array([0.3, 2.0, 0.7, 0.5]))
+        self.check_jacobian(fitfunctions.periodic_two_exp_const(Nt=32), np.array([0.3, 2.0, 0.7, 0.5, 0.01]))
+
+
+if __name__ == '__main__':
+    unittest.main()
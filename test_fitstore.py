@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import argparse
+import tempfile
+import shutil
+import numpy as np
+import correlator
+import fitfunctions
+import fitstore
+
+
+class TestFitstore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cor = correlator.Correlator.fromArrays(np.arange(12.0).reshape(4, 3), None, None)
+        self.fn = fitfunctions.periodic_exp(Nt=32)
+        self.options = argparse.Namespace(random=3, jackknife=False, period=32)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key(self):
+        key = fitstore.fit_key(self.fn, self.cor, 2, 8, 1, 100, self.options)
+        self.assertEqual(key, fitstore.fit_key(self.fn, self.cor, 2, 8, 1, 100, self.options))
+        self.assertNotEqual(key, fitstore.fit_key(self.fn, self.cor, 3, 8, 1, 100, self.options))
+        self.options.random = 4
+        self.assertNotEqual(key, fitstore.fit_key(self.fn, self.cor, 2, 8, 1, 100, self.options))
+        self.options.random = 3
+        self.cor.get(config=1)[2] = 1.0
+        self.assertNotEqual(key, fitstore.fit_key(self.fn, self.cor, 2, 8, 1, 100, self.options))
+
+    def test_roundtrip(self):
+        self.assertIsNone(fitstore.load(self.directory, "abc"))
+        params = np.random.randn(10, 2)
+        fitstore.save(self.directory, "abc", {"params": params},
+                      {"filestubs": ["/x/fit"], "parameter_names": ["mass", "amp"],
+                       "averages": [0.3, 2.0], "errors": [0.01, 0.1]})
+        arrays, info = fitstore.load(self.directory, "abc")
+        self.assertTrue(np.array_equal(arrays["params"], params))
+        self.assertEqual(info["key"], "abc")
+        self.assertEqual(fitstore.results(info)["amp"], (2.0, 0.1))
+        self.assertEqual(len(fitstore.query(self.directory, jackknife=None)), 1)
+        self.assertEqual(fitstore.query(self.directory, jackknife=True), [])
+        self.assertEqual(fitstore.by_filestub(self.directory).keys(), ["/x/fit"])
+
+
+if __name__ == '__main__':
+    unittest.main()
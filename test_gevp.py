@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import numpy as np
+from scipy import linalg as LA
+import cormatrix
+import gevp
+
+
+class TestGEVP(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(5)
+        self.times = range(10)
+        self.Z = rng.normal(size=(3, 3)) + 2*np.identity(3)
+        energies = np.array([0.3, 0.6, 1.0])
+        decays = np.exp(-np.outer(self.times, energies))
+        exact = np.einsum('in,tn,jn->tij', self.Z, decays, self.Z)
+        noise = 1 + 0.05*rng.normal(size=(40, 1, 3, 3))
+        self.array = exact * (noise + np.swapaxes(noise, -1, -2))/2.0
+
+    def test_solve(self):
+        evals, evecs = gevp.solve(self.array, self.array[:, 1])
+        for c, t in [(0, 0), (7, 4), (39, 9)]:
+            expected = LA.eigh(self.array[c, t], b=self.array[c, 1], eigvals_only=True)
+            np.testing.assert_allclose(evals[c, t], expected)
+            v = evecs[c, t]
+            np.testing.assert_allclose(np.conj(v.T).dot(self.array[c, 1]).dot(v), np.identity(3), atol=1e-10)
+
+    def test_tracking_through_crossing(self):
+        # Two levels whose eigenvalues cross, sorting would swap them
+        lambdas = np.array([[np.exp(-0.1*t*t), np.exp(-0.35*t), np.exp(-t)] for t in self.times])
+        C = np.einsum('in,tn,jn->tij', self.Z, lambdas, self.Z)
+        evals, evecs = gevp.principal_correlators(C, 0, tref=1)
+        np.testing.assert_allclose(evals, lambdas, rtol=1e-8)
+        overlaps = np.abs(np.einsum('tin,ij,jm->tnm', np.conj(evecs), C[0], evecs[1]))
+        np.testing.assert_allclose(overlaps[2:], np.broadcast_to(np.identity(3), (8, 3, 3)), atol=1e-8)
+
+    def test_jackknife_errors(self):
+        cm = cormatrix.CorrelatorMatrix(self.array, self.times, range(40), ["a", "b", "c"])
+        evals, errors, replicas = gevp.resampled_principal_correlators(cm, 1, 3, jackknife=True)
+        self.assertEqual(replicas.shape, (40, 10, 3))
+        leftout = np.delete(self.array, 5, axis=0).mean(0)
+        expected = LA.eigh(leftout[6], b=leftout[1], eigvals_only=True)[::-1]
+        np.testing.assert_allclose(replicas[5, 6], expected)
+        n = 40.0
+        spread = np.sqrt((n-1)/n*((replicas - replicas.mean(0))**2).sum(0))
+        np.testing.assert_allclose(errors, spread)
+
+    def test_resampled_rotations(self):
+        cm = cormatrix.CorrelatorMatrix(self.array, self.times, range(40), ["a", "b", "c"])
+        evals, V, replica_evals, replicaV, _ = gevp.resampled_rotations(cm, 1, 4, jackknife=True)
+        C = cm.mean()
+        np.testing.assert_allclose(np.conj(V.T).dot(C[1]).dot(V), np.identity(3), atol=1e-10)
+        np.testing.assert_allclose(np.conj(V.T).dot(C[4]).dot(V), np.diag(evals), atol=1e-10)
+        self.assertTrue((np.diff(evals) < 0).all())
+        leftout = np.delete(self.array, 7, axis=0).mean(0)
+        v = replicaV[7]
+        np.testing.assert_allclose(np.conj(v.T).dot(leftout[4]).dot(v), np.diag(replica_evals[7]), atol=1e-10)
+        # Phases are matched to the average
+        overlaps = np.diag(np.conj(V.T).dot(leftout[1]).dot(v))
+        np.testing.assert_allclose(overlaps.imag, 0, atol=1e-12)
+        self.assertTrue((overlaps.real > 0.9).all())
+
+if __name__ == '__main__':
+    unittest.main()
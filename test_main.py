@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import tempfile
+import shutil
+import numpy as np
+import cormatrix
+import correlator
+import main
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(6)
+        self.energies = [0.4, 0.8]
+        decays = np.exp(-np.outer(range(8), self.energies))
+        array = np.einsum('tn,nm->tnm', decays, np.identity(2))*(1 + 0.01*rng.normal(size=(30, 8, 2, 2)))
+        self.matrix = cormatrix.CorrelatorMatrix(array, range(8), range(30), [0, 1])
+        self.plots = {}
+        self.plotter = main.plot.plotwitherrorbarsnames
+        main.plot.plotwitherrorbarsnames = self.record
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        main.plot.plotwitherrorbarsnames = self.plotter
+        main.args = main.cormatrix = None
+        shutil.rmtree(self.directory)
+
+    def record(self, basename, data_errors, shifts, autoscale=True, addcomment=None):
+        self.plots[basename] = data_errors.values()[0]
+
+    def test_matrix_analysis(self):
+        options = main.parser.parse_args(["-o", self.directory, "-r", "0", "-r", "1", "-dt", "1"])
+        main.setup(options, self.matrix)
+        main.main()
+        self.assertEqual(len(self.plots), 4)
+        for level, energy in enumerate(self.energies):
+            emass, _ = self.plots["{}/emass1.{}".format(self.directory, level)]
+            self.assertAlmostEqual(emass[3], energy, delta=0.01)
+
+    def test_plot_corr_without_setup(self):
+        main.args = None
+        cor = correlator.Correlator.fromArrays(self.matrix.element(1, 1).real, None, None,
+                                               times=self.matrix.times)
+        main.plot_corr(cor, self.directory + "/", "one")
+        self.assertEqual(sorted(self.plots), ["{}/{}.one".format(self.directory, p)
+                                              for p in ("correlator", "emass1", "emass3")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import numpy as np
+import newton
+
+
+class TestNewton(unittest.TestCase):
+
+    def check_solves(self, anti):
+        T = 32
+        sign = -1.0 if anti else 1.0
+        masses = np.array([[0.2], [0.5], [0.9]])
+        i = np.arange(1, 12)
+        j = i + 1
+        cor = lambda t: np.exp(-masses*t) + sign*np.exp(-masses*(T-t))
+        m, converged = newton.newton_for_m_array(i, j, cor(i)/cor(j), masses*1.1, T, anti=anti)
+        self.assertTrue(converged.all())
+        self.assertTrue(np.allclose(m, masses*np.ones(i.shape)))
+
+    def test_cosh(self):
+        self.check_solves(False)
+
+    def test_sinh(self):
+        self.check_solves(True)
+
+    def test_fallback(self):
+        m, converged = newton.newton_for_m_array([11], [13], [0.9], [0.3], 24)
+        self.assertFalse(converged[0])
+        self.assertEqual(m[0], 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
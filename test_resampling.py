@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import numpy as np
+import correlator
+import resampling
+
+
+def covariance(cor, times):
+    asv = cor.average_sub_vev()
+    b = np.array([[cor.get(config=c, time=t) - asv[t] for t in times] for c in cor.configs])
+    N = float(cor.numconfigs)
+    return b.T.dot(b) / (N * (N - 1))
+
+
+class TestResamples(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(3)
+        data = {c: {t: np.exp(-0.5*t) * (1 + 0.1*np.random.randn()) for t in range(6)} for c in range(10)}
+        vev = {c: 0.01*np.random.randn() for c in range(10)}
+        self.cor = correlator.Correlator.fromDataDicts(data, vev, dict(vev))
+        self.times = [1, 2, 4]
+
+    def check_resamples(self, straps):
+        averages = straps.averages(self.times)
+        covariances = straps.covariances(self.times)
+        for i in range(len(straps)):
+            strap = straps.correlator(i)
+            asv = strap.average_sub_vev()
+            self.assertTrue(np.allclose(averages[i], [asv[t] for t in self.times]))
+            self.assertTrue(np.allclose(covariances[i], covariance(strap, self.times)))
+
+    def test_bootstrap(self):
+        self.check_resamples(resampling.Resamples.bootstrap(self.cor, N=5))
+
+    def test_jackknife(self):
+        straps = resampling.Resamples.jackknife(self.cor)
+        self.assertEqual(len(straps), 10)
+        self.assertEqual(straps.configs(3), [0, 1, 2, 4, 5, 6, 7, 8, 9])
+        self.check_resamples(straps)
+
+    def test_jackknife_downdates(self):
+        straps = resampling.Resamples.jackknife(self.cor)
+        allcfgs = np.arange(10)
+        weighted = resampling.Resamples(self.cor, [np.delete(allcfgs, i) for i in allcfgs])
+        self.assertTrue(np.allclose(straps.averages(self.times), weighted.averages(self.times)))
+        self.assertTrue(np.allclose(straps.covariances(self.times), weighted.covariances(self.times)))
+
+    def test_single(self):
+        straps = resampling.Resamples.single(self.cor)
+        self.assertTrue(np.allclose(straps.covariances(self.times)[0], covariance(self.cor, self.times)))
+
+    def test_bootstrap_weights(self):
+        np.random.seed(7)
+        weights = resampling.bootstrap_weights(10, 5)
+        np.random.seed(7)
+        straps = resampling.Resamples.bootstrap(self.cor, N=5)
+        np.testing.assert_array_equal(weights, straps.weights)
+        np.testing.assert_array_equal(weights.sum(axis=1), np.full(5, 10.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import numpy as np
+import fitfunctions
+import simul_fit_parents
+import simul_fitfunctions
+
+
+class TestTied(unittest.TestCase):
+
+    def setUp(self):
+        self.ranges = [(3, 9), (5, 12), (4, 8)]
+        self.fn = simul_fit_parents.tied(fitfunctions.periodic_two_exp(Nt=32), self.ranges, shared=["mass", "mass2"])
+        self.params = np.array([0.3, 2.0, 3.0, 4.0, 0.7, 0.5, 0.4, 0.3])
+
+    def test_names(self):
+        self.assertEqual(self.fn.parameter_names,
+                         ["mass", "amp1", "amp2", "amp3", "mass2", "amp2_1", "amp2_2", "amp2_3"])
+        options = self.fn.minuit_options(self.params)
+        self.assertIn("limit_amp2_3", options)
+        self.assertIn("limit_mass", options)
+
+    def test_formula(self):
+        model = fitfunctions.periodic_two_exp(Nt=32)
+        joint = self.fn.formula(self.params, None)
+        start = 0
+        for i, (tmin, tmax) in enumerate(self.ranges):
+            x = np.arange(tmin, tmax+1)
+            block = model.formula(self.fn.block_params(self.params, i), x)
+            self.assertTrue(np.allclose(joint[start:start+len(x)], block))
+            start += len(x)
+
+    def test_jacobian(self):
+        jac = self.fn.jacobian(self.params, None)
+        self.assertEqual(jac.shape, (len(self.fn.tx), len(self.params)))
+        for i in range(len(self.params)):
+            step = np.zeros(len(self.params))
+            step[i] = 1e-6
+            numeric = (self.fn.formula(self.params + step, None) - self.fn.formula(self.params - step, None)) / 2e-6
+            self.assertTrue(np.allclose(jac[:, i], numeric, rtol=1e-5, atol=1e-10))
+
+
+
+class TestSharedTwiceMass(unittest.TestCase):
+
+    def test_three_correlators(self):
+        ranges = [(3, 9), (5, 12), (4, 8)]
+        fn = simul_fitfunctions.twocor_periodic_twoexp(Nt=32, ranges=ranges)
+        self.assertEqual(fn.parameter_names,
+                         ["massa", "amp1a", "amp2a", "amp3a", "massb", "amp1b", "amp2b", "amp3b"])
+        params = [0.3, 2.0, 3.0, 4.0, 0.8, 0.5, 0.4, 0.3]
+        model = fitfunctions.periodic_two_exp(Nt=32)
+        joint = fn.formula(params, None)
+        start = 0
+        for i, (tmin, tmax) in enumerate(ranges):
+            x = np.arange(tmin, tmax+1)
+            block = model.formula([params[0], params[1+i], params[4], params[5+i]], x)
+            self.assertTrue(np.allclose(joint[start:start+len(x)], block))
+            start += len(x)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+""" Test suite"""
+
+import unittest
+import tempfile
+import os
+import numpy as np
+import correlator
+import fit
+import stream_reader
+
+
+class TestStreamReader(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(5)
+        self.data = {c: {t: np.exp(-0.5*t) * (1 + 0.1*np.random.randn()) for t in range(5)} for c in range(7)}
+        self.vev = {c: 0.01*np.random.randn() for c in range(7)}
+        self.cor = correlator.Correlator.fromDataDicts(self.data, self.vev, self.vev)
+        f, self.filename = tempfile.mkstemp()
+        os.close(f)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def write(self, fmt):
+        with open(self.filename, 'w') as f:
+            for c in range(7):
+                f.write("#update number {}\n".format(c))
+                for t in range(5):
+                    f.write(fmt.format(t, self.data[c][t]))
+
+    def test_blocks(self):
+        self.write("{} ({!r},0.0)\n")
+        blocks = list(stream_reader.read_blocks(self.filename, configs=3))
+        self.assertEqual([len(b) for _, b in blocks], [3, 3, 1])
+        self.assertEqual(blocks[0][0], range(5))
+        self.assertTrue(np.array_equal(np.vstack([b for _, b in blocks]), self.cor.array))
+
+    def test_accumulate(self):
+        self.write("{},   {!r}\n")
+        acc = stream_reader.accumulate(self.filename, configs=2)
+        vev = self.cor.vev1.average() * self.cor.vev2.average()
+        asv = self.cor.average_sub_vev()
+        stream_asv = acc.average_sub_vev(vev)
+        self.assertTrue(np.allclose([stream_asv[t] for t in range(5)], [asv[t] for t in range(5)]))
+        self.assertTrue(np.allclose(acc.covariance_matrix([1, 2, 4], vev),
+                                    fit.covariance_matrix(self.cor, [1, 2, 4])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,11 +26,12 @@ class Vev(object):
         return math.fsum(self.data.values()) / float(self.numconfigs)
 
     def jackknife(self):
+        total = math.fsum(self.data.values())
         if self.numconfigs > 1:
-            return {cfg: (math.fsum(self.data.values()) - self.get(cfg)) / (self.numconfigs - 1)
+            return {cfg: (total - self.get(cfg)) / (self.numconfigs - 1)
                     for cfg in self.configs}
         else:
-            return {cfg: (math.fsum(self.data.values()) - self.get(cfg)) for cfg in self.configs}
+            return {cfg: (total - self.get(cfg)) for cfg in self.configs}
 
     def writefullfile(self, filename):
         outfile = open(filename, 'w')